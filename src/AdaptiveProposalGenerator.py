@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+
+import numpy as np
+from math import *
+from SettingsHandler import *
+from Logger import *
+
+
+# Adaptive Metropolis proposals (Haario, Saksman and Tamminen, Bernoulli
+# 7(2), 2001) in log-parameter space, wrapped around another proposal
+# generator.
+#
+# The generator sees the chain's current state in each call to
+# proposal(), so it keeps the running mean and covariance C of the log
+# states, and whether each of its proposals was accepted. For the first
+# 'Initial Steps' proposals it defers to the base generator. After that
+# it proposes
+#     log f' = log f + s L z,   L L^T = (2.38^2/d) (C + eps I),
+# with z standard normal, d the number of parameters and eps the
+# 'Regularization'. L is refactored every 'Update Interval' proposals.
+# If 'Target Acceptance' is set, the scale s is also adapted, by a
+# Robbins-Monro step on log s, to bring the acceptance rate to the
+# target.
+#
+# If the base generator has a logBounds() method giving a box (a, b) in
+# log-parameter space, proposals are reflected back into the box, which
+# keeps the random walk symmetric. Without it, components the data don't
+# constrain would drift off to zero or infinity.
+#
+# The base generator's logBounds() and logPrior(), where it has them,
+# are passed through, so that the gradient samplers see the same box and
+# prior with or without adaptation.
+#
+# Adaptation stops when the sampler calls endBurnIn(), so the chain
+# samples with a fixed proposal. As with the other generators, the
+# random walk is in log space and no Hastings correction is made for it.
+
+class AdaptiveProposalGenerator:
+    defaults = {
+        'Initial Steps' : 200,
+        'Regularization' : 1.0e-6,
+        'Update Interval' : 10,
+        'Target Acceptance' : 0.234,
+        'Verbosity' : 1
+        }
+
+    def __init__(self, baseGenerator, settings = defaults):
+        self.base = baseGenerator
+        self.settings = mergeSettings(AdaptiveProposalGenerator.defaults,
+                                      settings)
+
+        d = len(self.base.getInit())
+        self.dim = d
+        self.amScale = 2.38**2/d
+        self.logScale = 0.0
+
+        self.adapting = True
+        self.numSeen = 0
+        self.mean = np.zeros(d)
+        self.M2 = np.zeros((d, d))
+        self.L = None
+
+        self.rng = self.base.rng
+
+        self.bounds = None
+        if hasattr(self.base, 'logBounds'):
+            self.bounds = self.base.logBounds()
+            self.logBounds = self.base.logBounds
+        if hasattr(self.base, 'logPrior'):
+            self.logPrior = self.base.logPrior
+
+        self.lastProposal = None
+        self.numProposed = 0
+        self.numAccepted = 0
+
+    def getInit(self):
+        return self.base.getInit()
+
+    # The base generator shares this generator's stream
+    def setRNG(self, rng):
+        self.rng = rng
+        self.base.setRNG(rng)
+
+    def proposal(self, fParams):
+
+        fParams = np.asarray(fParams, dtype=float)
+        if self.lastProposal is not None:
+            self.numProposed += 1
+            accepted = np.array_equal(fParams, self.lastProposal)
+            if accepted:
+                self.numAccepted += 1
+            if self.adapting:
+                self.adaptScale(accepted)
+
+        if self.adapting:
+            self.addToHistory(np.log(fParams))
+
+        if self.L is None:
+            fNew = self.base.proposal(fParams)
+        else:
+            z = self.rng.standard_normal(self.dim)
+            logf = np.log(fParams) + exp(self.logScale)*(self.L @ z)
+            fNew = np.exp(self.reflect(logf))
+
+        self.lastProposal = np.copy(fNew)
+        return fNew
+
+    # Fold log-parameters back into the bounding box, if there is one
+    def reflect(self, logf):
+        if self.bounds is None:
+            return logf
+        a, b = self.bounds
+        h = b - a
+        t = np.mod(logf - a, 2.0*h)
+        return a + np.where(t > h, 2.0*h - t, t)
+
+    # Welford update of the mean and covariance of the log states, and
+    # refactorization of the proposal covariance when it's due
+    def addToHistory(self, logf):
+
+        self.numSeen += 1
+        delta = logf - self.mean
+        self.mean += delta/self.numSeen
+        self.M2 += np.outer(delta, logf - self.mean)
+
+        n = self.numSeen
+        if (n >= self.settings['Initial Steps']
+            and n % self.settings['Update Interval'] == 0):
+            self.factor()
+
+    def factor(self):
+        C = self.M2/(self.numSeen - 1)
+        eps = self.settings['Regularization']
+        self.L = np.linalg.cholesky(self.amScale*(C + eps*np.eye(self.dim)))
+
+    def adaptScale(self, accepted):
+        target = self.settings['Target Acceptance']
+        if target is None or self.L is None:
+            return
+        gain = 1.0/sqrt(self.numProposed)
+        self.logScale += gain*((1.0 if accepted else 0.0) - target)
+
+    # Adaptation state, for sampler checkpoints
+    def checkpointState(self):
+        return {
+            'Adapting' : self.adapting,
+            'Num Seen' : self.numSeen,
+            'Mean' : np.copy(self.mean),
+            'M2' : np.copy(self.M2),
+            'L' : None if self.L is None else np.copy(self.L),
+            'Log Scale' : self.logScale,
+            'Last Proposal' : self.lastProposal,
+            'Counts' : (self.numProposed, self.numAccepted)
+            }
+
+    def restoreState(self, state):
+        self.adapting = state['Adapting']
+        self.numSeen = state['Num Seen']
+        self.mean = np.copy(state['Mean'])
+        self.M2 = np.copy(state['M2'])
+        self.L = state['L']
+        self.logScale = state['Log Scale']
+        self.lastProposal = state['Last Proposal']
+        self.numProposed, self.numAccepted = state['Counts']
+
+    def acceptanceRate(self):
+        return self.numAccepted/max(self.numProposed, 1)
+
+    # Freeze the proposal at the end of burn-in
+    def endBurnIn(self):
+        if self.L is None and self.numSeen > 1:
+            self.factor()
+        self.adapting = False
+        if self.settings['Verbosity'] > 0:
+            Logger.write('Adaptive proposal frozen after %d proposals: '
+                         'acceptance rate %g, scale %g'
+                         % (self.numProposed, self.acceptanceRate(),
+                            exp(self.logScale)))
+        self.numProposed = 0
+        self.numAccepted = 0
+
+    def report(self):
+        if self.settings['Verbosity'] > 0:
+            Logger.write('Adaptive proposal acceptance rate since burn-in: %g'
+                         % self.acceptanceRate())
@@ -1,16 +1,47 @@
 from mpi4py import MPI
 from collections import deque
+from TaskManifest import *
 import logging
+import time
 
 
 class Boss:
 
+    # Each worker is kept tasksPerWorker tasks ahead, so that it has its
+    # next task queued locally when it finishes one. While waiting for
+    # replies the boss polls with testany, sleeping between polls for
+    # times that double up to maxPollInterval seconds and start again
+    # from minPollInterval after each reply. With maxPollInterval None and
+    # no timeout it blocks in waitany instead; many MPI implementations
+    # spin inside waitany, so polling keeps rank 0 from using a whole core.
+    #
+    # Failures: a task that raises on the worker comes back as an error
+    # and is retried up to maxRetries times. If a worker spends more than
+    # timeout seconds on a task, it is taken to be hung or lost: it gets
+    # no more tasks, and the tasks it holds go to the others. A late
+    # result from it is still used if the task hasn't been done since; a
+    # late error is ignored, as the task has already been retried.
+    # Tasks that run out of retries are listed in failedTasks after
+    # loop(), with their errors, and never reach the analyzer.
+    #
+    # If manifest names a file, each finished task's arg and result are
+    # recorded there. Tasks already in it are not run again; their
+    # recorded results go to the analyzer at the start of loop().
     def __init__(self, taskInputs, analyzer, comm=MPI.COMM_WORLD,
-            logLevel=logging.INFO):
+            logLevel=logging.INFO, tasksPerWorker=2,
+            minPollInterval=0.001, maxPollInterval=0.05,
+            timeout=None, maxRetries=2, manifest=None):
 
         self.comm = comm
         self.taskArgList = taskInputs
         self.analyzer = analyzer
+        self.tasksPerWorker = tasksPerWorker
+        self.minPollInterval = minPollInterval
+        self.maxPollInterval = maxPollInterval
+        self.timeout = timeout
+        self.maxRetries = maxRetries
+        self.manifestName = manifest
+        self.failedTasks = []
         logging.basicConfig(format='[Boss] %(message)s',
             level=logLevel)
 
@@ -20,64 +51,186 @@ class Boss:
         comm = self.comm
         rank = comm.Get_rank()
         nProcs = comm.Get_size()
-
-        # Form a queue of the arguments to be sent
-        taskQ = deque(self.taskArgList)
-
-        # Form a queue of the available worker processors
-        availableWorkers = deque(range(1,nProcs))
-
-        # Set up arrays in which to store information about pending
-        # messages from the workers
-        pendingReplies = []
-        replySources = []
-
-        # Main loop: continue until all task queue is empty and
-        # all pending responses have been processed.
-        while len(taskQ) > 0 or len(pendingReplies)>0:
-
-            # If a worker is available, send it a task
-            if len(availableWorkers) > 0 and len(taskQ)>0:
-                workerRank = availableWorkers.popleft()
-                taskArg = taskQ.popleft()
-
-                # Send the task request
-                logging.debug('sending args {} to worker {}'
-                    .format(taskArg, workerRank))
-                comm.isend( ('TASK', taskArg), dest=workerRank, tag=1)
-
-                # Open a receiver for the results
-                reply = comm.irecv(source=workerRank, tag=2)
-                pendingReplies.append(reply)
-                replySources.append(workerRank)
-
-            # Check for replies from busy workers
-            (index, hasResult, result) = MPI.Request.testany(pendingReplies)
-            if hasResult:
-                # Look up who sent the reply
-                reply = pendingReplies[index]
-                workerRank = replySources[index]
-                logging.debug('got msg=[{}] from worker [{}]'
-                    .format(result, workerRank))
-
+        if nProcs < 2 and len(self.taskArgList) > 0:
+            raise RuntimeError('Boss needs at least one worker process')
+
+        # Tasks are known by their index in the list of args. Pass the
+        # results of tasks done in an earlier run straight on.
+        args = list(self.taskArgList)
+        manifest = None
+        if self.manifestName is not None:
+            manifest = TaskManifest(self.manifestName)
+        done = [False]*len(args)
+        if manifest is not None:
+            for taskId, arg in enumerate(args):
+                if manifest.isDone(arg):
+                    self.analyzer.acceptResult(manifest.result(arg))
+                    done[taskId] = True
+            logging.info('{} of {} tasks done in an earlier run'
+                .format(sum(done), len(args)))
+
+        # Form a queue of the tasks to be sent
+        taskQ = deque(i for i in range(len(args)) if not done[i])
+        attempts = [0]*len(args)
+
+        # Tasks each live worker holds, in the order it will do them, and
+        # when it started the first of them
+        held = {p : deque() for p in range(1,nProcs)}
+        started = {}
+
+        # One receive is kept open for each worker, including lost ones,
+        # so that late replies are still picked up
+        workers = list(range(1,nProcs))
+        pendingReplies = [comm.irecv(source=p, tag=2) for p in workers]
+
+        # Send requests not known to be complete yet
+        self.sends = []
+        self.failedTasks = []
+
+        # Main loop: continue until no task is queued or held by a
+        # worker, so every one is done or has failed
+        while len(taskQ) > 0 or any(len(h) > 0 for h in held.values()):
+
+            if len(held) == 0:
+                logging.error('All workers lost with {} tasks left'
+                    .format(len(taskQ)))
+                break
+
+            # Top up each worker's tasks, a round at a time so that the
+            # first tasks are spread over the workers
+            for depth in range(self.tasksPerWorker):
+                for workerRank in held:
+                    if len(taskQ)==0:
+                        break
+                    if len(held[workerRank]) > depth:
+                        continue
+                    taskId = taskQ.popleft()
+                    if done[taskId]:
+                        continue
+
+                    # Send the task request
+                    logging.debug('sending args {} to worker {}'
+                        .format(args[taskId], workerRank))
+                    self.send(('TASK', taskId, args[taskId]), workerRank)
+                    if len(held[workerRank]) == 0:
+                        started[workerRank] = time.monotonic()
+                    held[workerRank].append(taskId)
+
+            # Wait for a reply from a busy worker, or a timeout
+            reply = self.waitForReply(pendingReplies,
+                                      self.deadline(held, started))
+            if reply is None:
+                self.dropLateWorkers(held, started, attempts, taskQ)
+                continue
+            index, msg = reply
+            workerRank = workers[index]
+            pendingReplies[index] = comm.irecv(source=workerRank, tag=2)
+            logging.debug('got msg=[{}] from worker [{}]'
+                .format(msg, workerRank))
+
+            kind, taskId, result = msg
+            fromLive = workerRank in held and taskId in held[workerRank]
+            if fromLive:
+                held[workerRank].remove(taskId)
+                started[workerRank] = time.monotonic()
+
+            if done[taskId]:
+                # Already done by another worker after this one timed out
+                pass
+            elif kind=='RESULT':
                 # Send the result to the analyzer
+                done[taskId] = True
+                if manifest is not None:
+                    manifest.record(args[taskId], result)
                 self.analyzer.acceptResult(result)
+            elif not fromLive:
+                # The task was requeued when this worker timed out
+                logging.debug('ignoring late failure of task {} on lost '
+                    'worker [{}]'.format(args[taskId], workerRank))
+            else:
+                logging.warning('task {} failed on worker [{}]:\n{}'
+                    .format(args[taskId], workerRank, result))
+                self.retry(taskId, result, attempts, taskQ)
 
-                # Clear the reply out of the pending list
-                pendingReplies.remove(reply)
-                replySources.remove(workerRank)
-
-                # Mark the worker processor as available again
-                logging.debug('Putting worker [{}] back on queue'
-                    .format(workerRank))
-                if len(taskQ)>0:
-                    availableWorkers.append(workerRank)
+            self.freeCompletedSends()
 
         # End of main loop, all tasks finished. Send shutdown messages
-        # to all workers
-        for p in range(1,nProcs):
+        # to all workers, so that a lost one that was only slow stops once
+        # it has worked through its queue. Only the sends to live workers
+        # are waited on, as a hung one may never take its message.
+        for p in workers:
             logging.debug('Sending shutdown message to worker [{}]'.format(p))
-            comm.isend( ('DONE',), dest=p, tag=1)
+            self.send(('DONE',), p)
+        MPI.Request.Waitall([s for dest, s in self.sends if dest in held])
+        self.sends = []
+        for reply in pendingReplies:
+            reply.Cancel()
+        lost = [p for p in workers if p not in held]
+        if len(lost) > 0:
+            logging.warning('Lost workers: {}'.format(lost))
+        if manifest is not None:
+            manifest.close()
+        self.failedTasks = [(args[i], err) for i, err in self.failedTasks]
 
         # All done!
         logging.debug('Boss shutting down')
+
+    # Put a task that failed back on the queue, unless it has had all
+    # its tries
+    def retry(self, taskId, error, attempts, taskQ):
+
+        attempts[taskId] += 1
+        if attempts[taskId] > self.maxRetries:
+            logging.error('giving up on task {} after {} tries'
+                .format(self.taskArgList[taskId], attempts[taskId]))
+            self.failedTasks.append((taskId, error))
+        else:
+            taskQ.append(taskId)
+
+    # Time by which the next reply is due, or None
+    def deadline(self, held, started):
+        busy = [started[p] for p in held if len(held[p]) > 0]
+        if self.timeout is None or len(busy) == 0:
+            return None
+        return min(busy) + self.timeout
+
+    # Stop using the workers whose current task has timed out, and hand
+    # their tasks to the others
+    def dropLateWorkers(self, held, started, attempts, taskQ):
+
+        now = time.monotonic()
+        for p in list(held):
+            if len(held[p]) == 0 or now - started[p] < self.timeout:
+                continue
+            logging.warning('worker [{}] timed out; reassigning {} tasks'
+                .format(p, len(held[p])))
+            taskIds = held.pop(p)
+            del started[p]
+            self.retry(taskIds.popleft(), 'Timed out', attempts, taskQ)
+            taskQ.extendleft(reversed(taskIds))
+
+    # Send a message to a worker without blocking, keeping the request
+    # so it can be freed once complete
+    def send(self, msg, dest):
+        self.sends.append((dest, self.comm.isend(msg, dest=dest, tag=1)))
+
+    def freeCompletedSends(self):
+        self.sends = [(dest, s) for dest, s in self.sends if not s.Test()]
+
+    # Index in pendingReplies of a completed reply and its contents, or
+    # None if nothing has come by the deadline
+    def waitForReply(self, pendingReplies, deadline=None):
+
+        if self.maxPollInterval is None and deadline is None:
+            return MPI.Request.waitany(pendingReplies)
+
+        pause = self.minPollInterval
+        while True:
+            (index, hasResult, result) = MPI.Request.testany(pendingReplies)
+            if hasResult:
+                return index, result
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(pause)
+            if self.maxPollInterval is not None:
+                pause = min(2*pause, self.maxPollInterval)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+# Convergence and efficiency diagnostics for MCMC chains
+
+
+# Split R-hat (Gelman et al., Bayesian Data Analysis, 3rd ed.) for draws
+# of shape (numChains, numDraws, ...). Each chain is split in half and
+# the between-half variance compared to the within-half variance; values
+# near 1 mean the chains agree. Returns one value per component.
+def splitRHat(chains):
+
+    chains = np.asarray(chains, dtype=float)
+    n = chains.shape[1]
+    half = n//2
+    if half < 2:
+        return np.full(chains.shape[2:], np.nan)
+
+    halves = np.concatenate((chains[:,:half], chains[:,n-half:]), axis=0)
+    means = np.mean(halves, axis=1)
+    W = np.mean(np.var(halves, axis=1, ddof=1), axis=0)
+    B = half*np.var(means, axis=0, ddof=1)
+    varPlus = (half - 1.0)/half*W + B/half
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.sqrt(varPlus/W)
+
+
+# Effective sample size of the draws x, of shape (numDraws, ...), from
+# their autocorrelations, summed as in Geyer's initial positive sequence
+# estimator (Statistical Science 7(4), 1992). Returns one value per
+# component.
+def effectiveSampleSize(x):
+
+    x = np.asarray(x, dtype=float)
+    n = x.shape[0]
+    flat = x.reshape(n, -1)
+    if n < 4:
+        return np.full(x.shape[1:], np.nan)
+
+    # Autocorrelations from the FFT, padded to avoid wraparound
+    dev = flat - np.mean(flat, axis=0)
+    nfft = 1 << (2*n - 1).bit_length()
+    spec = np.fft.rfft(dev, nfft, axis=0)
+    acov = np.fft.irfft(spec*np.conj(spec), nfft, axis=0)[:n]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rho = acov/acov[0]
+
+    ess = np.empty(flat.shape[1])
+    for c in range(flat.shape[1]):
+        if not np.isfinite(rho[0,c]):
+            ess[c] = np.nan
+            continue
+        tau = -1.0
+        for k in range(0, n - 1, 2):
+            pairSum = rho[k,c] + rho[k+1,c]
+            if pairSum <= 0.0:
+                break
+            tau += 2.0*pairSum
+        ess[c] = n/tau
+    return ess.reshape(x.shape[1:])
@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+
+import os
+import pickle
+
+# Checkpoint files for sampler runs. A checkpoint is a dict of numpy
+# arrays, numbers and nested dicts, pickled to a binary file. The file is
+# written under a temporary name and then renamed, so a run killed while
+# writing leaves the previous checkpoint intact.
+
+checkpointVersion = 1
+
+def writeCheckpoint(filename, state):
+
+    rtn = dict(state)
+    rtn['Checkpoint Version'] = checkpointVersion
+    tmpName = filename + '.tmp'
+    with open(tmpName, 'wb') as f:
+        pickle.dump(rtn, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmpName, filename)
+
+
+def readCheckpoint(filename):
+
+    with open(filename, 'rb') as f:
+        state = pickle.load(f)
+    version = state.get('Checkpoint Version')
+    if version != checkpointVersion:
+        raise RuntimeError('Checkpoint %s has version %s, expected %d'
+                           % (filename, version, checkpointVersion))
+    return state
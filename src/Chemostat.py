@@ -2,9 +2,12 @@
 
 from StepDoublingDriver import *
 from TimestepOutputManager import *
+from ConvergenceMonitor import *
+from SettingsHandler import *
 from math import *
 from ResponseFunction import *
 import numpy as np
+import scipy.optimize
 import matplotlib.pyplot as plt
 
 
@@ -41,17 +44,116 @@ class Chemostat:
 
         return np.array([fx,fy,fz])
 
+    def fPrime(self, x):
+        return self.vMax*self.k/(self.k + x)**2
 
-    def run(self, driver, nReport, tInit, tFinal, u0):
+    # Jacobian of the RHS at the state u
+    def jacobian(self, u):
+        x = u[0]
+        y = u[1]
+        z = u[2]
+        D = self.D
+        e1 = self.e1
+        e2 = self.e2
 
-        outMgr = NPStorageOutputManager([tInit, tFinal], u0, nReport)
+        fOfX = self.f(x)
+        dfOfX = self.fPrime(x)
+        gOfY, dgOfY, d2gOfY = self.g.evalDerivs(y)
+
+        return np.array([
+            [-D - dfOfX*y, -fOfX, 0.0],
+            [e1*dfOfX*y, e1*fOfX - dgOfY*z - D, -gOfY],
+            [0.0, e2*dgOfY*z, e2*gOfY - D]
+            ])
+
+    # Given the prey density y at an equilibrium, find the nutrient
+    # level x from D*(Xin - x) = f(x)*y. This is the positive root of a
+    # quadratic in x.
+    def equilibriumNutrient(self, y):
+        D = self.D
+        k = self.k
+        Xin = self.Xin
+        b = D*k + self.vMax*y - D*Xin
+        return (-b + sqrt(b*b + 4.0*D*D*Xin*k))/(2.0*D)
+
+    # Find the interior (z > 0) equilibria. At such a point the z equation
+    # forces g(y) = D/e2, so the roots of that equation are located by
+    # scanning g over the range of feasible y (total biomass is
+    # asymptotically bounded by Xin, so y < e1*Xin) and refining each sign
+    # change. Tangential roots and pairs of roots between scan points are
+    # not detected.
+    def interiorEquilibria(self, nScan=256):
+        D = self.D
+        e1 = self.e1
+        e2 = self.e2
+        gTarget = D/e2
+
+        def resid(y):
+            return self.g.eval(y) - gTarget
+
+        yScan = np.linspace(0.0, e1*self.Xin, nScan+1)[1:]
+        r = np.array([resid(y) for y in yScan])
+
+        rtn = []
+        negative = r < 0.0
+        for i in np.nonzero(negative[:-1] != negative[1:])[0]:
+            yStar = scipy.optimize.brentq(resid, yScan[i], yScan[i+1])
+            xStar = self.equilibriumNutrient(yStar)
+            growth = e1*self.f(xStar) - D
+            if growth <= 0.0:
+                continue # predator would need negative density
+            zStar = e2*growth*yStar/D
+            rtn.append(np.array([xStar, yStar, zStar]))
+
+        return rtn
+
+    # Find the equilibrium with no predator: the prey-only equilibrium
+    # if the prey can survive at dilution rate D, otherwise washout.
+    def boundaryEquilibrium(self):
+        D = self.D
+        e1 = self.e1
+        if e1*self.vMax > D:
+            x = D*self.k/(e1*self.vMax - D)
+            if x < self.Xin:
+                return np.array([x, e1*(self.Xin - x), 0.0])
+        return np.array([self.Xin, 0.0, 0.0])
+
+
+    # True if all eigenvalues of the Jacobian at u have negative real part
+    def isStable(self, u):
+        return np.amax(np.real(np.linalg.eigvals(self.jacobian(u)))) < 0.0
+
+    # Run the model, returning the stored trajectory. If earlyStop
+    # settings are given, the run stops as soon as the convergence monitor
+    # can tell whether it's going to a limit point or a limit cycle, and
+    # only the part of the trajectory stored up to then is returned. The
+    # time and reason for stopping are kept in stopTime and stopReason.
+    # Otherwise, if tail window settings are given, only the last
+    # 'Window Size' stored points are kept and returned.
+    def run(self, driver, nReport, tInit, tFinal, u0, earlyStop=None,
+            tail=None):
+
+        if earlyStop is None and tail is None:
+            outMgr = NPStorageOutputManager([tInit, tFinal], u0, nReport)
+        elif earlyStop is None:
+            tail = mergeSettings(tailWindowDefaults, tail)
+            outMgr = RingBufferOutputManager([tInit, tFinal], u0, nReport,
+                                             tail['Window Size'],
+                                             tail['Start Time'])
+        else:
+            outMgr = ConvergenceMonitorOutputManager([tInit, tFinal], u0,
+                                                     nReport, self.isStable,
+                                                     earlyStop)
 
         def f(y, t):
             return self.RHS(y)
 
         stat = driver.runStepper(f, [tInit, tFinal], u0,  outMgr)
 
-        return outMgr.uStore
+        self.stopTime = getattr(outMgr, 'stopTime', None)
+        self.stopReason = getattr(outMgr, 'stopReason', None)
+
+        return outMgr.storedValues()
 
 def goingToLimitPoint(U, nCheck, tol):
 
@@ -121,9 +223,9 @@ if __name__=='__main__':
     mi = IvlevModel()
     mt = TanhModel()
     f = 1.225
-    rh = f*np.array([mh.eval(xi) for xi in x])
-    ri = f*np.array([mi.eval(xi) for xi in x])
-    rt = f*np.array([mt.eval(xi) for xi in x])
+    rh = f*mh.eval(x)
+    ri = f*mi.eval(x)
+    rt = f*mt.eval(x)
 
     csv = np.genfromtxt('../ExperimentalData/FloraEtAl2011.csv', delimiter=",")
     xDat = csv[:,0]
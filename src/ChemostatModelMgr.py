@@ -1,7 +1,52 @@
 
 import numpy as np
 from MHModelManagerBase import *
+from Logger import *
 from Chemostat import *
+from EmbeddedRKDriver import *
+from EnsembleChemostat import *
+from SplineResponseFunction import *
+from EquilibriumClassifier import *
+
+
+# Build a timestepping driver from a 'Stepper Control' settings block.
+# The optional 'Method' key selects the stepper; everything else is
+# passed through to the driver. The step-doubling methods are kept
+# for reproducing older runs; the embedded pairs are much cheaper.
+# Chemostat populations can't go negative, so the embedded drivers are
+# told to reject steps that would cross zero.
+def makeDriver(stepperControl):
+
+    driverSettings = dict(stepperControl)
+    method = driverSettings.pop('Method', 'Heun')
+    embeddedSettings = dict(driverSettings)
+    embeddedSettings.setdefault('Nonnegative', True)
+
+    if method=='Heun':
+        return StepDoublingDriver(HeunStepper(), driverSettings)
+    elif method=='RK4':
+        return StepDoublingDriver(RK4Stepper(), driverSettings)
+    elif method=='BS32':
+        return EmbeddedRKDriver(BogackiShampineStepper(), embeddedSettings)
+    elif method=='DP54':
+        return EmbeddedRKDriver(DormandPrinceStepper(), embeddedSettings)
+    elif method=='Tsit54':
+        return EmbeddedRKDriver(TsitourasStepper(), embeddedSettings)
+    else:
+        raise RuntimeError('Unimplemented stepper method %s' % method)
+
+
+# Build an ensemble driver from a 'Stepper Control' settings block. Only
+# the embedded pairs can be used for ensemble runs.
+def makeEnsembleDriver(stepperControl):
+
+    driver = makeDriver(stepperControl)
+    if not isinstance(driver, EmbeddedRKDriver):
+        raise RuntimeError('Ensemble runs need an embedded stepper method '
+                           '(BS32, DP54 or Tsit54), got %s'
+                           % driver.stepper.name)
+    return EnsembleRKDriver(driver.stepper, driver.settings)
+
 
 class ChemostatModelMgr(MHModelManagerBase):
 
@@ -12,29 +57,221 @@ class ChemostatModelMgr(MHModelManagerBase):
         self.responseData = responseData
         self.runSettings = runSettings
         self.chemostat = Chemostat(self.responseFunc, D)
+        self.driver = makeDriver(self.runSettings['Stepper Control'])
+        self.ensembleDriver = None
+
+        # Optional fast path: classify from the equilibria and only
+        # integrate when that's ambiguous
+        self.classifier = None
+        classifierSettings = self.runSettings.get('Equilibrium Classifier')
+        if classifierSettings is not None:
+            self.classifier = EquilibriumClassifier(classifierSettings)
+
+        # Optional early stopping of integrations once they've settled
+        self.earlyStop = self.runSettings.get('Early Stopping')
+        self.resetEarlyStopStats()
+
+        # Optionally keep only the tail of each trajectory
+        self.tail = self.runSettings.get('Tail Window')
+        if self.tail is not None and self.earlyStop is not None:
+            raise RuntimeError('Early Stopping and Tail Window settings '
+                               'can\'t be used together')
+
+    # Change the dilution rate, so the model manager can be reused for a
+    # run at another D. The early stopping counts start again.
+    def setD(self, D):
+        self.chemostat.D = D
+        self.resetEarlyStopStats()
 
     # Return name of model
     def name(self):
         return self.responseFunc.name()
 
-    # Compute likelihood of model for a given parameter set
-    def likelihood(self, params):
+    # Compute the log-likelihood of the model for a given parameter set.
+    # If the response function is linear in its parameters this is a
+    # single matrix-vector product, and the response function isn't
+    # touched.
+    def loglikelihood(self, params):
+        if self.responseData.isLinear(self.responseFunc):
+            return self.responseData.loglikelihoodForParams(
+                self.responseFunc, params)
         self.responseFunc.setParams(params)
-        return self.responseData.likelihood(self.responseFunc)
+        return self.responseData.loglikelihood(self.responseFunc)
+
+    # Compute log-likelihoods for each row of a block of parameters
+    def loglikelihoodBlock(self, paramBlock):
+        if self.responseData.isLinear(self.responseFunc):
+            return self.responseData.loglikelihoodForParams(
+                self.responseFunc, paramBlock)
+        return MHModelManagerBase.loglikelihoodBlock(self, paramBlock)
+
+    # The gradient is available when the response function is linear in
+    # its parameters
+    def hasGradient(self):
+        return self.responseData.isLinear(self.responseFunc)
 
+    # Log-likelihood and its gradient with respect to the parameters
+    def loglikelihoodGradient(self, params):
+        if not self.hasGradient():
+            raise RuntimeError('No log-likelihood gradient for response '
+                               'function %s' % self.name())
+        return self.responseData.loglikelihoodGradientForParams(
+            self.responseFunc, params)
 
     # Run a model with the specified parameters. This should return
     # whatever information is needed to compute this run's
-    # contribution to the integral
+    # contribution to the integral. With the equilibrium classifier on,
+    # this is an EquilibriumResult; otherwise it's the stored trajectory.
     def run(self, params):
 
+        self.responseFunc.setParams(params)
+
+        if self.classifier is None:
+            return self.integrate()
+
+        label = self.classifier.classify(self.chemostat)
+        if label is not None and not self.classifier.checkThisOne():
+            return EquilibriumResult(label)
+        return EquilibriumResult(label, self.integrate())
+
+    # Integrate the chemostat with the current response function
+    def integrate(self):
+
+        tInit = 0.0
+        tFinal = self.runSettings["Integration Time"]
+        nReport = self.runSettings["Num to Store"]
+        uInit = self.runSettings["Initial Value"]
+
+        U = self.chemostat.run(self.driver, nReport, tInit, tFinal, uInit,
+                               self.earlyStop, self.tail)
+        self.recordStop(self.chemostat.stopReason, self.chemostat.stopTime)
+        return U
+
+    # Run the model for each row of a block of parameters, integrating
+    # all of them together. Returns an array of shape
+    # (numParams, nReport+1, 3) whose rows are the results run() would
+    # have returned for each parameter set, or with the equilibrium
+    # classifier on, a list of EquilibriumResults in which only the
+    # ambiguous and spot-checked samples have been integrated.
+    def runBlock(self, paramBlock):
+
+        if self.classifier is None:
+            return self.integrateBlock(paramBlock)
+
+        paramBlock = np.array(paramBlock)
+        results = []
+        toRun = []
+        for i, params in enumerate(paramBlock):
+            self.responseFunc.setParams(params)
+            label = self.classifier.classify(self.chemostat)
+            results.append(EquilibriumResult(label))
+            if label is None or self.classifier.checkThisOne():
+                toRun.append(i)
+
+        if len(toRun) > 0:
+            U = self.integrateBlock(paramBlock[toRun])
+            for i, Ui in zip(toRun, U):
+                results[i].U = Ui
+
+        return results
+
+    # Run the model for each row of a block of parameters at each of
+    # several dilution rates. The setup for each sample (spline solve,
+    # response function parameters) is done once and shared across D.
+    # Returns a list with one entry per D, each a list of per-sample
+    # results like those from runBlock().
+    def runBlockForD(self, paramBlock, DVals):
+
+        paramBlock = np.array(paramBlock)
+        M = len(paramBlock)
+        ensResp = self.makeEnsembleResponse(paramBlock)
+
+        if self.classifier is None:
+            return [list(self.integrateEnsemble(ensResp, D)) for D in DVals]
+
+        results = [[None]*M for D in DVals]
+        toRun = [[] for D in DVals]
+        DSave = self.chemostat.D
+        for i, params in enumerate(paramBlock):
+            self.responseFunc.setParams(params)
+            for j, D in enumerate(DVals):
+                self.chemostat.D = D
+                label = self.classifier.classify(self.chemostat)
+                results[j][i] = EquilibriumResult(label)
+                if label is None or self.classifier.checkThisOne():
+                    toRun[j].append(i)
+        self.chemostat.D = DSave
+
+        for j, D in enumerate(DVals):
+            if len(toRun[j]) > 0:
+                U = self.integrateEnsemble(ensResp.subset(toRun[j]), D)
+                for i, Ui in zip(toRun[j], U):
+                    results[j][i].U = Ui
+
+        return results
+
+    # Integrate the chemostat for each row of a block of parameters
+    def integrateBlock(self, paramBlock):
+        return self.integrateEnsemble(self.makeEnsembleResponse(paramBlock),
+                                      self.chemostat.D)
+
+    # Set up an ensemble response function for a block of parameters
+    def makeEnsembleResponse(self, paramBlock):
+        rFunc = self.responseFunc
+        if isinstance(rFunc, SplineResponseFunction):
+            return SplineEnsembleResponse(rFunc.xMax, rFunc.nx, paramBlock)
+        return ListEnsembleResponse([type(rFunc)(list(p))
+                                     for p in paramBlock])
+
+    # Integrate the chemostat at dilution rate D for each member of an
+    # ensemble response function
+    def integrateEnsemble(self, ensResp, D):
+
         tInit = 0.0
         tFinal = self.runSettings["Integration Time"]
         nReport = self.runSettings["Num to Store"]
         uInit = self.runSettings["Initial Value"]
 
-        stepperControl = self.runSettings['Stepper Control']
+        if self.ensembleDriver is None:
+            self.ensembleDriver = makeEnsembleDriver(
+                self.runSettings['Stepper Control'])
+
+        ensemble = EnsembleChemostat(ensResp, D)
+
+        U = ensemble.run(self.ensembleDriver, nReport, tInit, tFinal, uInit,
+                         self.earlyStop, self.tail)
+        for reason, t in zip(ensemble.stopReasons, ensemble.stopTime):
+            self.recordStop(reason, t)
+        return U
+
+    # Keep count of why and when integrations stopped
+    def recordStop(self, reason, t):
+        self.stopCounts[reason] += 1
+        if reason is None:
+            t = self.runSettings["Integration Time"]
+        self.integratedTime += t
+
+    def resetEarlyStopStats(self):
+        self.stopCounts = {r : 0 for r in stopReasons}
+        self.integratedTime = 0.0
+
+    # Early stopping counts, for merging those from copies of this model
+    # manager run in other processes
+    def earlyStopStats(self):
+        return (dict(self.stopCounts), self.integratedTime)
 
-        driver = StepDoublingDriver(HeunStepper(), stepperControl)
+    def addEarlyStopStats(self, stats):
+        stopCounts, integratedTime = stats
+        for reason, count in stopCounts.items():
+            self.stopCounts[reason] += count
+        self.integratedTime += integratedTime
 
-        return self.chemostat.run(driver, nReport, tInit, tFinal, uInit)
+    def reportEarlyStops(self):
+        numRuns = sum(self.stopCounts.values())
+        if self.earlyStop is None or numRuns==0:
+            return
+        Logger.write('Early stopping: %d runs, %d stopped at limit points, '
+                     '%d at limit cycles, mean integration time %g'
+                     % (numRuns, self.stopCounts['Limit Point'],
+                        self.stopCounts['Limit Cycle'],
+                        self.integratedTime/numRuns))
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+import numpy as np
+from math import *
+from SettingsHandler import *
+from TimestepOutputManager import *
+
+
+# Output managers that watch the stored trajectory during the run and
+# tell the driver to stop as soon as the long-time behavior is clear.
+#
+# Every 'Check Interval' stored points, the range (max - min, inf-norm
+# over components) of the last 'Num Steps To Check' stored points is
+# compared to 'Limit Point Tolerance', exactly as
+# LimitPointSampleHandler.goingToLimitPoint() does at the end of a run:
+#   - if the range is within tolerance and the model is linearly stable
+#     at the current state, the run has settled on a limit point and is
+#     stopped. The stability check keeps the quiet phase of a relaxation
+#     oscillation, spent close to an unstable equilibrium, from being
+#     mistaken for a limit point;
+#   - otherwise the range of the window before it gives an exponential
+#     rate of decay (or growth) of the oscillation. If the oscillation
+#     would still be larger than 'Cycle Safety Factor' times the tolerance
+#     at the final time, the run is stopped as a limit cycle.
+# No decision is made before 'Min Time', so the initial transient can
+# pass. The stored trajectory is truncated at the stop, so the sample
+# handler's window test on it gives the same answer as the monitor.
+
+earlyStopDefaults = {
+    'Num Steps To Check' : 100,
+    'Limit Point Tolerance' : 0.01,
+    'Check Interval' : 10,
+    'Min Time' : 200.0,
+    'Cycle Safety Factor' : 10.0
+    }
+
+stopReasons = (None, 'Limit Point', 'Limit Cycle')
+
+
+# Given the stored windows W, shape (k, 2*nCheck, n), with the most recent
+# point first, return the stop codes (indices into stopReasons)
+def convergenceDecision(W, t, tFinal, writeInterval, settings):
+
+    nCheck = settings['Num Steps To Check']
+    tol = settings['Limit Point Tolerance']
+    safety = settings['Cycle Safety Factor']
+
+    ACur = np.amax(np.ptp(W[:,:nCheck,:], axis=1), axis=1)
+    APrev = np.amax(np.ptp(W[:,nCheck:,:], axis=1), axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate = np.log(ACur/APrev)/(nCheck*writeInterval)
+    rate = np.minimum(np.nan_to_num(rate, nan=0.0, neginf=-np.inf), 0.0)
+    APredicted = ACur*np.exp(rate*(tFinal - t))
+
+    codes = np.zeros(len(ACur), dtype=int)
+    codes[APredicted > safety*tol] = 2
+    codes[ACur <= tol] = 1
+    codes[t < settings['Min Time']] = 0
+    return codes
+
+
+# isStable(u) returns True if the model is linearly stable at state u
+class ConvergenceMonitorOutputManager(NPStorageOutputManager):
+    def __init__(self, timeInterval, uInit, nReport, isStable,
+                 settings = earlyStopDefaults):
+        NPStorageOutputManager.__init__(self, timeInterval, uInit, nReport)
+        self.isStable = isStable
+        self.settings = mergeSettings(earlyStopDefaults, settings)
+        self.tFinal = timeInterval[1]
+        self.stopReason = None
+        self.stopTime = None
+
+    def write(self, t, u):
+        NPStorageOutputManager.write(self, t, u)
+
+        nCheck = self.settings['Num Steps To Check']
+        n = self.writeIndex
+        if n % self.settings['Check Interval'] != 0 or n < 2*nCheck:
+            return
+
+        W = self.uStore[n-1::-1,:][np.newaxis,:2*nCheck,:]
+        code = convergenceDecision(W, np.array([t]), self.tFinal,
+                                   self.writeInterval, self.settings)[0]
+        if code == 1 and not self.isStable(u):
+            code = 0
+        if code != 0:
+            self.stopReason = stopReasons[code]
+            self.stopTime = t
+
+    def isDone(self):
+        return self.stopReason is not None
+
+    # Return the part of the trajectory that was stored before stopping
+    def storedValues(self):
+        return self.uStore[:self.writeIndex]
+
+
+# isStable(U, members) returns a mask that is True where member
+# members[k] is linearly stable at state U[k]
+class EnsembleConvergenceMonitor(EnsembleStorageOutputManager):
+    def __init__(self, timeInterval, UInit, nReport, isStable,
+                 settings = earlyStopDefaults):
+        EnsembleStorageOutputManager.__init__(self, timeInterval, UInit,
+                                              nReport)
+        self.isStable = isStable
+        self.settings = mergeSettings(earlyStopDefaults, settings)
+        self.tFinal = timeInterval[1]
+        M = len(UInit)
+        self.stopCode = np.zeros(M, dtype=int)
+        self.stopTime = np.full(M, np.nan)
+
+    def write(self, members, t, u):
+        EnsembleStorageOutputManager.write(self, members, t, u)
+
+        nCheck = self.settings['Num Steps To Check']
+        n = self.writeIndex[members]
+        check = ((n % self.settings['Check Interval'] == 0)
+                 & (n >= 2*nCheck) & (self.stopCode[members] == 0))
+        if not np.any(check):
+            return
+
+        m = np.asarray(members)[check]
+        rows = n[check][:,np.newaxis] - 1 - np.arange(2*nCheck)[np.newaxis,:]
+        W = self.uStore[m[:,np.newaxis], rows, :]
+        tm = np.broadcast_to(t, np.shape(members))[check]
+        codes = convergenceDecision(W, tm, self.tFinal, self.writeInterval,
+                                    self.settings)
+        lp = codes == 1
+        if np.any(lp):
+            codes[lp] = np.where(self.isStable(u[check][lp], m[lp]), 1, 0)
+        self.stopCode[m] = codes
+        self.stopTime[m] = np.where(codes != 0, tm, np.nan)
+
+    def isDone(self, members):
+        return self.stopCode[members] != 0
+
+    def stopReason(self, m):
+        return stopReasons[self.stopCode[m]]
+
+    # Return a list of the parts of each member's trajectory stored
+    # before stopping
+    def storedValues(self):
+        return [self.uStore[m,:self.writeIndex[m]]
+                for m in range(len(self.writeIndex))]
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+
+import numpy as np
+import scipy.optimize
+from SettingsHandler import *
+from Chemostat import *
+from EquilibriumClassifier import *
+from SplineResponseFunction import *
+from ReadParamsFromFile import *
+
+
+# Continuation of a chemostat's equilibria in the dilution rate D, for a
+# fixed response function.
+#
+# The interior equilibrium branch is traced by its prey density y rather
+# than by D: the z equation forces D = e2*g(y), after which x and z follow
+# in closed form. This parametrizes the whole branch, folds included,
+# without any predictor-corrector stepping. Along the branch we find the
+# values of y at which
+#   - the largest real part of the Jacobian's eigenvalues crosses
+#     -margin or +margin (bracketing each Hopf point),
+#   - the predator density z passes through zero (transcritical point
+#     where the branch meets the predator-free equilibrium),
+#   - g'(y) = 0 (fold in D),
+# and map them to D. We also find where the predator-free boundary
+# equilibrium's stability crosses -margin as D varies. Between
+# consecutive critical values the EquilibriumClassifier's answer can't
+# change, so classifying once at the midpoint of each interval gives a
+# table of stability intervals for the whole D range.
+
+class DContinuation:
+    defaults = {
+        'Eigenvalue Margin' : 0.01,
+        'Root Scan Points' : 256,
+        'Branch Points' : 512,
+        'Boundary Scan Points' : 128
+        }
+
+    def __init__(self, responseFunc, settings = defaults):
+        self.g = responseFunc
+        self.settings = mergeSettings(DContinuation.defaults, settings)
+        self.margin = self.settings['Eigenvalue Margin']
+        self.classifier = EquilibriumClassifier({
+            'Eigenvalue Margin' : self.margin,
+            'Root Scan Points' : self.settings['Root Scan Points']
+            })
+        self.chemostat = Chemostat(self.g)
+
+    # Point on the interior branch with prey density y. Sets the
+    # chemostat's D to the corresponding dilution rate, and returns the
+    # equilibrium and the predator's net growth rate e1*f(x) - D, whose
+    # sign decides whether the point is feasible.
+    def branchPoint(self, y):
+        ch = self.chemostat
+        ch.D = ch.e2*self.g.eval(y)
+        if ch.D <= 0.0:
+            return (np.full(3, np.nan), -1.0)
+        x = ch.equilibriumNutrient(y)
+        growth = ch.e1*ch.f(x) - ch.D
+        z = ch.e2*growth*y/ch.D
+        return (np.array([x, y, z]), growth)
+
+    def branchStability(self, y):
+        u, growth = self.branchPoint(y)
+        return self.classifier.maxRealEigenvalue(self.chemostat, u)
+
+    def boundaryStability(self, D):
+        self.chemostat.D = D
+        u = self.chemostat.boundaryEquilibrium()
+        return self.classifier.maxRealEigenvalue(self.chemostat, u)
+
+    # Return a sorted list of (D, kind) pairs for the critical values of
+    # D in the open interval (DMin, DMax)
+    def criticalValues(self, DMin, DMax):
+
+        ch = self.chemostat
+        nBranch = self.settings['Branch Points']
+        yVals = np.linspace(0.0, ch.e1*ch.Xin, nBranch+1)[1:]
+
+        growth = np.zeros(nBranch)
+        stab = np.zeros(nBranch)
+        slope = np.zeros(nBranch)
+        for i, y in enumerate(yVals):
+            u, growth[i] = self.branchPoint(y)
+            slope[i] = self.g.evalDerivs(y)[1]
+            if growth[i] > 0.0:
+                stab[i] = self.classifier.maxRealEigenvalue(ch, u)
+            else:
+                stab[i] = np.nan
+
+        crit = []
+
+        def addCrossings(vals, func, kind):
+            for i in range(len(vals)-1):
+                a = vals[i]
+                b = vals[i+1]
+                if np.isnan(a) or np.isnan(b) or (a < 0.0) == (b < 0.0):
+                    continue
+                y = scipy.optimize.brentq(func, yVals[i], yVals[i+1])
+                crit.append((ch.e2*self.g.eval(y), kind))
+
+        addCrossings(growth, lambda y: self.branchPoint(y)[1],
+                     'Transcritical')
+        addCrossings(slope, lambda y: self.g.evalDerivs(y)[1], 'Fold')
+        addCrossings(stab + self.margin,
+                     lambda y: self.branchStability(y) + self.margin,
+                     'Hopf (stable side)')
+        addCrossings(stab - self.margin,
+                     lambda y: self.branchStability(y) - self.margin,
+                     'Hopf (unstable side)')
+
+        nBdry = self.settings['Boundary Scan Points']
+        DVals = np.linspace(DMin, DMax, nBdry+1)
+        bdry = np.array([self.boundaryStability(D) for D in DVals])
+        bdry = bdry + self.margin
+        for i in range(nBdry):
+            if (bdry[i] < 0.0) == (bdry[i+1] < 0.0):
+                continue
+            D = scipy.optimize.brentq(
+                lambda D: self.boundaryStability(D) + self.margin,
+                DVals[i], DVals[i+1])
+            crit.append((D, 'Boundary'))
+
+        crit = [c for c in crit if c[0] > DMin and c[0] < DMax]
+        crit.sort(key=lambda c: c[0])
+        return crit
+
+    # Return a list of (DLow, DHigh, label) intervals covering [DMin, DMax],
+    # where label is 'LP', 'LC' or None (ambiguous) as given by the
+    # EquilibriumClassifier. Adjacent intervals with the same label are
+    # merged.
+    def intervals(self, DMin, DMax):
+
+        cuts = [DMin] + [c[0] for c in self.criticalValues(DMin, DMax)] \
+            + [DMax]
+
+        rtn = []
+        for lo, hi in zip(cuts[:-1], cuts[1:]):
+            if hi <= lo:
+                continue
+            label = self.classifier.classify(Chemostat(self.g, 0.5*(lo+hi)))
+            if len(rtn) > 0 and rtn[-1][2]==label:
+                rtn[-1] = (rtn[-1][0], hi, label)
+            else:
+                rtn.append((lo, hi, label))
+
+        return rtn
+
+
+# Look up the label for dilution rate D in a table of intervals
+def labelAt(intervals, D):
+    for lo, hi, label in intervals:
+        if D >= lo and D <= hi:
+            return label
+    raise ValueError('D=%g is outside the tabulated range [%g, %g]'
+                     % (D, intervals[0][0], intervals[-1][1]))
+
+
+# Count limit points, limit cycles and ambiguous cases at each D for a
+# list of per-sample interval tables
+def countLabels(tables, DVals):
+    counts = np.zeros((len(DVals), 3), dtype=int)
+    for intervals in tables:
+        for j, D in enumerate(DVals):
+            label = labelAt(intervals, D)
+            if label=='LP':
+                counts[j,0] += 1
+            elif label=='LC':
+                counts[j,1] += 1
+            else:
+                counts[j,2] += 1
+    return counts
+
+
+labelCodes = {'LP' : 1, 'LC' : 0, None : -1}
+
+
+# Write the per-sample interval tables, one row per interval
+def writeIntervals(filename, tables, header=''):
+    rows = []
+    for s, intervals in enumerate(tables):
+        for lo, hi, label in intervals:
+            rows.append([s, lo, hi, labelCodes[label]])
+    np.savetxt(filename, np.array(rows), fmt=['%d', '%.10g', '%.10g', '%d'],
+               header=header
+               + '\nsample, D low, D high, label (1=LP, 0=LC, -1=ambiguous)')
+
+
+
+if __name__=='__main__':
+
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(
+        description='stability intervals in D for stored spline samples')
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--nx', action='store', type=int, default=64)
+    parser.add_argument('--xmax', action='store', type=float, default=90.0)
+    parser.add_argument('--dmin', action='store', type=float, default=0.03)
+    parser.add_argument('--dmax', action='store', type=float, default=0.1001)
+    parser.add_argument('--dstep', action='store', type=float, default=0.0025)
+    parser.add_argument('--out', action='store', default='continuation')
+
+    args = parser.parse_args()
+
+    DVals = np.arange(args.dmin, args.dmax, args.dstep)
+    rFunc = SplineResponseFunction(args.xmax, args.nx)
+    cont = DContinuation(rFunc)
+
+    start = time.time()
+    tables = []
+    for filename in args.files:
+        for params in readParams(filename):
+            rFunc.setParams(params)
+            tables.append(cont.intervals(DVals[0], DVals[-1]))
+    print('Built %d interval tables in %g seconds'
+          % (len(tables), time.time()-start))
+
+    header = 'Stability intervals for samples from %s' % (args.files,)
+    writeIntervals('%s-intervals.csv' % args.out, tables, header)
+
+    counts = countLabels(tables, DVals)
+    np.savetxt('%s-counts.csv' % args.out,
+               np.column_stack((DVals, counts)),
+               fmt=['%.6f', '%d', '%d', '%d'],
+               header=header + '\nD, num LP, num LC, num ambiguous')
+    for D, c in zip(DVals, counts):
+        print('D=%f LP=%d LC=%d ambiguous=%d' % (D, c[0], c[1], c[2]))
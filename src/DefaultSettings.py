@@ -12,7 +12,10 @@ splinePropGen = {
         'Limiter (# sigmas)' : 5.0,
         'Filter width (# grid points)' : 4,
         'Weight for previous sample (in [0:1])' : 0.1
-    }
+    },
+    # Settings for AdaptiveProposalGenerator, or None to use the
+    # spline proposals throughout
+    'Adaptive' : None
 }
 
 tanhResp = {
@@ -29,13 +32,39 @@ hollingResp = {
 
 mpPropGen = {
     'Type' : 'MultiParam',
-    'Sigma' : (0.1, 0.1)
+    'Sigma' : (0.1, 0.1),
+    'Adaptive' : None
 }
 
+# samplerType picks the default sampler settings: 'MH', or 'Ensemble' for
+# the stretch-move ensemble sampler. samplerParams, if given, replaces
+# them.
 def makeRunSettings(runName, dirName, rf, propGen, numSamples,
-                    samplerParams=None):
+                    samplerParams=None, samplerType='MH'):
 
-  if samplerParams==None:
+  if samplerParams==None and samplerType=='Ensemble':
+    sampler = {
+        'Type' : 'Ensemble',
+        'Ensemble Control' : {
+            'Num Samples' : numSamples,
+            # Twice the number of parameters if None
+            'Num Walkers' : None,
+            'Stretch Scale' : 2.0,
+            # Both lengths count steps of the whole ensemble; every
+            # walker is kept after each 'Decorrelation Length' steps
+            'Burn Length' : 200,
+            'Decorrelation Length' : 5,
+            'Output Interval' : 10,
+            # If True, sample the likelihood times the proposal
+            # generator's prior, instead of the likelihood alone as MH
+            # does; the LP/LC fractions then aren't comparable with MH's
+            'Use Prior' : False,
+            'Verbosity' : 3
+        },
+        # Gives the starting walkers, and the prior if 'Use Prior' is set
+        'Proposal Generator' : propGen
+    }
+  elif samplerParams==None:
     sampler = {
         'Type' : 'MH',
         'MH Control' : {
@@ -43,7 +72,29 @@ def makeRunSettings(runName, dirName, rf, propGen, numSamples,
             'Burn Length' : 1000,
             'Decorrelation Length' : 5, # 200
             'Output Interval' : 50,
-            'Verbosity'   : 3
+            'Verbosity'   : 3,
+            # With more than one chain, the chains are run in parallel
+            # and 'Num Samples' is split between them
+            'Num Chains' : 1,
+            # If True, retained samples are run in worker processes
+            # while the chain goes on
+            'Pipelined' : False,
+            # If True, proposals are made and their likelihoods computed
+            # in batches, ahead of the accept/reject decisions
+            'Speculative' : False,
+            # Proposals per step; more than one uses multiple-try
+            # Metropolis, which can't be combined with 'Adaptive'
+            'Num Tries' : 1,
+            # 'MALA' or 'HMC' to use the likelihood gradient, for
+            # response functions linear in their parameters
+            'Gradient Method' : None,
+            # With a 'Gradient Method', True samples the likelihood times
+            # the proposal generator's prior instead of the likelihood
+            # alone; the LP/LC fractions then aren't comparable with MH's
+            'Use Prior' : False,
+            # Single chains write a checkpoint next to the log every
+            # this many samples, for resuming; None turns this off
+            'Checkpoint Interval' : 100
         },
         'Proposal Generator' : propGen
     }
@@ -56,6 +107,9 @@ def makeRunSettings(runName, dirName, rf, propGen, numSamples,
       'Run Name' : runName,
       'Output Directory' : dirName,
       'Create Directory If Needed' : True,
+      # Seed for all the run's random streams; None for a fresh one
+      # each run. Each D gets its own stream spawned from the seed.
+      'Seed' : None,
 
 
       'Response Function' : rf,
@@ -72,7 +126,19 @@ def makeRunSettings(runName, dirName, rf, propGen, numSamples,
           'Integration Time' : 1000,
           'Initial Value' : [40.0, 10.0, 40.0],
           'Num to Store' : 1000,
+          # Set to e.g. {'Eigenvalue Margin' : 0.01, 'Check Interval' : 10}
+          # to classify samples from their equilibria where possible
+          'Equilibrium Classifier' : None,
+          # Set to e.g. {'Min Time' : 200.0} to stop integrations once
+          # they've settled; keep 'Num Steps To Check' and 'Limit Point
+          # Tolerance' the same as in the sample handler
+          'Early Stopping' : None,
+          # Set to e.g. {'Window Size' : 100, 'Start Time' : 800.0} to
+          # keep only the end of each trajectory. The window must be at
+          # least the sample handler's 'Num Steps To Check'
+          'Tail Window' : None,
           'Stepper Control' : {
+              'Method' : 'Heun', # Heun, RK4, BS32, DP54 or Tsit54
               'Verbosity' : 0,
               'HInit' : 0.1,
               'MaxSteps' : 100000,
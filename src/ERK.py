@@ -55,6 +55,120 @@ class RK4Stepper(ERKStepper):
         return u + (dt/6.0)*(K1 + 2.0*K2 + 2.0*K3 + K4)
 
 
+# Generic explicit Runge-Kutta stepper with an embedded lower-order
+# solution for error estimation, specified by its Butcher tableau.
+# A is the strictly lower triangular stage matrix (given as a list of rows),
+# b the weights of the order-p solution, bHat the weights of the embedded
+# order-q solution, and c the stage times. If the method is FSAL (first
+# same as last) the final stage is the RHS at the new solution, and can be
+# reused as the first stage of the next step.
+#
+# All arithmetic is written so that u may be a single state vector or an
+# (M, n) block of states, with dt either a scalar or an (M,1) array of
+# per-member stepsizes.
+class EmbeddedERKStepper(ERKStepper):
+    def __init__(self, p, q, name, A, b, bHat, c):
+        ERKStepper.__init__(self, p, name)
+        self.q = q
+        self.A = [np.array(row, dtype=float) for row in A]
+        self.b = np.array(b, dtype=float)
+        self.e = self.b - np.array(bHat, dtype=float)
+        self.c = np.array(c, dtype=float)
+        self.numStages = len(self.b)
+        self.fsal = (len(self.A) == self.numStages-1
+                     and self.b[-1] == 0.0
+                     and np.allclose(self.A[-1], self.b[:-1]))
+
+    # Take a step, returning the new solution, the error estimate vector,
+    # the RHS at the new solution (None if the method isn't FSAL), and
+    # the number of RHS evaluations done. K1 is the RHS at (u,t) if it's
+    # already known, e.g., from the last stage of the previous step.
+    def stepWithError(self, u, t, f, dt, K1=None):
+        numEvals = 0
+        if K1 is None:
+            K1 = f(u, t)
+            numEvals += 1
+        K = [K1]
+        for i in range(1, self.numStages):
+            a = self.A[i-1]
+            uStage = u
+            for j in range(i):
+                if a[j] != 0.0:
+                    uStage = uStage + (dt*a[j])*K[j]
+            K.append(f(uStage, t + self.c[i]*dt))
+            numEvals += 1
+
+        uNew = u
+        err = 0.0
+        for j in range(self.numStages):
+            if self.b[j] != 0.0:
+                uNew = uNew + (dt*self.b[j])*K[j]
+            if self.e[j] != 0.0:
+                err = err + (dt*self.e[j])*K[j]
+
+        KNew = None
+        if self.fsal:
+            KNew = K[-1]
+
+        return (uNew, err, KNew, numEvals)
+
+    def step(self, u, t, f, dt):
+        return self.stepWithError(u, t, f, dt)[0]
+
+
+class BogackiShampineStepper(EmbeddedERKStepper):
+    def __init__(self):
+        EmbeddedERKStepper.__init__(self, 3, 2, 'Bogacki-Shampine 3(2)',
+            A = [[1.0/2.0],
+                 [0.0, 3.0/4.0],
+                 [2.0/9.0, 1.0/3.0, 4.0/9.0]],
+            b = [2.0/9.0, 1.0/3.0, 4.0/9.0, 0.0],
+            bHat = [7.0/24.0, 1.0/4.0, 1.0/3.0, 1.0/8.0],
+            c = [0.0, 1.0/2.0, 3.0/4.0, 1.0])
+
+
+class DormandPrinceStepper(EmbeddedERKStepper):
+    def __init__(self):
+        EmbeddedERKStepper.__init__(self, 5, 4, 'Dormand-Prince 5(4)',
+            A = [[1.0/5.0],
+                 [3.0/40.0, 9.0/40.0],
+                 [44.0/45.0, -56.0/15.0, 32.0/9.0],
+                 [19372.0/6561.0, -25360.0/2187.0, 64448.0/6561.0,
+                  -212.0/729.0],
+                 [9017.0/3168.0, -355.0/33.0, 46732.0/5247.0, 49.0/176.0,
+                  -5103.0/18656.0],
+                 [35.0/384.0, 0.0, 500.0/1113.0, 125.0/192.0,
+                  -2187.0/6784.0, 11.0/84.0]],
+            b = [35.0/384.0, 0.0, 500.0/1113.0, 125.0/192.0,
+                 -2187.0/6784.0, 11.0/84.0, 0.0],
+            bHat = [5179.0/57600.0, 0.0, 7571.0/16695.0, 393.0/640.0,
+                    -92097.0/339200.0, 187.0/2100.0, 1.0/40.0],
+            c = [0.0, 1.0/5.0, 3.0/10.0, 4.0/5.0, 8.0/9.0, 1.0, 1.0])
+
+
+class TsitourasStepper(EmbeddedERKStepper):
+    def __init__(self):
+        b = [0.09646076681806523, 0.01, 0.4798896504144996,
+             1.379008574103742, -3.290069515436081, 2.324710524099774, 0.0]
+        e = [-0.00178001105222577714, -0.0008164344596567469,
+             0.007880878010261995, -0.1447110071732629,
+             0.5823571654525552, -0.45808210592918697,
+             0.015151515151515152]
+        EmbeddedERKStepper.__init__(self, 5, 4, 'Tsitouras 5(4)',
+            A = [[0.161],
+                 [-0.008480655492356989, 0.335480655492357],
+                 [2.897153057105493, -6.359448489975075, 4.3622954328695815],
+                 [5.325864828439257, -11.748883564062828, 7.4955393428898365,
+                  -0.09249506636175525],
+                 [5.86145544294642, -12.92096931784711, 8.159367898576159,
+                  -0.071584973281401, -0.028269050394068383],
+                 b[:-1]],
+            b = b,
+            bHat = [bi - ei for bi, ei in zip(b, e)],
+            c = [0.0, 0.161, 0.327, 0.9, 0.9800255409045097, 1.0, 1.0])
+
+
+
 if __name__=='__main__':
 
     def fTest(u, t):
@@ -71,7 +185,10 @@ if __name__=='__main__':
         EulerStepper() : [],
         HeunStepper() : [],
         ExplicitMidpointStepper() : [],
-        RK4Stepper() : []
+        RK4Stepper() : [],
+        BogackiShampineStepper() : [],
+        DormandPrinceStepper() : [],
+        TsitourasStepper() : []
         }
 
     n = []
@@ -94,9 +211,11 @@ if __name__=='__main__':
     plt.loglog(n, data[steppers[0]], 'b-o',
                n, data[steppers[1]], 'g-s',
                n, data[steppers[2]], 'k-s',
-               n, data[steppers[3]], 'r-*')
-    plt.legend([steppers[0].name, steppers[1].name, steppers[2].name,
-                steppers[3].name]) 
+               n, data[steppers[3]], 'r-*',
+               n, data[steppers[4]], 'c-^',
+               n, data[steppers[5]], 'm-d',
+               n, data[steppers[6]], 'y-v')
+    plt.legend([s.name for s in steppers])
 
     plt.show()
     
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+
+import numpy as np
+import matplotlib.pyplot as plt
+from SettingsHandler import *
+from TimestepOutputManager import *
+from ERK import *
+from math import *
+
+
+# Adaptive driver for embedded Runge-Kutta pairs. The error estimate comes
+# for free from the embedded solution, so each attempted step costs one
+# pass through the stages (one fewer for FSAL methods), compared to the
+# three steps per attempt used by StepDoublingDriver. Output is written
+# by cubic Hermite interpolation between the endpoints of each accepted
+# step, using the RHS values that are already available.
+#
+# The settings keys are the same as for StepDoublingDriver, so that the
+# same 'Stepper Control' block can be used with either driver.
+#
+# With the "Nonnegative" option, a step that produces a negative component
+# is rejected and retried with a smaller stepsize; at the minimum stepsize
+# the negative components are set to zero. This keeps population models
+# from stepping across the washout boundary y=0, beyond which they blow up.
+
+class EmbeddedRKDriver:
+    defaults = {
+        "Verbosity" : 0,      # Verbosity for diagnostic output
+        "HInit" : 0.1,        # Initial stepsize
+        "MaxSteps" : 100000,  # Maximum number of steps
+        "Tolerance" : 1.0e-4, # Accuracy target for each step
+        "Safety" : 0.9,       # Safety factor for stepsize change
+        "MinStepsizeFactor" : 0.001, # Minimum stepsize as fraction of initial
+        "MaxStepsizeFactor" : 1000.0, # Maximum stepsize as fraction of initial
+        "MaxGrowth" : 5.0,    # Largest allowed stepsize increase in one step
+        "MaxShrink" : 0.2,    # Largest allowed stepsize decrease in one step
+        "Nonnegative" : False # Reject steps that make any component negative
+    }
+
+    def __init__(self, stepper,
+                 settings = defaults):
+        if not isinstance(stepper, EmbeddedERKStepper):
+            raise ValueError('EmbeddedRKDriver needs an embedded stepper, '
+                             'got %s' % stepper.name)
+        self.stepper = stepper
+        self.settings = mergeSettings(EmbeddedRKDriver.defaults, settings)
+
+    def runStepper(self, rhsFunc, timeInterval, uInit, outMgr):
+
+        t = timeInterval[0]
+        tStop = timeInterval[1]
+        uCur = np.array(uInit, dtype=float)
+
+        stepper = self.stepper
+        # Exponent for stepsize control is set by the lower order of the pair
+        q = min(stepper.p, stepper.q)
+
+        verb = self.settings["Verbosity"]
+        dt = self.settings["HInit"]
+        maxSteps = self.settings["MaxSteps"]
+        tau = self.settings["Tolerance"]
+        safety = self.settings["Safety"]
+        minStepsizeFactor = self.settings["MinStepsizeFactor"]
+        maxStepsizeFactor = self.settings["MaxStepsizeFactor"]
+        maxGrowth = self.settings["MaxGrowth"]
+        maxShrink = self.settings["MaxShrink"]
+        nonNeg = self.settings["Nonnegative"]
+
+        step = 0
+        numShrink = 0
+        numGrow = 0
+        numEvals = 0
+
+        minStepsize = dt * minStepsizeFactor
+        maxStepsize = dt * maxStepsizeFactor
+
+        minStepUsed = fabs(dt)
+        maxStepUsed = fabs(dt)
+
+        # Write the initial value
+        outMgr.write(t, uCur)
+
+        # RHS at the current point. With an FSAL method this is carried
+        # over from the last stage of the previous accepted step.
+        fCur = rhsFunc(uCur, t)
+        numEvals += 1
+
+        # Main loop
+        while (t < tStop and step < maxSteps and not outMgr.isDone()):
+            if (t + dt > tStop):
+                dt = tStop - t
+                if verb>=3:
+                    print('Timestep exceeds interval; reducing h to %g' % dt)
+            if verb>=3:
+                print('Step %d from t=%g to %g with h=%g' % (step, t, t+dt, dt))
+
+            uNew, errVec, fNew, nEval = stepper.stepWithError(uCur, t,
+                                                              rhsFunc, dt,
+                                                              fCur)
+            numEvals += nEval
+            errEst = np.linalg.norm(errVec, np.inf)
+
+            # Estimate new stepsize
+            if errEst==0.0: # deal with occasional division by zero
+                fac = maxGrowth
+            else:
+                fac = safety*pow(tau/errEst, 1.0/(q+1))
+            fac = min(maxGrowth, max(maxShrink, fac))
+            dtNew = dt*fac
+
+            if errEst > tau and fabs(dt) > minStepsize:
+                if fabs(dtNew) <= minStepsize:
+                    dt = minStepsize
+                else:
+                    dt = dtNew
+                if verb>=3:
+                    print('Reducing stepsize to h=%g' % dt)
+                numShrink += 1
+                continue # Don't accept step; try again with smaller stepsize
+
+            if nonNeg and np.any(uNew < 0.0):
+                if fabs(dt) > minStepsize:
+                    dt = max(maxShrink*dt, minStepsize)
+                    numShrink += 1
+                    continue
+                uNew = np.maximum(uNew, 0.0)
+                fNew = None
+
+            # If we've made it to this point, the step is good
+
+            if fNew is None:
+                fNew = rhsFunc(uNew, t+dt)
+                numEvals += 1
+
+            # Write any output points that fall within this step
+            wroteStep = False
+            while outMgr.needToWrite(t, dt):
+                tnw = outMgr.tNextWrite
+                theta = (tnw - t)/dt
+                h00 = (1.0 + 2.0*theta)*(1.0 - theta)**2
+                h10 = theta*(1.0 - theta)**2
+                h01 = theta*theta*(3.0 - 2.0*theta)
+                h11 = theta*theta*(theta - 1.0)
+                uWrite = (h00*uCur + (h10*dt)*fCur
+                          + h01*uNew + (h11*dt)*fNew)
+
+                outMgr.write(tnw, uWrite)
+                wroteStep = True
+
+            minStepUsed = min(minStepUsed, fabs(dt))
+            maxStepUsed = max(maxStepUsed, fabs(dt))
+
+            uCur = uNew
+            fCur = fNew
+
+            t += dt
+            step += 1
+
+            # Write final step if necessary
+            if t==tStop and outMgr.needToWrite(t, dt) and not wroteStep:
+                outMgr.write(t, uCur)
+
+            if t < tStop:
+                if fabs(dtNew) > fabs(dt):
+                    numGrow += 1
+                dt = min(max(dtNew, minStepsize), maxStepsize)
+        # Done timestepping loop!
+
+        if verb>=2:
+            print('Done time integration')
+            print('\tFinal time           %g' % t)
+            print('\tNum steps            %d' % step)
+            print('\tMin stepsize used    %g' % minStepUsed)
+            print('\tMax stepsize used    %g' % maxStepUsed)
+            print('\tNumber of func evals %d' % numEvals)
+            print('\tNum step decrease    %d' % numShrink)
+            print('\tNum step increase    %d' % numGrow)
+
+        stat = {
+            'NSteps' : step,
+            'NEval'  : numEvals
+            }
+
+        return stat
+
+
+
+if __name__=='__main__':
+
+    def fTest(u, t):
+        x = u[0]
+        v = u[1]
+        return np.array([v, -x])
+
+    def uExact(t):
+        return np.array([cos(t), -sin(t)])
+
+    epsVals = (1.0e-4, 1.0e-5, 1.0e-6, 1.0e-7, 1.0e-8, 1.0e-9, 1.0e-10)
+
+    for stepper in (BogackiShampineStepper(), DormandPrinceStepper(),
+                    TsitourasStepper()):
+        errVals = []
+        nEvalVals = []
+
+        for eps in epsVals:
+            tInit = 0.0
+            tFinal = 5.0
+            nReport = 10
+            uInit = [1.0, 0.0]
+
+            stepSettings = {"Tolerance" : eps}
+            driver = EmbeddedRKDriver(stepper, stepSettings)
+            outMgr = NPStorageOutputManager([tInit, tFinal], uInit, nReport)
+
+            stat = driver.runStepper(fTest, [tInit, tFinal], uInit, outMgr)
+
+            err = 0.0
+            for i in range(0, nReport+1):
+                err = max(err, np.linalg.norm(
+                    uExact(outMgr.tVals[i,0])-outMgr.uStore[i,:], np.inf))
+
+            nEvalVals.append(stat['NEval'])
+            errVals.append(err)
+
+        print(stepper.name, errVals, nEvalVals)
+        plt.loglog(nEvalVals, errVals, '-o')
+
+    plt.loglog(nEvalVals, epsVals, 'k--')
+    plt.xlabel('RHS evaluations')
+    plt.ylabel('max error at output points')
+    plt.show()
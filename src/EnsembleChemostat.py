@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+
+import numpy as np
+from Chemostat import *
+from EnsembleRKDriver import *
+from SplineSolver import *
+from TimestepOutputManager import *
+from ConvergenceMonitor import *
+
+
+# Response function for an ensemble of splines on a common grid, one
+# spline per row of an (M, Nx) block of spline parameters. eval(y, members)
+# evaluates member m's spline at y[k] for m = members[k].
+class SplineEnsembleResponse:
+    def __init__(self, xMax, nx, paramBlock):
+        self.nx = nx
+        self.xMax = xMax
+        self.h = xMax/float(nx-1)
+
+        paramBlock = np.atleast_2d(paramBlock)
+        M = paramBlock.shape[0]
+        solver = SplineSolver(xMax, nx)
+        self.C = np.zeros((M, nx-1, 4))
+        for m in range(M):
+            solver.solve(paramBlock[m])
+            self.C[m] = np.reshape(solver.c, (nx-1, 4))
+
+        self.setRightVals()
+
+    # Beyond the last node the spline is continued as a constant
+    def setRightVals(self):
+        CLast = self.C[:,self.nx-2,:]
+        self.rightVal = CLast[:,0] + CLast[:,1] + CLast[:,2] + CLast[:,3]
+
+    # Return an ensemble made up of the given members of this one, sharing
+    # the already computed spline coefficients
+    def subset(self, members):
+        rtn = SplineEnsembleResponse.__new__(SplineEnsembleResponse)
+        rtn.nx = self.nx
+        rtn.xMax = self.xMax
+        rtn.h = self.h
+        rtn.C = self.C[members]
+        rtn.setRightVals()
+        return rtn
+
+    def name(self):
+        return 'Spline'
+
+    def eval(self, y, members):
+        h = self.h
+        i = np.floor(y/h).astype(int)
+        left = i < 0
+        right = i >= self.nx-1
+        i = np.clip(i, 0, self.nx-2)
+
+        t = (y - i*h)/h
+        C = self.C[members, i, :]
+        g = C[:,0] + t*(C[:,1] + t*(C[:,2] + t*C[:,3]))
+        g = np.where(right, self.rightVal[members], g)
+        return np.where(left, 0.0, g)
+
+
+# Response function for an ensemble of arbitrary response function
+# objects, evaluated one member at a time. This vectorizes the time
+# integration but not the response evaluation.
+class ListEnsembleResponse:
+    def __init__(self, responseFuncs):
+        self.funcs = responseFuncs
+
+    def name(self):
+        return self.funcs[0].name()
+
+    def subset(self, members):
+        return ListEnsembleResponse([self.funcs[m] for m in members])
+
+    def eval(self, y, members):
+        return np.array([self.funcs[m].eval(yk)
+                         for m, yk in zip(members, y)])
+
+
+# Chemostat model for an ensemble of response functions sharing the same
+# dilution rate and other physical parameters
+class EnsembleChemostat(Chemostat):
+    def __init__(self, ensembleResponse, D=0.05):
+        Chemostat.__init__(self, ensembleResponse, D)
+
+    def RHS(self, U, members):
+        x = U[:,0]
+        y = U[:,1]
+        z = U[:,2]
+        D = self.D
+        e1 = self.e1
+        e2 = self.e2
+        Xin = self.Xin
+
+        fOfX = self.f(x)
+        gOfY = self.g.eval(y, members)
+
+        rtn = np.empty_like(U)
+        rtn[:,0] = D*(Xin - x) - fOfX*y
+        rtn[:,1] = e1*fOfX*y - gOfY*z - D*y
+        rtn[:,2] = e2*gOfY*z - D*z
+
+        return rtn
+
+    # Linear stability of members[k] at state U[k], from a central
+    # difference Jacobian of the right hand side
+    def isStable(self, U, members):
+        M, n = U.shape
+        J = np.zeros((M, n, n))
+        for j in range(n):
+            h = 1.0e-6*np.maximum(np.abs(U[:,j]), 1.0)
+            UPlus = U.copy()
+            UMinus = U.copy()
+            UPlus[:,j] += h
+            UMinus[:,j] -= h
+            J[:,:,j] = ((self.RHS(UPlus, members) - self.RHS(UMinus, members))
+                        / (2.0*h[:,np.newaxis]))
+        return np.amax(np.real(np.linalg.eigvals(J)), axis=1) < 0.0
+
+    # Run all members from the same initial value, or from the rows of
+    # an (M, 3) block of initial values. Returns the stored trajectories
+    # as an (M, nReport+1, 3) array. If earlyStop settings are given,
+    # members stop as soon as the convergence monitor can classify them,
+    # and a list of each member's stored trajectory up to its stop is
+    # returned instead. Stop times and reasons are kept in stopTime and
+    # stopReasons. Otherwise, if tail window settings are given, a list of
+    # the last 'Window Size' stored points of each member is returned.
+    def run(self, driver, nReport, tInit, tFinal, u0, earlyStop=None,
+            tail=None):
+
+        M = self.numMembers()
+        U0 = np.array(u0, dtype=float)
+        if U0.ndim == 1:
+            U0 = np.tile(U0, (M, 1))
+
+        if earlyStop is None and tail is None:
+            outMgr = EnsembleStorageOutputManager([tInit, tFinal], U0,
+                                                  nReport)
+        elif earlyStop is None:
+            tail = mergeSettings(tailWindowDefaults, tail)
+            outMgr = EnsembleRingBufferOutputManager([tInit, tFinal], U0,
+                                                     nReport,
+                                                     tail['Window Size'],
+                                                     tail['Start Time'])
+        else:
+            outMgr = EnsembleConvergenceMonitor([tInit, tFinal], U0,
+                                                nReport, self.isStable,
+                                                earlyStop)
+
+        def f(U, t, members):
+            return self.RHS(U, members)
+
+        stat = driver.runStepper(f, [tInit, tFinal], U0, outMgr)
+
+        if earlyStop is None:
+            self.stopTime = np.full(M, np.nan)
+            self.stopReasons = [None]*M
+        else:
+            self.stopTime = outMgr.stopTime
+            self.stopReasons = [outMgr.stopReason(m) for m in range(M)]
+
+        return outMgr.storedValues()
+
+    def numMembers(self):
+        if isinstance(self.g, SplineEnsembleResponse):
+            return self.g.C.shape[0]
+        return len(self.g.funcs)
+
+
+
+if __name__=='__main__':
+
+    import time
+
+    u0 = np.array([40.0, 10.0, 40.0])
+    tInit = 0.0
+    tFinal = 1000.0
+    nReport = 1000
+
+    models = [TanhModel(), HollingModel(), IvlevModel()]*20
+
+    t0 = time.time()
+    ens = EnsembleChemostat(ListEnsembleResponse(models))
+    driver = EnsembleRKDriver(DormandPrinceStepper())
+    U = ens.run(driver, nReport, tInit, tFinal, u0)
+    t1 = time.time()
+
+    serialDriver = EmbeddedRKDriver(DormandPrinceStepper())
+    for m, g in enumerate(models):
+        Um = Chemostat(g).run(serialDriver, nReport, tInit, tFinal, u0)
+        if m < 3:
+            print(g.name(), 'max diff from serial run = ',
+                  np.amax(np.abs(Um - U[m])),
+                  goingToLimitPoint(U[m], 100, 0.01))
+    t2 = time.time()
+
+    print('ensemble time = %g, serial time = %g' % (t1-t0, t2-t1))
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+
+import numpy as np
+from SettingsHandler import *
+from TimestepOutputManager import *
+from EmbeddedRKDriver import *
+from ERK import *
+from math import *
+
+
+# Adaptive embedded Runge-Kutta driver for an ensemble of M independent
+# systems of the same size, stored as an (M, n) block. Each member has its
+# own time and stepsize, and members that have reached the end of the run
+# are masked out, so the work per step shrinks as the ensemble finishes.
+#
+# The RHS function is called as rhsFunc(U, t, members), where members is
+# the index array of the rows of U, and must return an array shaped like
+# U. The settings are the same as for EmbeddedRKDriver, and stepsize
+# control follows EmbeddedRKDriver member by member.
+
+class EnsembleRKDriver:
+
+    def __init__(self, stepper,
+                 settings = EmbeddedRKDriver.defaults):
+        if not isinstance(stepper, EmbeddedERKStepper):
+            raise ValueError('EnsembleRKDriver needs an embedded stepper, '
+                             'got %s' % stepper.name)
+        self.stepper = stepper
+        self.settings = mergeSettings(EmbeddedRKDriver.defaults, settings)
+
+    def runStepper(self, rhsFunc, timeInterval, UInit, outMgr):
+
+        tInit = timeInterval[0]
+        tStop = timeInterval[1]
+        U = np.array(UInit, dtype=float)
+        M = U.shape[0]
+
+        stepper = self.stepper
+        q = min(stepper.p, stepper.q)
+
+        verb = self.settings["Verbosity"]
+        hInit = self.settings["HInit"]
+        maxSteps = self.settings["MaxSteps"]
+        tau = self.settings["Tolerance"]
+        safety = self.settings["Safety"]
+        minStepsize = hInit * self.settings["MinStepsizeFactor"]
+        maxStepsize = hInit * self.settings["MaxStepsizeFactor"]
+        maxGrowth = self.settings["MaxGrowth"]
+        maxShrink = self.settings["MaxShrink"]
+        nonNeg = self.settings["Nonnegative"]
+
+        t = np.full(M, float(tInit))
+        dt = np.full(M, float(hInit))
+        steps = np.zeros(M, dtype=int)
+        numEvals = np.zeros(M, dtype=int)
+        numBatches = 0
+
+        everyone = np.arange(M)
+
+        # Write the initial values
+        outMgr.write(everyone, t, U)
+
+        F = rhsFunc(U, t, everyone)
+        numEvals += 1
+
+        active = everyone
+        while len(active) > 0:
+            numBatches += 1
+
+            tA = t[active]
+            UA = U[active]
+            FA = F[active]
+            dtA = np.minimum(dt[active], tStop - tA)
+            hitEnd = dtA >= tStop - tA
+
+            def f(u, tt):
+                return rhsFunc(u, tt[:,0], active)
+
+            UNew, errVec, FNew, nEval = stepper.stepWithError(
+                UA, tA[:,np.newaxis], f, dtA[:,np.newaxis], FA)
+            numEvals[active] += nEval
+            errEst = np.amax(np.abs(errVec), axis=1)
+
+            # Estimate new stepsizes
+            with np.errstate(divide='ignore'):
+                fac = np.where(errEst > 0.0,
+                               safety*np.power(tau/errEst, 1.0/(q+1)),
+                               maxGrowth)
+            fac = np.clip(fac, maxShrink, maxGrowth)
+            dtNew = dtA*fac
+
+            # Reject steps that are too inaccurate, unless already at the
+            # smallest allowed stepsize
+            accept = (errEst <= tau) | (dtA <= minStepsize)
+            reject = ~accept
+            dt[active[reject]] = np.maximum(dtNew[reject], minStepsize)
+
+            # Reject steps that leave the nonnegative orthant, clipping at
+            # the minimum stepsize as in EmbeddedRKDriver
+            if nonNeg:
+                negative = np.any(UNew < 0.0, axis=1)
+                retry = accept & negative & (dtA > minStepsize)
+                dt[active[retry]] = np.maximum(maxShrink*dtA[retry],
+                                               minStepsize)
+                accept = accept & ~retry
+                clipped = accept & negative
+                if np.any(clipped):
+                    UNew[clipped] = np.maximum(UNew[clipped], 0.0)
+                    if FNew is not None:
+                        FNew[clipped] = rhsFunc(UNew[clipped],
+                                                tA[clipped] + dtA[clipped],
+                                                active[clipped])
+                        numEvals[active[clipped]] += 1
+
+            if np.any(accept):
+                acc = active[accept]
+                t0 = tA[accept]
+                h = dtA[accept]
+                U0 = UA[accept]
+                F0 = FA[accept]
+                U1 = UNew[accept]
+                if FNew is None:
+                    F1 = rhsFunc(U1, t0 + h, acc)
+                    numEvals[acc] += 1
+                else:
+                    F1 = FNew[accept]
+
+                # Write any output points within the accepted steps by
+                # cubic Hermite interpolation
+                w = outMgr.needToWrite(t0, h, acc)
+                while np.any(w):
+                    theta = ((outMgr.tNextWrite[acc[w]] - t0[w])/h[w])
+                    theta = theta[:,np.newaxis]
+                    hw = h[w][:,np.newaxis]
+                    h00 = (1.0 + 2.0*theta)*(1.0 - theta)**2
+                    h10 = theta*(1.0 - theta)**2
+                    h01 = theta*theta*(3.0 - 2.0*theta)
+                    h11 = theta*theta*(theta - 1.0)
+                    uWrite = (h00*U0[w] + (h10*hw)*F0[w]
+                              + h01*U1[w] + (h11*hw)*F1[w])
+                    outMgr.write(acc[w], outMgr.tNextWrite[acc[w]], uWrite)
+                    w = outMgr.needToWrite(t0, h, acc)
+
+                U[acc] = U1
+                F[acc] = F1
+                t[acc] = np.where(hitEnd[accept], tStop, t0 + h)
+                steps[acc] += 1
+                dt[acc] = np.clip(dtNew[accept], minStepsize, maxStepsize)
+
+            # Drop members that are done
+            stillGoing = ((t[active] < tStop) & (steps[active] < maxSteps)
+                          & ~outMgr.isDone(active))
+            active = active[stillGoing]
+
+        # Fill in the final value for any member whose last output time
+        # was lost to roundoff
+        short = everyone[(outMgr.writeIndex == outMgr.nReport)
+                         & (t >= tStop)]
+        if len(short) > 0:
+            outMgr.write(short, t[short], U[short])
+
+        if verb>=2:
+            print('Done ensemble time integration')
+            print('\tNum members          %d' % M)
+            print('\tNum batched steps    %d' % numBatches)
+            print('\tMean steps/member    %g' % np.mean(steps))
+            print('\tMean evals/member    %g' % np.mean(numEvals))
+
+        stat = {
+            'NSteps' : steps,
+            'NEval'  : numEvals,
+            'NBatch' : numBatches
+            }
+
+        return stat
+
+
+
+if __name__=='__main__':
+
+    # Harmonic oscillators with a range of frequencies
+    omega = np.linspace(0.5, 2.0, 8)
+
+    def fTest(U, t, members):
+        w = omega[members]
+        return np.column_stack((U[:,1], -w*w*U[:,0]))
+
+    tInit = 0.0
+    tFinal = 5.0
+    nReport = 10
+    UInit = np.column_stack((np.ones(len(omega)), np.zeros(len(omega))))
+
+    driver = EnsembleRKDriver(DormandPrinceStepper(), {'Tolerance' : 1.0e-8})
+    outMgr = EnsembleStorageOutputManager([tInit, tFinal], UInit, nReport)
+    stat = driver.runStepper(fTest, [tInit, tFinal], UInit, outMgr)
+
+    tVals = outMgr.tVals
+    err = np.abs(outMgr.uStore[:,:,0] - np.cos(omega[:,np.newaxis]*tVals))
+    print('max error = ', np.amax(err))
+    print('steps per member = ', stat['NSteps'])
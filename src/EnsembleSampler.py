@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+
+import numpy as np
+from math import inf
+from SettingsHandler import *
+from Logger import *
+from RandomStreams import *
+from ChainDiagnostics import *
+
+
+# Affine-invariant ensemble sampler with the stretch move (Goodman and
+# Weare, CAMCoS 5(1), 2010; as in emcee). It keeps 'Num Walkers' walkers
+# in theta = log f, like the proposal generators, as one (walkers x Nx)
+# array. Each step updates the two halves of the ensemble in turn: every
+# walker x_k in one half picks a walker x_j from the other and proposes
+#     y = x_j + z (x_k - x_j),   z ~ g(z) ~ 1/sqrt(z) on [1/a, a]
+# with a the 'Stretch Scale', accepted with probability
+#     min(1, z^(Nx-1) p(y)/p(x_k)).
+# The proposals for a half are made together and their likelihoods
+# computed with one call to the model manager's loglikelihoodBlock().
+# Because the moves follow the spread of the ensemble, strongly
+# correlated parameters, like neighbouring spline weights, are no harder
+# to sample than independent ones.
+#
+# The target is the one GradientMHSampler uses: zero outside the
+# proposal generator's logBounds() box if it has one, and the likelihood
+# inside it, times the generator's logPrior() if 'Use Prior' is set. The
+# target is written to the log at the start of the run. The walkers
+# start from the proposal generator's draws around its getInit().
+#
+# 'Burn Length' and 'Decorrelation Length' count ensemble steps. After
+# burn-in, every walker's position after each 'Decorrelation Length'
+# steps is a retained sample, run through the model and handed to the
+# sample handler, until there are 'Num Samples' of them. With no
+# 'Num Walkers', there are twice as many walkers as parameters.
+
+class EnsembleSampler:
+    defaultSettings = {
+        'Num Samples' : 100,
+        'Num Walkers' : None,
+        'Stretch Scale' : 2.0,
+        'Burn Length' : 200,
+        'Decorrelation Length' : 5,
+        'Output Interval' : 10,
+        'Warning on Run Failure' : True,
+        'Abort on Run Failure' : False,
+        'Use Prior' : False,
+        'Verbosity' : 2
+        }
+
+    def __init__(self,
+                 modelMgr,
+                 proposalGenerator,
+                 sampleHandler,
+                 settings,
+                 rng = None):
+        self.modelMgr = modelMgr
+        self.proposalGenerator = proposalGenerator
+        self.sampleHandler = sampleHandler
+        self.settings = mergeSettings(self.defaultSettings, settings)
+        if rng is None:
+            rng = BufferedRNG()
+        self.rng = rng
+        if hasattr(proposalGenerator, 'setRNG'):
+            proposalGenerator.setRNG(rng)
+
+        self.bounds = None
+        if hasattr(proposalGenerator, 'logBounds'):
+            self.bounds = proposalGenerator.logBounds()
+        self.logPrior = None
+        if self.settings['Use Prior']:
+            if not hasattr(proposalGenerator, 'logPrior'):
+                raise RuntimeError('EnsembleSampler: the proposal generator '
+                                   'has no prior to use')
+            self.logPrior = proposalGenerator.logPrior
+
+    def run(self):
+
+        numSamples = self.settings['Num Samples']
+        outputInterval = self.settings['Output Interval']
+        verb = self.settings['Verbosity']
+
+        if verb > 0:
+            Logger.write('EnsembleSampler target: %s'
+                         % ('likelihood times the proposal generator\'s prior'
+                            if self.logPrior is not None else 'likelihood'))
+        self.startEnsemble()
+        self.sampleHandler.preprocess()
+        self.burnIn()
+
+        if verb > 0:
+            Logger.write('Starting main sample loop with numSamples=%d, '
+                         '%d walkers' % (numSamples, len(self.theta)))
+
+        samples = 0
+        retained = 0
+        while samples < numSamples:
+            block = self.nextRetained()[:numSamples - samples]
+            samples += self.runBlock(block)
+            retained += 1
+            if retained % outputInterval == 0:
+                Logger.write('sample #%d, acceptance fraction %g'
+                             % (samples, self.acceptanceFraction()))
+                self.sampleHandler.report()
+
+        if verb > 0:
+            Logger.write('Done main sampling loop')
+        self.report()
+        self.sampleHandler.postprocess()
+
+    # Spread the walkers out around the proposal generator's starting
+    # point and compute their log-posteriors
+    def startEnsemble(self):
+
+        fInit = np.asarray(self.proposalGenerator.getInit(), dtype=float)
+        numWalkers = self.settings['Num Walkers']
+        if numWalkers is None:
+            numWalkers = 2*len(fInit)
+        if numWalkers < 4 or numWalkers % 2 != 0:
+            raise RuntimeError('EnsembleSampler needs an even number of '
+                               'walkers, at least 4; got %d' % numWalkers)
+
+        if hasattr(self.proposalGenerator, 'proposals'):
+            f = self.proposalGenerator.proposals(fInit, numWalkers)
+        else:
+            f = np.array([self.proposalGenerator.proposal(fInit)
+                          for i in range(numWalkers)])
+        self.theta = np.log(f)
+        self.logP, self.logL = self.logPosterior(self.theta)
+
+        self.stats = {
+            'Steps' : 0,
+            'Accepts' : 0,
+            'Rejects' : 0,
+            'Burn Accepts' : 0,
+            'Burn Rejects' : 0,
+            'Run Failures' : 0
+            }
+        self.retainedLogL = []
+
+    # Log-posteriors and log-likelihoods for each row of a block of theta
+    # values. Rows outside the bounding box, or whose likelihood can't be
+    # computed, get -inf.
+    def logPosterior(self, theta):
+
+        logL = np.full(len(theta), -inf)
+        inside = np.ones(len(theta), dtype=bool)
+        if self.bounds is not None:
+            a, b = self.bounds
+            inside = np.all((theta >= a) & (theta <= b), axis=1)
+
+        if np.any(inside):
+            f = np.exp(theta[inside])
+            try:
+                logL[inside] = self.modelMgr.loglikelihoodBlock(f)
+            except (RuntimeError, ArithmeticError):
+                logL[inside] = [self.safeLogLikelihood(p) for p in f]
+
+        logP = np.copy(logL)
+        if self.logPrior is not None and np.any(inside):
+            logP[inside] += self.logPrior(theta[inside])[0]
+        return logP, logL
+
+    def safeLogLikelihood(self, params):
+        try:
+            return self.modelMgr.loglikelihood(params)
+        except (RuntimeError, ArithmeticError):
+            return -inf
+
+    # One stretch move for each half of the ensemble in turn. Returns
+    # the number of walkers that moved.
+    def step(self):
+
+        numWalkers, d = self.theta.shape
+        half = numWalkers//2
+        a = self.settings['Stretch Scale']
+        moved = 0
+
+        for first, other in ((slice(0, half), slice(half, None)),
+                             (slice(half, None), slice(0, half))):
+            x = self.theta[first]
+            partners = self.theta[other]
+            u = self.rng.uniforms(3*half).reshape(3, half)
+
+            z = ((a - 1.0)*u[0] + 1.0)**2/a
+            j = np.minimum((u[1]*len(partners)).astype(int),
+                           len(partners) - 1)
+            y = partners[j] + z[:,None]*(x - partners[j])
+
+            logPNew, logLNew = self.logPosterior(y)
+            with np.errstate(invalid='ignore'):
+                logRatio = (d - 1)*np.log(z) + logPNew - self.logP[first]
+            # Walkers stuck at zero likelihood take any proposal with a
+            # nonzero one, as in MHSampler
+            stuck = self.logP[first] == -inf
+            accept = (np.log(u[2]) < logRatio) | (stuck & (logPNew > -inf))
+
+            idx = np.arange(numWalkers)[first][accept]
+            self.theta[idx] = y[accept]
+            self.logP[idx] = logPNew[accept]
+            self.logL[idx] = logLNew[accept]
+            moved += int(np.sum(accept))
+
+        self.stats['Steps'] += 1
+        return moved
+
+    def burnIn(self):
+
+        burnLength = self.settings['Burn Length']
+        numWalkers = len(self.theta)
+        if self.settings['Verbosity'] > 0:
+            Logger.write('Starting burn-in phase with burnLength=%d'
+                         % burnLength)
+        for i in range(burnLength):
+            moved = self.step()
+            self.stats['Burn Accepts'] += moved
+            self.stats['Burn Rejects'] += numWalkers - moved
+        if self.settings['Verbosity'] > 0:
+            Logger.write('Burn in phase done: acceptance fraction %g'
+                         % (self.stats['Burn Accepts']
+                            /max(burnLength*numWalkers, 1)))
+
+    # Advance the ensemble by 'Decorrelation Length' steps and return the
+    # walkers' parameters, one per row
+    def nextRetained(self):
+
+        numWalkers = len(self.theta)
+        for i in range(self.settings['Decorrelation Length']):
+            moved = self.step()
+            self.stats['Accepts'] += moved
+            self.stats['Rejects'] += numWalkers - moved
+        self.retainedLogL.append(np.copy(self.logL))
+        return np.exp(self.theta)
+
+    # Run the model for a block of retained samples and hand the results
+    # to the sample handler. Returns the number processed.
+    def runBlock(self, block):
+
+        try:
+            if hasattr(self.modelMgr, 'runBlock'):
+                results = self.modelMgr.runBlock(block)
+                for params, res in zip(block, results):
+                    self.sampleHandler.process(self.modelMgr, params, res)
+                return len(block)
+        except (RuntimeError, ArithmeticError):
+            # Fall back to one at a time, to find the ones that fail
+            pass
+
+        done = 0
+        for params in block:
+            try:
+                results = self.modelMgr.run(params)
+            except (RuntimeError, ArithmeticError) as e:
+                if self.settings['Abort on Run Failure']:
+                    raise e
+                if self.settings['Warning on Run Failure']:
+                    Logger.write('EnsembleSampler Warning: run failed with error {}'.format(e))
+                self.stats['Run Failures'] += 1
+                continue
+            self.sampleHandler.process(self.modelMgr, params, results)
+            done += 1
+        return done
+
+    # Fraction of walker moves accepted in the main sampling loop
+    def acceptanceFraction(self):
+        tries = self.stats['Accepts'] + self.stats['Rejects']
+        return self.stats['Accepts']/max(tries, 1)
+
+    # Acceptance fraction, and the ESS of each walker's log-likelihood
+    # over the retained ensembles, summed over the walkers
+    def report(self):
+
+        if self.settings['Verbosity'] <= 0:
+            return
+        Logger.write('EnsembleSampler: %d steps of %d walkers, acceptance '
+                     'fraction %g'
+                     % (self.stats['Steps'], len(self.theta),
+                        self.acceptanceFraction()))
+        if len(self.retainedLogL) >= 4:
+            ess = effectiveSampleSize(np.array(self.retainedLogL))
+            Logger.write('%d retained ensembles: ESS %g for log-likelihood'
+                         % (len(self.retainedLogL), np.nansum(ess)))
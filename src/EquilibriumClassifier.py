@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+import numpy as np
+from SettingsHandler import *
+from Chemostat import *
+
+
+# Result of a run with the equilibrium classifier turned on. label is
+# 'LP' or 'LC' if the classifier was confident, None if not. U holds the
+# stored trajectory if the model was integrated, either as a fallback
+# or as a spot check on the classifier; otherwise it's None.
+class EquilibriumResult:
+    def __init__(self, label, U=None):
+        self.label = label
+        self.U = U
+
+
+# Classify a chemostat's long-time behavior from its equilibria rather
+# than by integration. If there's exactly one interior equilibrium, its
+# stability (from the eigenvalues of the Jacobian) decides between a limit
+# point and a limit cycle. If there's no interior equilibrium the predator
+# dies out, and the run goes to a limit point if the boundary equilibrium
+# is stable. Cases with several interior equilibria, or with an
+# eigenvalue whose real part is within 'Eigenvalue Margin' of zero, are
+# left unclassified so that the caller can fall back to integration.
+# The margin also screens out equilibria that are stable but too weakly
+# attracting for an integration to settle on them within the run time.
+#
+# If 'Check Interval' is k > 0, every k-th confidently classified sample
+# is flagged for integration as well so that the agreement rate can be
+# monitored.
+
+class EquilibriumClassifier:
+    defaults = {
+        'Eigenvalue Margin' : 0.01,
+        'Root Scan Points' : 256,
+        'Check Interval' : 0
+        }
+
+    def __init__(self, settings = defaults):
+        self.settings = mergeSettings(EquilibriumClassifier.defaults, settings)
+        self.margin = self.settings['Eigenvalue Margin']
+        self.nScan = self.settings['Root Scan Points']
+        self.checkInterval = self.settings['Check Interval']
+        self.numConfident = 0
+
+    # Return 'LP', 'LC', or None if the case is ambiguous
+    def classify(self, chemostat):
+
+        eqs = chemostat.interiorEquilibria(self.nScan)
+
+        if len(eqs) > 1:
+            return None
+
+        if len(eqs) == 1:
+            lam = self.maxRealEigenvalue(chemostat, eqs[0])
+            if lam < -self.margin:
+                return 'LP'
+            if lam > self.margin:
+                return 'LC'
+            return None
+
+        u = chemostat.boundaryEquilibrium()
+        if self.maxRealEigenvalue(chemostat, u) < -self.margin:
+            return 'LP'
+        return None
+
+    def maxRealEigenvalue(self, chemostat, u):
+        return np.amax(np.real(np.linalg.eigvals(chemostat.jacobian(u))))
+
+    # Decide whether a confidently classified sample should also be
+    # integrated as a check
+    def checkThisOne(self):
+        self.numConfident += 1
+        return (self.checkInterval > 0
+                and self.numConfident % self.checkInterval == 0)
+
+
+
+if __name__=='__main__':
+
+    u0 = np.array([40.0, 10.0, 40.0])
+    driver = StepDoublingDriver(HeunStepper())
+    classifier = EquilibriumClassifier()
+
+    for g in (TanhModel(), HollingModel(), IvlevModel()):
+        for D in (0.03, 0.05, 0.07, 0.09):
+            chemostat = Chemostat(g, D)
+            label = classifier.classify(chemostat)
+            U = chemostat.run(driver, 1000, 0.0, 1000.0, u0)
+            intLabel = 'LP' if goingToLimitPoint(U, 100, 0.01) else 'LC'
+            print('%s D=%g: equilibria=%s classifier=%s integration=%s'
+                  % (g.name(), D, chemostat.interiorEquilibria(), label,
+                     intLabel))
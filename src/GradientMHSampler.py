@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+
+import numpy as np
+from math import exp, sqrt, log, inf, isfinite
+from SettingsHandler import *
+from Logger import *
+from MHSampler import *
+
+
+# Base class for samplers that use the gradient of the log-likelihood,
+# from the model manager's loglikelihoodGradient(). They work in
+# theta = log f, like the proposal generators, and have the same
+# modelMgr/sampleHandler contract as MHSampler. The proposal generator is
+# only used for the starting point and the prior on theta: through its
+# logBounds() method if it has one, a box outside which the target is
+# zero, and with 'Use Prior' set, its logPrior(). Without 'Use Prior' the
+# target is the likelihood alone, as for the other samplers, so the
+# LP/LC fractions are comparable with theirs. The target is written to
+# the log when the chain starts.
+#
+# During burn-in the step size is adapted, by a Robbins-Monro step on
+# its log, to give 'Target Acceptance'. If 'Adapt Mass' is set, the
+# proposals are also scaled in each component by the variance of theta
+# over burn-in so far, updated at 100, 200, 400, ... burn-in steps and
+# shrunk towards 1 as in Stan. Both are fixed from then on.
+#
+# Subclasses implement propose(), returning the new theta, its
+# log-posterior, gradient and log-likelihood, and the log of the MH
+# acceptance ratio.
+
+class GradientMHSampler(MHSampler):
+    usesPrior = True
+
+    defaultSettings = dict(MHSampler.defaultSettings)
+    defaultSettings.update({
+        'Step Size' : 0.1,
+        'Target Acceptance' : 0.6,
+        'Adapt Mass' : True
+        })
+
+    def __init__(self,
+                 modelMgr,
+                 proposalGenerator,
+                 sampleHandler,
+                 settings,
+                 fInit = None,
+                 rng = None):
+        MHSampler.__init__(self, modelMgr, proposalGenerator, sampleHandler,
+                           settings, fInit, rng)
+        if not modelMgr.hasGradient():
+            raise RuntimeError('%s needs a model manager with a '
+                               'log-likelihood gradient'
+                               % type(self).__name__)
+        self.bounds = None
+        if hasattr(proposalGenerator, 'logBounds'):
+            self.bounds = proposalGenerator.logBounds()
+        self.logPrior = None
+        if self.settings['Use Prior']:
+            if not hasattr(proposalGenerator, 'logPrior'):
+                raise RuntimeError('%s: the proposal generator has no '
+                                   'prior to use' % type(self).__name__)
+            self.logPrior = proposalGenerator.logPrior
+
+    # Log-posterior and its gradient with respect to theta. The
+    # log-likelihood alone is kept in logLPrev, so the retained samples'
+    # diagnostics match the other samplers'.
+    def logTarget(self, theta):
+        if self.bounds is not None:
+            a, b = self.bounds
+            if np.any(theta < a) or np.any(theta > b):
+                return -inf, None, -inf
+        f = np.exp(theta)
+        logL, grad = self.modelMgr.loglikelihoodGradient(f)
+        logP = logL
+        grad = grad*f
+        if self.logPrior is not None:
+            logPrior, priorGrad = self.logPrior(theta)
+            logP += logPrior
+            grad = grad + priorGrad
+        return logP, grad, logL
+
+    def startChain(self):
+        MHSampler.startChain(self)
+        if self.settings['Verbosity'] > 0:
+            Logger.write('%s target: %s' % (type(self).__name__,
+                         'likelihood times the proposal generator\'s prior'
+                         if self.logPrior is not None else 'likelihood'))
+        self.theta = np.log(self.fPrev)
+        self.logPPrev, self.gradPrev, self.logLPrev = self.logTarget(self.theta)
+
+        d = len(self.theta)
+        self.logStepSize = log(self.settings['Step Size'])
+        self.mass = np.ones(d)
+        self.adapting = True
+        self.numAdapt = 0
+        self.mean = np.zeros(d)
+        self.M2 = np.zeros(d)
+        self.nextMassUpdate = 100
+
+    def step(self):
+
+        try:
+            theta, logP, grad, logL, logRatio = self.propose()
+        except (RuntimeError, ArithmeticError) as e:
+            if self.settings['Abort on Proposal Failure']:
+                raise RuntimeError('MHSampler: proposal failed with error {}'.format(e))
+            if self.settings['Warning on Proposal Failure']:
+                Logger.write('MHSampler Warning: Likelihood calculation failed with error {}'.format(e))
+            return None
+
+        alpha = exp(min(logRatio, 0.0)) if isfinite(logRatio) else 0.0
+        accepted = self.rng.random() < alpha
+        if accepted:
+            self.theta = theta
+            self.fPrev = np.exp(theta)
+            self.logPPrev = logP
+            self.gradPrev = grad
+            self.logLPrev = logL
+
+        if self.adapting:
+            self.adapt(alpha)
+        return accepted
+
+    # Kinetic or proposal noise for the current mass: z*sqrt(mass) for
+    # standard normal z
+    def noise(self):
+        return self.rng.standard_normal(len(self.theta))*np.sqrt(self.mass)
+
+    def stepSize(self):
+        return exp(self.logStepSize)
+
+    def adapt(self, alpha):
+
+        self.numAdapt += 1
+        n = self.numAdapt
+        self.logStepSize += (alpha - self.settings['Target Acceptance'])/sqrt(n)
+
+        if not self.settings['Adapt Mass']:
+            return
+        delta = self.theta - self.mean
+        self.mean += delta/n
+        self.M2 += delta*(self.theta - self.mean)
+        if n == self.nextMassUpdate:
+            var = self.M2/(n - 1)
+            self.mass = (n/(n + 5.0))*var + 1.0e-3*(5.0/(n + 5.0))
+            self.nextMassUpdate *= 2
+
+    def burnIn(self):
+        MHSampler.burnIn(self)
+        self.adapting = False
+        if self.settings['Verbosity'] > 0:
+            Logger.write('%s adapted over %d steps: step size %g, mass '
+                         'scales from %g to %g'
+                         % (type(self).__name__, self.numAdapt,
+                            self.stepSize(), np.min(self.mass),
+                            np.max(self.mass)))
+
+    def chainState(self):
+        state = MHSampler.chainState(self)
+        state['Gradient'] = {
+            'theta' : np.copy(self.theta),
+            'grad' : np.copy(self.gradPrev),
+            'Log Posterior' : self.logPPrev,
+            'Log Step Size' : self.logStepSize,
+            'Mass' : np.copy(self.mass),
+            'Adapting' : self.adapting,
+            'Num Adapt' : self.numAdapt,
+            'Mean' : np.copy(self.mean),
+            'M2' : np.copy(self.M2),
+            'Next Mass Update' : self.nextMassUpdate
+            }
+        return state
+
+    def restoreChain(self, state, restoreRNG=True):
+        MHSampler.restoreChain(self, state, restoreRNG)
+        g = state['Gradient']
+        self.theta = np.copy(g['theta'])
+        self.gradPrev = np.copy(g['grad'])
+        self.logPPrev = g['Log Posterior']
+        self.logStepSize = g['Log Step Size']
+        self.mass = np.copy(g['Mass'])
+        self.adapting = g['Adapting']
+        self.numAdapt = g['Num Adapt']
+        self.mean = np.copy(g['Mean'])
+        self.M2 = np.copy(g['M2'])
+        self.nextMassUpdate = g['Next Mass Update']
+
+
+# Metropolis-adjusted Langevin: propose
+#     theta' = theta + (eps^2/2) M grad + eps sqrt(M) z
+# with M the diagonal mass scaling, and correct for the asymmetry of the
+# proposal in the acceptance test
+
+class MALASampler(GradientMHSampler):
+    defaultSettings = dict(GradientMHSampler.defaultSettings)
+    defaultSettings.update({
+        'Target Acceptance' : 0.574
+        })
+
+    def propose(self):
+
+        eps = self.stepSize()
+        m = self.mass
+        theta = self.theta
+
+        mean = theta + 0.5*eps**2*m*self.gradPrev
+        thetaNew = mean + eps*self.noise()
+        logPNew, gradNew, logLNew = self.logTarget(thetaNew)
+        if logPNew == -inf:
+            return thetaNew, logPNew, gradNew, logLNew, -inf
+
+        meanRev = thetaNew + 0.5*eps**2*m*gradNew
+        logqFwd = -np.sum((thetaNew - mean)**2/m)/(2*eps**2)
+        logqRev = -np.sum((theta - meanRev)**2/m)/(2*eps**2)
+        logRatio = logPNew - self.logPPrev + logqRev - logqFwd
+        return thetaNew, logPNew, gradNew, logLNew, logRatio
+
+
+# Hamiltonian Monte Carlo with 'Num Leapfrog Steps' leapfrog steps per
+# proposal. Momenta have covariance M^-1, so the position moves by
+# eps M p per step. Trajectories that leave the bounding box are
+# rejected.
+
+class HMCSampler(GradientMHSampler):
+    defaultSettings = dict(GradientMHSampler.defaultSettings)
+    defaultSettings.update({
+        'Target Acceptance' : 0.65,
+        'Num Leapfrog Steps' : 10
+        })
+
+    def propose(self):
+
+        eps = self.stepSize()
+        m = self.mass
+
+        theta = self.theta
+        p = self.noise()/m
+        H0 = -self.logPPrev + 0.5*np.sum(m*p*p)
+
+        grad = self.gradPrev
+        p = p + 0.5*eps*grad
+        numSteps = self.settings['Num Leapfrog Steps']
+        for i in range(numSteps):
+            theta = theta + eps*m*p
+            logP, grad, logL = self.logTarget(theta)
+            if logP == -inf:
+                return theta, logP, grad, logL, -inf
+            if i < numSteps - 1:
+                p = p + eps*grad
+        p = p + 0.5*eps*grad
+
+        H1 = -logP + 0.5*np.sum(m*p*p)
+        return theta, logP, grad, logL, H0 - H1
@@ -1,6 +1,7 @@
 import numpy as np
 from Logger import *
 from MHSampleHandlerBase import *
+from EquilibriumClassifier import *
 
 class LimitPointSampleHandler(MHSampleHandlerBase):
 
@@ -15,9 +16,16 @@ class LimitPointSampleHandler(MHSampleHandlerBase):
         self.limitPointParams = []
         self.limitCycleParams = []
 
+        # Counts for runs classified through the equilibrium classifier
+        self.numFastPath = 0
+        self.numFallback = 0
+        self.numChecked = 0
+        self.numAgreed = 0
+
     def preprocess(self):
         pass
 
+    # Returns True if the sample went to a limit point
     def process(self, modelMgr, params, results):
 
         self.sampleCount += 1
@@ -26,7 +34,8 @@ class LimitPointSampleHandler(MHSampleHandlerBase):
             Logger.write('limit points = %d of %d' % (self.limitPointCount, self.sampleCount))
 
         if True:
-            if self.goingToLimitPoint(results):
+            isLP = self.isLimitPoint(results)
+            if isLP:
                 self.limitPointCount += 1
                 self.limitPointParams.append(params)
             else:
@@ -35,9 +44,64 @@ class LimitPointSampleHandler(MHSampleHandlerBase):
         if False:
             self.limitPointParams.append(params)
 
+        return isLP
+
+    # Only the last 'Num Steps To Check' stored points of a trajectory are
+    # used to classify it
+    def reduceResults(self, results):
+        if isinstance(results, EquilibriumResult):
+            if results.U is None:
+                return results
+            return EquilibriumResult(results.label,
+                                     results.U[-self.numLimPtCheck:])
+        return results[-self.numLimPtCheck:]
+
+    # Counts and accumulated parameters, for sampler checkpoints
+    def checkpointState(self):
+        return {
+            'Counts' : (self.limitPointCount, self.sampleCount,
+                        self.numFastPath, self.numFallback,
+                        self.numChecked, self.numAgreed),
+            'Limit Point Params' : np.array(self.limitPointParams),
+            'Limit Cycle Params' : np.array(self.limitCycleParams)
+            }
+
+    def restoreState(self, state):
+        (self.limitPointCount, self.sampleCount,
+         self.numFastPath, self.numFallback,
+         self.numChecked, self.numAgreed) = state['Counts']
+        self.limitPointParams = list(state['Limit Point Params'])
+        self.limitCycleParams = list(state['Limit Cycle Params'])
+
     def report(self):
         Logger.write('num LP: %d, num LC: %d' %
               (len(self.limitPointParams), len(self.limitCycleParams)))
+        if self.numFastPath + self.numFallback + self.numChecked > 0:
+            Logger.write('equilibrium classifier: fast=%d, fallback=%d, '
+                         'checked=%d, agreed=%d' %
+                         (self.numFastPath, self.numFallback,
+                          self.numChecked, self.numAgreed))
+
+    # Decide from a run's results whether it went to a limit point. If
+    # the run was integrated, the trajectory decides, and is compared with
+    # the equilibrium classifier's answer when there is one.
+    def isLimitPoint(self, results):
+
+        if not isinstance(results, EquilibriumResult):
+            return self.goingToLimitPoint(results)
+
+        if results.U is None:
+            self.numFastPath += 1
+            return results.label=='LP'
+
+        isLP = self.goingToLimitPoint(results.U)
+        if results.label is None:
+            self.numFallback += 1
+        else:
+            self.numChecked += 1
+            if (results.label=='LP') == isLP:
+                self.numAgreed += 1
+        return isLP
 
 
 
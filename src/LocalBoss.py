@@ -0,0 +1,166 @@
+import multiprocessing
+import logging
+import os
+import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from TaskManifest import *
+
+
+# The Function for this worker process, set up by initWorker()
+workerFunction = None
+
+def initWorker(func):
+    global workerFunction
+    workerFunction = func
+
+# Run one task in a worker process. Like Worker, this returns
+# ('RESULT', result), or ('ERROR', traceback) if the function raised.
+def runTask(arg):
+    try:
+        return ('RESULT', workerFunction.run(arg))
+    except Exception:
+        return ('ERROR', traceback.format_exc())
+
+
+class LocalBoss:
+
+    # Runs the same Function and ResultAnalyzer pairs as Boss and Worker,
+    # on a pool of numWorkers processes on this machine, without MPI. Each
+    # process gets its own copy of func, which it keeps for all its
+    # tasks. The processes are started from a fork server that has
+    # already imported the modules in preload and the one defining func,
+    # so they don't import numpy and the rest themselves.
+    #
+    # As with Boss, each worker is kept tasksPerWorker tasks ahead, and
+    # results reach the analyzer as they come in, in no particular
+    # order. Failed tasks are retried up to maxRetries times and listed
+    # in failedTasks if they still fail, and the manifest works as for
+    # Boss. There is no timeout, since a stuck process can't be taken
+    # back from the pool. If a process dies, the pool is replaced; tasks
+    # that finished before it broke are kept, and every other task it had
+    # is retried, since there's no telling which one was at fault.
+    defaultPreload = ('numpy', 'scipy', 'matplotlib')
+
+    def __init__(self, taskInputs, analyzer, func, numWorkers=None,
+            logLevel=logging.INFO, tasksPerWorker=2, maxRetries=2,
+            manifest=None, preload=defaultPreload):
+
+        self.taskArgList = taskInputs
+        self.analyzer = analyzer
+        self.func = func
+        if numWorkers is None:
+            numWorkers = os.cpu_count()
+        self.numWorkers = numWorkers
+        self.tasksPerWorker = tasksPerWorker
+        self.maxRetries = maxRetries
+        self.manifestName = manifest
+        self.preload = list(preload)
+        self.failedTasks = []
+        logging.basicConfig(format='[Boss] %(message)s',
+            level=logLevel)
+
+    def loop(self):
+
+        # Tasks are known by their index in the list of args. Pass the
+        # results of tasks done in an earlier run straight on.
+        args = list(self.taskArgList)
+        manifest = None
+        if self.manifestName is not None:
+            manifest = TaskManifest(self.manifestName)
+        done = [False]*len(args)
+        if manifest is not None:
+            for taskId, arg in enumerate(args):
+                if manifest.isDone(arg):
+                    self.analyzer.acceptResult(manifest.result(arg))
+                    done[taskId] = True
+            logging.info('{} of {} tasks done in an earlier run'
+                .format(sum(done), len(args)))
+
+        taskQ = deque(i for i in range(len(args)) if not done[i])
+        attempts = [0]*len(args)
+        self.failedTasks = []
+
+        context = self.makeContext()
+
+        # Each pass starts a pool and runs until everything is done, or
+        # until a worker process dies and breaks the pool
+        while len(taskQ) > 0:
+            pending = {}
+            with ProcessPoolExecutor(self.numWorkers, mp_context=context,
+                                     initializer=initWorker,
+                                     initargs=(self.func,)) as pool:
+                try:
+                    while len(taskQ) > 0 or len(pending) > 0:
+                        while (len(taskQ) > 0 and len(pending)
+                               < self.tasksPerWorker*self.numWorkers):
+                            # Only taken off the queue once submitted,
+                            # as submit() raises if the pool has broken
+                            taskId = taskQ[0]
+                            logging.debug('submitting args {}'
+                                .format(args[taskId]))
+                            future = pool.submit(runTask, args[taskId])
+                            taskQ.popleft()
+                            pending[future] = taskId
+
+                        finished, notDone = wait(pending,
+                                                 return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            reply = future.result()
+                            taskId = pending.pop(future)
+                            self.handleReply(taskId, reply, args, done,
+                                             attempts, taskQ, manifest)
+                except BrokenProcessPool:
+                    logging.warning('a worker process died; retrying the '
+                                    'tasks its pool hadn\'t finished')
+                    for future, taskId in pending.items():
+                        if future.done() and future.exception() is None:
+                            self.handleReply(taskId, future.result(), args,
+                                             done, attempts, taskQ, manifest)
+                        else:
+                            self.retry(taskId, 'Worker process died',
+                                       attempts, taskQ)
+
+        if manifest is not None:
+            manifest.close()
+        self.failedTasks = [(args[i], err) for i, err in self.failedTasks]
+        logging.debug('Boss shutting down')
+
+    # Pass on the result of a finished task, or retry it if it failed
+    def handleReply(self, taskId, reply, args, done, attempts, taskQ,
+                    manifest):
+
+        kind, result = reply
+        if kind=='RESULT':
+            done[taskId] = True
+            if manifest is not None:
+                manifest.record(args[taskId], result)
+            self.analyzer.acceptResult(result)
+        else:
+            logging.warning('task {} failed:\n{}'
+                .format(args[taskId], result))
+            self.retry(taskId, result, attempts, taskQ)
+
+    # Put a task that failed back on the queue, unless it has had all
+    # its tries
+    def retry(self, taskId, error, attempts, taskQ):
+
+        attempts[taskId] += 1
+        if attempts[taskId] > self.maxRetries:
+            logging.error('giving up on task {} after {} tries'
+                .format(self.taskArgList[taskId], attempts[taskId]))
+            self.failedTasks.append((taskId, error))
+        else:
+            taskQ.append(taskId)
+
+    # Fork server context with the modules preloaded, where the platform
+    # has one
+    def makeContext(self):
+
+        if 'forkserver' not in multiprocessing.get_all_start_methods():
+            return multiprocessing.get_context()
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(self.preload
+                                       + [type(self.func).__module__])
+        return context
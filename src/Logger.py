@@ -10,8 +10,8 @@ class Logger:
     stdOut = True
 
     @classmethod
-    def openLog(cls, name='run', inputs=None, stdOut=True):
-        cls.file = open('%s' % name, 'w')
+    def openLog(cls, name='run', inputs=None, stdOut=True, mode='w'):
+        cls.file = open('%s' % name, mode)
         cls.stdOut = stdOut
         cls.ppf = pprint.PrettyPrinter(indent=2, stream=cls.file)
         cls.pps = pprint.PrettyPrinter(indent=2)
@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 
 import abc
+import numpy as np
+from math import exp
 
 ###################################################################
 # Base class for model management objects to be used in
@@ -11,11 +13,32 @@ class MHModelManagerBase(metaclass=abc.ABCMeta):
     def __init__(self):
         pass
         
-    # Compute likelihood of model for a given parameter set
+    # Compute the log-likelihood of the model for a given parameter set
     @abc.abstractmethod
-    def likelihood(self, params):
+    def loglikelihood(self, params):
         pass
 
+    # Compute likelihood of model for a given parameter set
+    def likelihood(self, params):
+        return exp(self.loglikelihood(params))
+
+    # Compute log-likelihoods for each row of a block of parameters. Model
+    # managers that can do this faster than one at a time override it.
+    def loglikelihoodBlock(self, paramBlock):
+        return np.array([self.loglikelihood(p) for p in paramBlock])
+
+    def likelihoodBlock(self, paramBlock):
+        return np.exp(self.loglikelihoodBlock(paramBlock))
+
+    # Model managers that can compute the gradient of the log-likelihood
+    # say so here, and return (log-likelihood, gradient) from
+    # loglikelihoodGradient()
+    def hasGradient(self):
+        return False
+
+    def loglikelihoodGradient(self, params):
+        raise RuntimeError('Model manager has no log-likelihood gradient')
+
     # Run a model with the specified parameters. This should return
     # whatever information is needed to compute this run's
     # contribution to the integral
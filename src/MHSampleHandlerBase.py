@@ -21,6 +21,19 @@ class MHSampleHandlerBase(metaclass=abc.ABCMeta):
     def process(self, modelMgr, params, results):
         pass
 
+    # Cut a run's results down to what process() needs, before they are
+    # sent between processes. The default keeps everything.
+    def reduceResults(self, results):
+        return results
+
+    # State to save in a sampler checkpoint, and restore it on resuming.
+    # The default saves nothing.
+    def checkpointState(self):
+        return None
+
+    def restoreState(self, state):
+        pass
+
     # Callback for optional post-processing step. Default
     # implementation is a no-op
     def postprocess(self):
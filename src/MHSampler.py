@@ -1,13 +1,45 @@
 #!/usr/bin/env python
 
 import numpy as np
+from time import perf_counter
 from SettingsHandler import *
 from Logger import *
 from string import *
+from math import exp, inf
+from Checkpoint import *
+from RandomStreams import *
+from ChainDiagnostics import *
 
 
 
+# Check that MH Control settings pick at most one of the samplers built
+# on MHSampler, and only a gradient method there is one of, so that no
+# setting is silently ignored when the sampler is chosen
+def checkSamplerChoice(settings):
+
+    method = settings.get('Gradient Method')
+    if method not in (None, 'MALA', 'HMC'):
+        raise RuntimeError('Unknown gradient method %r: use \'MALA\' or '
+                           '\'HMC\'' % (method,))
+
+    chosen = [key for key, isSet in (
+        ('Num Chains', settings.get('Num Chains', 1) > 1),
+        ('Gradient Method', method is not None),
+        ('Num Tries', settings.get('Num Tries', 1) > 1),
+        ('Speculative', settings.get('Speculative', False)),
+        ('Pipelined', settings.get('Pipelined', False))) if isSet]
+    if len(chosen) > 1:
+        raise RuntimeError('MH Control settings %s can\'t be combined'
+                           % ', '.join(['\'%s\'' % key for key in chosen]))
+
+    if settings.get('Use Prior', False) and method is None:
+        raise RuntimeError('\'Use Prior\' needs a \'Gradient Method\'')
+
+
 class MHSampler:
+    # Whether the sampler can apply 'Use Prior'
+    usesPrior = False
+
     defaultSettings = {
         'Num Samples' : 100,
         'Burn Length' : 100,
@@ -17,117 +49,81 @@ class MHSampler:
         'Abort on Proposal Failure' : False,
         'Warning on Run Failure' : True,
         'Abort on Run Failure' : False,
-        'Verbosity' : 2
+        'Verbosity' : 2,
+        # More than one chain needs MultiChainMHSampler, running the
+        # model in parallel with the chain needs PipelinedMHSampler,
+        # batched likelihoods need SpeculativeMHSampler, more than one
+        # try per step needs MultipleTryMHSampler, and 'MALA' or 'HMC'
+        # needs the samplers in GradientMHSampler. Only one of these can
+        # be set; checkSamplerChoice() raises otherwise.
+        'Num Chains' : 1,
+        'Pipelined' : False,
+        'Speculative' : False,
+        'Num Tries' : 1,
+        'Gradient Method' : None,
+        # If True, the gradient samplers target the likelihood times the
+        # proposal generator's logPrior(). Otherwise every sampler targets
+        # the likelihood alone; samplers that can't use the prior refuse
+        # the setting.
+        'Use Prior' : False,
+        # Write the chain and sample handler state to 'Checkpoint File'
+        # every 'Checkpoint Interval' retained samples, and at the end;
+        # with no interval, only at the end
+        'Checkpoint File' : None,
+        'Checkpoint Interval' : 100,
+        # Start from the checkpoint in 'Resume From' instead of burning
+        # in. 'Full' carries on with the checkpointed run; 'Chain' only
+        # takes the burned-in chain and starts a new set of samples, for
+        # reusing one burn-in at several D values.
+        'Resume From' : None,
+        'Resume Mode' : 'Full'
         }
 
     def __init__(self,
                  modelMgr,
                  proposalGenerator,
                  sampleHandler,
-                 settings):
+                 settings,
+                 fInit = None,
+                 rng = None):
         self.modelMgr = modelMgr
         self.proposalGenerator = proposalGenerator
         self.sampleHandler = sampleHandler
-        self.settings = mergeSettings(MHSampler.defaultSettings, settings)
+        self.settings = mergeSettings(self.defaultSettings, settings)
+        if self.settings['Use Prior'] and not self.usesPrior:
+            raise RuntimeError('%s can\'t apply the proposal generator\'s '
+                               'prior' % type(self).__name__)
+        # Starting point of the chain; if None, the proposal generator's
+        # getInit() is used
+        self.fInit = fInit
+        # Stream for the acceptance tests. Give the proposal generator
+        # the same one, so that a checkpoint captures all the chain's
+        # random numbers.
+        if rng is None:
+            rng = BufferedRNG()
+        self.rng = rng
+        # Counts of accepted and rejected steps, set up by startChain()
+        self.stats = {}
+        self.resetRetained()
 
     def run(self):
         numSamples = self.settings['Num Samples']
-        burnLength = self.settings['Burn Length']
-        decorLength = self.settings['Decorrelation Length']
         outputInterval = self.settings['Output Interval']
-        warnOnPropFail = self.settings['Warning on Proposal Failure']
         warnOnRunFail = self.settings['Warning on Run Failure']
-        abortOnPropFail = self.settings['Abort on Proposal Failure']
         abortOnRunFail = self.settings['Abort on Run Failure']
         verb = self.settings['Verbosity']
 
-        # Get initial value of model parameters
-        fInit = self.proposalGenerator.getInit()
-        fPrev = np.copy(fInit)
-
-        # Compute likelihood function for initial parameters
-        LPrev = self.modelMgr.likelihood(fPrev)
-
-        # Do any preprocessing needed by the sample handler
-        self.sampleHandler.preprocess()
-
-        # Burn-in step: ignore an initial batch of accepted samples
-        if verb > 0:
-            Logger.write('Starting burn-in phase with burnLength=%d' % burnLength)
-        burns = 0
-        rejects = 0
-        propFailures = 0
-        while burns < burnLength:
-            # Have the model manager generate new model parameters
-            fCur = self.proposalGenerator.proposal(fPrev)
-
-            try:
-                LCur = self.modelMgr.likelihood(fCur)
-            except (RuntimeError, ArithmeticError) as e:
-                if abortOnPropFail:
-                    raise RuntimeError('MHSampler: proposal failed with error {}'.format(e))
-                if warnOnPropFail:
-                    Logger.write('MHSampler warning: Likelihood calculation failed with error {}'.format(e))
-                fPrev = np.copy(fCur)
-                propFailures += 1
-                continue
-
-            # Decide whether this is an acceptable step
-            m = LCur/LPrev
-            if np.random.random() < m:
-                # Sample would have been accepted had we not been in burn phase
-                burns += 1
-                LPrev = LCur
-                fPrev = np.copy(fCur)
-            else:
-                # Sample rejected as burn
-                rejects += 1
-
-        if verb > 0:
-            Logger.write('Burn in phase done: burns=%d, rejects=%d, failures=%d'
-                  % (burns, rejects, propFailures))
+        samples = self.startOrResume()
 
         # Main sampling loop:
 
-        samples = 0
-        totRejects = 0
-        curRejects = 0
-        propFailures = 0
-        runFailures = 0
         if verb > 0:
             Logger.write('Starting main sample loop with numSamples=%d' % numSamples)
 
         while samples < numSamples:
 
             # Skip a number of good samples to reduce correlations
-            skipped = 0
-            curRejects = 0
-            while skipped < decorLength:
-                # Have the model manager generate new model parameters
-                fCur = self.proposalGenerator.proposal(fPrev)
-
-                try:
-                    LCur = self.modelMgr.likelihood(fCur)
-                except (RuntimeError, ArithmeticError) as e:
-                    if abortOnPropFail:
-                        raise RuntimeError('MHSampler: proposal failed with error {}'.format(e))
-                    if warnOnPropFail:
-                        Logger.write('MHSampler Warning: Likelihood calculation failed with error {}'.format(e))
-                    fPrev = np.copy(fCur)
-                    propFailures += 1
-                    continue
-
-                # Decide whether this is an acceptable step
-                m = LCur/LPrev
-                if np.random.random() < m:
-                    # Accept sample for skipping
-                    skipped += 1
-                    LPrev = LCur
-                    fPrev = np.copy(fCur)
-                else:
-                    # Reject sample
-                    curRejects += 1
-                    totRejects += 1
+            fCur = self.nextRetained()
 
             # Run the model for this sample
 
@@ -138,7 +134,7 @@ class MHSampler:
                     raise e
                 if warnOnRunFail:
                     Logger.write('MHSampler Warning: run failed with error {}'.format(e))
-                runFailures += 1
+                self.stats['Run Failures'] += 1
                 continue
 
 
@@ -146,13 +142,252 @@ class MHSampler:
 
             if (samples % outputInterval == 0):
                 Logger.write('sample #%d, cur rejects=%d tot rejects=%d'
-                      % (samples, curRejects, totRejects))
+                      % (samples, self.curRejects, self.stats['Rejects']))
                 self.sampleHandler.report()
 
             samples += 1
+            self.checkpoint(samples)
 
 
         # Done main sampling loop
         if (verb > 0):
             Logger.write('Done main sampling loop')
+        self.checkpoint(samples, force=True)
+        self.reportProposals()
         self.sampleHandler.postprocess()
+
+    # Let the proposal generator report on itself, if it can, and log
+    # the sampling efficiency
+    def reportProposals(self):
+        if hasattr(self.proposalGenerator, 'report'):
+            self.proposalGenerator.report()
+        self.reportEfficiency()
+
+    # Effective sample size of the retained samples, per second of the
+    # sampling loop and per second spent advancing the chain. The ESS is
+    # for the log-likelihood and the worst log-parameter.
+    def reportEfficiency(self):
+
+        if self.settings['Verbosity'] <= 0 or len(self.retainedLogL) < 4:
+            return
+        elapsed = perf_counter() - self.sampleStart
+        essLogL = effectiveSampleSize(self.retainedLogL)
+        essParams = np.nanmin(effectiveSampleSize(self.retainedLogParams))
+        Logger.write('%d retained samples: ESS %g for log-likelihood, '
+                     '%g for worst log-parameter'
+                     % (len(self.retainedLogL), essLogL, essParams))
+        Logger.write('Worst-parameter ESS per second: %g overall, %g '
+                     'counting chain time only'
+                     % (essParams/elapsed, essParams/self.chainTime))
+
+    # Burn in a new chain, or pick up one from a checkpoint. Returns the
+    # number of retained samples already done.
+    def startOrResume(self):
+
+        resumeFrom = self.settings['Resume From']
+        if resumeFrom is None:
+            self.startChain()
+            # Do any preprocessing needed by the sample handler
+            self.sampleHandler.preprocess()
+            self.burnIn()
+            self.resetRetained()
+            return 0
+
+        mode = self.settings['Resume Mode']
+        if mode not in ('Full', 'Chain'):
+            raise RuntimeError('Unknown resume mode %s' % mode)
+
+        state = readCheckpoint(resumeFrom)
+        self.restoreChain(state['Chain'], restoreRNG=(mode=='Full'))
+        self.sampleHandler.preprocess()
+
+        self.resetRetained()
+        samples = 0
+        if mode=='Full':
+            self.sampleHandler.restoreState(state['Sample Handler'])
+            samples = state['Samples']
+        else:
+            for key in ('Accepts', 'Rejects', 'Proposal Failures',
+                        'Run Failures'):
+                self.stats[key] = 0
+
+        if self.settings['Verbosity'] > 0:
+            Logger.write('Resumed chain from %s (%s) after %d samples'
+                         % (resumeFrom, mode, samples))
+        return samples
+
+    # Start keeping track of the retained samples and the time taken to
+    # reach them, for the efficiency report
+    def resetRetained(self):
+        self.retainedLogL = []
+        self.retainedLogParams = []
+        self.chainTime = 0.0
+        self.sampleStart = perf_counter()
+
+    # State of the chain, including its random stream and anything the
+    # proposal generator needs to carry on where it was
+    def chainState(self):
+
+        state = {
+            'fPrev' : np.copy(self.fPrev),
+            'logLPrev' : self.logLPrev,
+            'curRejects' : self.curRejects,
+            'Stats' : dict(self.stats),
+            'RNG' : self.rng.getState()
+            }
+        if hasattr(self.proposalGenerator, 'checkpointState'):
+            state['Proposal Generator'] = \
+                self.proposalGenerator.checkpointState()
+        return state
+
+    def restoreChain(self, state, restoreRNG=True):
+
+        self.fPrev = np.copy(state['fPrev'])
+        self.logLPrev = state['logLPrev']
+        self.curRejects = state['curRejects']
+        self.stats = dict(state['Stats'])
+        if restoreRNG:
+            self.rng.setState(state['RNG'])
+        if 'Proposal Generator' in state:
+            self.proposalGenerator.restoreState(state['Proposal Generator'])
+
+    # Write a checkpoint if one is due after this many retained samples
+    def checkpoint(self, samples, force=False):
+
+        filename = self.settings['Checkpoint File']
+        interval = self.settings['Checkpoint Interval']
+        if filename is None:
+            return
+        if not force and (interval is None or samples % interval != 0):
+            return
+
+        writeCheckpoint(filename, {
+            'Samples' : samples,
+            'Chain' : self.chainState(),
+            'Sample Handler' : self.sampleHandler.checkpointState()
+            })
+        if self.settings['Verbosity'] > 1:
+            Logger.write('Wrote checkpoint %s after %d samples'
+                         % (filename, samples))
+
+    # Set the chain to its initial value and zero the counts
+    def startChain(self):
+
+        # Get initial value of model parameters
+        fInit = self.fInit
+        if fInit is None:
+            fInit = self.proposalGenerator.getInit()
+        self.fPrev = np.copy(fInit)
+
+        # Compute log-likelihood for initial parameters
+        self.logLPrev = self.modelMgr.loglikelihood(self.fPrev)
+
+        self.curRejects = 0
+        self.stats = {
+            'Burns' : 0,
+            'Burn Rejects' : 0,
+            'Burn Failures' : 0,
+            'Accepts' : 0,
+            'Rejects' : 0,
+            'Proposal Failures' : 0,
+            'Run Failures' : 0
+            }
+
+    # Make one proposal and decide whether to move the chain to it.
+    # Returns True if the proposal was accepted, False if it was rejected,
+    # and None if its likelihood couldn't be computed; in that case the
+    # chain moves to the failed proposal, keeping its old likelihood.
+    def step(self):
+
+        # Have the model manager generate new model parameters
+        fCur = self.proposalGenerator.proposal(self.fPrev)
+
+        try:
+            logLCur = self.modelMgr.loglikelihood(fCur)
+        except (RuntimeError, ArithmeticError) as e:
+            if self.settings['Abort on Proposal Failure']:
+                raise RuntimeError('MHSampler: proposal failed with error {}'.format(e))
+            if self.settings['Warning on Proposal Failure']:
+                Logger.write('MHSampler Warning: Likelihood calculation failed with error {}'.format(e))
+            self.fPrev = np.copy(fCur)
+            return None
+
+        # Decide whether this is an acceptable step
+        if self.accept(logLCur, self.logLPrev):
+            self.logLPrev = logLCur
+            self.fPrev = np.copy(fCur)
+            return True
+        return False
+
+    # Burn-in step: ignore an initial batch of accepted samples
+    def burnIn(self):
+
+        burnLength = self.settings['Burn Length']
+        verb = self.settings['Verbosity']
+        stats = self.stats
+
+        if verb > 0:
+            Logger.write('Starting burn-in phase with burnLength=%d' % burnLength)
+        while stats['Burns'] < burnLength:
+            accepted = self.step()
+            if accepted is None:
+                stats['Burn Failures'] += 1
+            elif accepted:
+                # Sample would have been accepted had we not been in burn phase
+                stats['Burns'] += 1
+            else:
+                # Sample rejected as burn
+                stats['Burn Rejects'] += 1
+
+        if verb > 0:
+            Logger.write('Burn in phase done: burns=%d, rejects=%d, failures=%d'
+                  % (stats['Burns'], stats['Burn Rejects'],
+                     stats['Burn Failures']))
+
+        # Proposal generators that adapt during burn-in stop here
+        if hasattr(self.proposalGenerator, 'endBurnIn'):
+            self.proposalGenerator.endBurnIn()
+
+    # Advance the chain by 'Decorrelation Length' accepted steps and
+    # return the parameters it ends at
+    def nextRetained(self):
+
+        decorLength = self.settings['Decorrelation Length']
+        stats = self.stats
+
+        tStart = perf_counter()
+        skipped = 0
+        self.curRejects = 0
+        while skipped < decorLength:
+            accepted = self.step()
+            if accepted is None:
+                stats['Proposal Failures'] += 1
+            elif accepted:
+                # Accept sample for skipping
+                skipped += 1
+                stats['Accepts'] += 1
+            else:
+                # Reject sample
+                self.curRejects += 1
+                stats['Rejects'] += 1
+
+        self.chainTime += perf_counter() - tStart
+        self.retainedLogL.append(self.logLPrev)
+        self.retainedLogParams.append(np.log(self.fPrev))
+        return np.copy(self.fPrev)
+
+    # Fraction of proposals accepted in the main sampling loop
+    def acceptanceRate(self):
+        tries = self.stats['Accepts'] + self.stats['Rejects']
+        return self.stats['Accepts']/max(tries, 1)
+
+    # Metropolis acceptance test, done in log space so that likelihoods
+    # that underflow far from the data still give a sensible ratio. This
+    # draws one uniform per test, as the ratio test LCur/LPrev did. A
+    # chain stuck at zero likelihood accepts every proposal until it
+    # finds a nonzero one.
+    def accept(self, logLCur, logLPrev):
+        u = self.rng.random()
+        if logLPrev == -inf:
+            return True
+        return u < exp(min(logLCur - logLPrev, 0.0))
@@ -9,7 +9,15 @@ from ResponseData import *
 #from FEMProposalGenerator import *
 from SplineProposalGenerator import *
 from MultiParamProposalGenerator import *
+from AdaptiveProposalGenerator import *
+from RandomStreams import *
 from MHSampler import *
+from MultiChainMHSampler import *
+from PipelinedMHSampler import *
+from SpeculativeMHSampler import *
+from MultipleTryMHSampler import *
+from GradientMHSampler import *
+from EnsembleSampler import *
 from StoredParamSampler import *
 from ShowResponseCurves import *
 from ShowContours import *
@@ -26,7 +34,21 @@ import os
 
 
 
-def runSampler(settings, D, Nx=32):
+# Set up the proposal generator described by pgSettings
+def makeProposalGenerator(pgSettings, rFunc, rng):
+    print(('found propgen type=%s' % pgSettings['Type']))
+    if pgSettings['Type']=='Spline':
+        return SplineProposalGenerator(rFunc, pgSettings['Settings'], rng)
+    elif pgSettings['Type']=='MultiParam':
+        return MultiParamProposalGenerator(rFunc, pgSettings['Sigma'], rng)
+    else:
+        raise RuntimeError('Unimplemented proposal generator %s' % pgSettings['Type'])
+
+
+# Run the sampler for one D. If resumeFrom names a checkpoint, the chain
+# starts from it instead of burning in: resumeMode 'Full' carries on with
+# that run, and 'Chain' starts new samples from its burned-in chain.
+def runSampler(settings, D, Nx=32, resumeFrom=None, resumeMode='Full'):
 
     name = settings['Run Name']
     dirname = settings['Output Directory']
@@ -40,7 +62,8 @@ def runSampler(settings, D, Nx=32):
 
     logName = '%s/%s-n-%d-D-%f.log' % (dirname, name, Nx, D)
 
-    Logger.openLog(logName, settings)
+    Logger.openLog(logName, settings,
+                   mode=('a' if resumeFrom is not None else 'w'))
 
     # Set up response function
     rfSettings = settings['Response Function']
@@ -68,29 +91,70 @@ def runSampler(settings, D, Nx=32):
     # Set up sample handler
     sampleHandler = LimitPointSampleHandler(settings['Sample Handler'])
 
+    # Random stream for this run, determined by the run's seed and D
+    rng = BufferedRNG(seedSequenceFor(settings.get('Seed'),
+                                      int(round(1.0e6*D)), Nx))
+
     # Set up sampler
     samplerSpec = settings['Sampler']
     if samplerSpec['Type']=='MH': # Metropolis-Hastings sampler
         # Set up proposal generator
         pgSettings = samplerSpec['Proposal Generator']
-        print(('found propgen type=%s' % pgSettings['Type']))
-        if pgSettings['Type']=='Spline':
-            propGen = SplineProposalGenerator(rFunc, pgSettings['Settings'])
-        elif pgSettings['Type']=='MultiParam':
-            propGen = MultiParamProposalGenerator(rFunc, pgSettings['Sigma'])
-        else:
-            raise RuntimeError('Unimplemented proposal generator %s' % pgSettings['Type'])
+        propGen = makeProposalGenerator(pgSettings, rFunc, rng)
+        # Optionally adapt the proposals to the chain during burn-in
+        if pgSettings.get('Adaptive') is not None:
+            propGen = AdaptiveProposalGenerator(propGen,
+                                                pgSettings['Adaptive'])
+
+        # Single chains are checkpointed next to the log, if asked for
+        mhControl = dict(samplerSpec['MH Control'])
+        if mhControl.get('Num Chains', 1) == 1:
+            if mhControl.get('Checkpoint Interval') is not None:
+                mhControl.setdefault('Checkpoint File',
+                    '%s/%s-n-%d-D-%f.ckpt' % (dirname, name, Nx, D))
+            mhControl['Resume From'] = resumeFrom
+            mhControl['Resume Mode'] = resumeMode
 
         # Set up sampler
-        sampler = MHSampler(modelMgr, propGen, sampleHandler,
-                            samplerSpec['MH Control'])
+        checkSamplerChoice(mhControl)
+        if mhControl.get('Num Chains', 1) > 1:
+            sampler = MultiChainMHSampler(modelMgr, propGen, sampleHandler,
+                                          mhControl, rng)
+        elif mhControl.get('Gradient Method') == 'MALA':
+            sampler = MALASampler(modelMgr, propGen, sampleHandler,
+                                  mhControl, rng=rng)
+        elif mhControl.get('Gradient Method') == 'HMC':
+            sampler = HMCSampler(modelMgr, propGen, sampleHandler,
+                                 mhControl, rng=rng)
+        elif mhControl.get('Num Tries', 1) > 1:
+            sampler = MultipleTryMHSampler(modelMgr, propGen, sampleHandler,
+                                           mhControl, rng=rng)
+        elif mhControl.get('Speculative', False):
+            sampler = SpeculativeMHSampler(modelMgr, propGen, sampleHandler,
+                                           mhControl, rng=rng)
+        elif mhControl.get('Pipelined', False):
+            sampler = PipelinedMHSampler(modelMgr, propGen, sampleHandler,
+                                         mhControl, rng=rng)
+        else:
+            sampler = MHSampler(modelMgr, propGen, sampleHandler,
+                                mhControl, rng=rng)
+    elif samplerSpec['Type']=='Ensemble': # Stretch-move ensemble sampler
+        if resumeFrom is not None:
+            raise RuntimeError('The ensemble sampler cannot resume from a '
+                               'checkpoint')
+        # The proposal generator gives the starting walkers and the prior
+        propGen = makeProposalGenerator(samplerSpec['Proposal Generator'],
+                                        rFunc, rng)
+        sampler = EnsembleSampler(modelMgr, propGen, sampleHandler,
+                                  samplerSpec['Ensemble Control'], rng)
     elif samplerSpec['Type']=='Stored':
         filenameTemplates = samplerSpec['Filenames']
         filenames = []
         rfName = rfSettings['Type']
         for t in filenameTemplates:
             filenames.append(t % (rfName, rfName))
-        sampler = StoredParamSampler(modelMgr, filenames, sampleHandler)
+        sampler = StoredParamSampler(modelMgr, filenames, sampleHandler,
+                                     blockSize=samplerSpec.get('Block Size', 1))
     else:
         pass
 
@@ -107,6 +171,7 @@ def runSampler(settings, D, Nx=32):
     Logger.write('\tname=%s D=%f' % (name, D))
     Logger.write('\t\tNumber of limit points: %d' % nlp)
     Logger.write('\t\tNumber of limit cycles: %d' % nlc)
+    modelMgr.reportEarlyStops()
     Logger.write('\n\n')
 
     lpp = sampleHandler.limitPointParams
@@ -121,7 +186,8 @@ def runSampler(settings, D, Nx=32):
     showCurves = False
     if showCurves==True:
         imgName = '%s/response-%s.%s' % (dirname, name, imgFormat)
-        showResponseCurves(name, imgName, modelMgr, lpp, lcp, numToShow)
+        showResponseCurves(name, imgName, modelMgr, lpp, lcp, numToShow,
+                           rng=rng)
     if doContours==True:
         imgName = '%s/contour-%s.%s' % (dirname, name, imgFormat)
         showContours(imgName, modelMgr, lpp, lcp)
@@ -156,6 +222,12 @@ if __name__ == '__main__':
   parser.add_argument('--nx', action='store', type=int, default=64)
   parser.add_argument('--dir', action='store', default='../Results/Spline-Runs')
   parser.add_argument('--dryrun', action='store_true', default=False)
+  # Carry on with the runs checkpointed in this output directory
+  parser.add_argument('--resume', action='store', default=None)
+  # Burn in once, at the first D, and start the other D from that chain
+  parser.add_argument('--reuse-chain', action='store_true', default=False)
+  parser.add_argument('--sampler', action='store', default='MH',
+                      choices=('MH', 'Ensemble'))
 
   args = parser.parse_args()
   storedSampleTag = args.stored
@@ -175,15 +247,26 @@ if __name__ == '__main__':
       print('r=', r)
       modelName = r[0]
       outfile = outfileTemplate % modelName
+      if args.resume is not None:
+          outfile = args.resume
       resp = r[1]
       propGen = r[2]
       print('propGen=', propGen)
       settings = makeRunSettings(modelName, outfile, resp, propGen,
-                                numSamples)
+                                numSamples, samplerType=args.sampler)
 
 
 
+      burnedIn = None
       for D in (0.05,): #np.arange(0.03, 0.1001, 0.0025):
           print('D=%g' % D)
+          ckpt = '%s/%s-n-%d-D-%f.ckpt' % (outfile, modelName, Nx, D)
+          resumeFrom, resumeMode = None, 'Full'
+          if args.resume is not None and os.path.exists(ckpt):
+              resumeFrom = ckpt
+          elif args.reuse_chain and burnedIn is not None:
+              resumeFrom, resumeMode = burnedIn, 'Chain'
           if not isDryRun:
-              runSampler(settings, D, Nx)
+              runSampler(settings, D, Nx, resumeFrom, resumeMode)
+              if os.path.exists(ckpt):
+                  burnedIn = ckpt
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+
+import numpy as np
+import copy
+import multiprocessing
+import concurrent.futures
+from math import ceil
+from SettingsHandler import *
+from Logger import *
+from MHSampler import *
+from MHSampleHandlerBase import *
+from ChainDiagnostics import *
+
+
+# Sample handler that keeps each retained sample's parameters, model
+# results and log-likelihood, so that they can be passed back from a
+# chain run in another process. The results are first cut down by
+# reduceResults, the real sample handler's method of that name, so only
+# what it needs crosses the process boundary.
+class ChainRecorder(MHSampleHandlerBase):
+    def __init__(self, reduceResults):
+        MHSampleHandlerBase.__init__(self)
+        self.reduceResults = reduceResults
+        self.params = []
+        self.results = []
+        self.logL = []
+
+    def preprocess(self):
+        pass
+
+    def process(self, modelMgr, params, results):
+        self.params.append(np.copy(params))
+        self.results.append(self.reduceResults(results))
+        self.logL.append(modelMgr.loglikelihood(params))
+
+    def report(self):
+        pass
+
+
+# Run one MH chain from fInit, drawing from the random stream rng. This
+# runs in a worker process on a copy of the model manager, so everything
+# the chain produces is returned, including the model manager's early
+# stopping counts for this chain's runs.
+def runChain(modelMgr, proposalGenerator, settings, fInit, rng,
+             reduceResults):
+
+    proposalGenerator.setRNG(rng)
+    if hasattr(modelMgr, 'earlyStopStats'):
+        modelMgr.resetEarlyStopStats()
+    recorder = ChainRecorder(reduceResults)
+    sampler = MHSampler(modelMgr, proposalGenerator, recorder, settings,
+                        fInit, rng)
+    sampler.run()
+
+    rtn = {
+        'Params' : recorder.params,
+        'Results' : recorder.results,
+        'Log Likelihoods' : recorder.logL,
+        'Stats' : sampler.stats,
+        'Acceptance Rate' : sampler.acceptanceRate()
+        }
+    if hasattr(modelMgr, 'earlyStopStats'):
+        rtn['Early Stops'] = modelMgr.earlyStopStats()
+    return rtn
+
+
+# Runs 'Num Chains' independent MH chains in a process pool and merges
+# their retained samples into the sample handler, chain by chain. 'Num
+# Samples' is the total over all chains. Chain k starts from the proposal
+# generator's getInit() perturbed by a log-normal factor with standard
+# deviation 'Start Dispersion' in each parameter, and draws from its own
+# random stream spawned from rng, or if that isn't given, from a stream
+# seeded with 'Seed'. After the run, the split R-hat of
+# the chains' log-likelihoods and log-parameters, and each chain's
+# acceptance rate, are logged and kept in rHat and chainStats.
+#
+# The pool uses fork so that the workers inherit the open log.
+
+class MultiChainMHSampler:
+    defaultSettings = dict(MHSampler.defaultSettings)
+    defaultSettings.update({
+        'Num Chains' : 4,
+        'Num Processes' : None,
+        'Start Dispersion' : 0.5,
+        'Seed' : None
+        })
+
+    def __init__(self,
+                 modelMgr,
+                 proposalGenerator,
+                 sampleHandler,
+                 settings,
+                 rng = None):
+        self.modelMgr = modelMgr
+        self.proposalGenerator = proposalGenerator
+        self.sampleHandler = sampleHandler
+        self.settings = mergeSettings(MultiChainMHSampler.defaultSettings,
+                                      settings)
+        if rng is None:
+            rng = BufferedRNG(self.settings['Seed'])
+        self.rng = rng
+        self.rHat = {}
+        self.chainStats = []
+
+    # Starting points and random streams for each chain
+    def chainStarts(self):
+
+        numChains = self.settings['Num Chains']
+        dispersion = self.settings['Start Dispersion']
+        fInit = np.asarray(self.proposalGenerator.getInit(), dtype=float)
+
+        starts = []
+        streams = []
+        for child in self.rng.spawn(numChains):
+            startRNG, chainRNG = child.spawn(2)
+            starts.append(fInit*np.exp(dispersion
+                                       *startRNG.standard_normal(fInit.shape)))
+            streams.append(chainRNG)
+        return starts, streams
+
+    def run(self):
+
+        numChains = self.settings['Num Chains']
+        verb = self.settings['Verbosity']
+
+        # Checkpointing is only done for single chains
+        if (self.settings['Checkpoint File'] is not None
+            or self.settings['Resume From'] is not None):
+            raise RuntimeError('Checkpoints aren\'t supported with more '
+                               'than one chain')
+        # Each chain is a plain MHSampler
+        checkSamplerChoice(self.settings)
+
+        chainSettings = {key : self.settings[key]
+                         for key in MHSampler.defaultSettings}
+        chainSettings['Num Chains'] = 1
+        chainSettings['Num Samples'] = int(ceil(self.settings['Num Samples']
+                                                / float(numChains)))
+
+        starts, streams = self.chainStarts()
+
+        if verb > 0:
+            Logger.write('Starting %d chains of %d samples each'
+                         % (numChains, chainSettings['Num Samples']))
+
+        numProcs = self.settings['Num Processes']
+        if numProcs == 1:
+            chains = [runChain(copy.deepcopy(self.modelMgr),
+                               copy.deepcopy(self.proposalGenerator),
+                               chainSettings, f, s,
+                               self.sampleHandler.reduceResults)
+                      for f, s in zip(starts, streams)]
+        else:
+            context = multiprocessing.get_context('fork')
+            with concurrent.futures.ProcessPoolExecutor(
+                    max_workers=numProcs, mp_context=context) as pool:
+                futures = [pool.submit(runChain, self.modelMgr,
+                                       self.proposalGenerator,
+                                       chainSettings, f, s,
+                                       self.sampleHandler.reduceResults)
+                           for f, s in zip(starts, streams)]
+                chains = [f.result() for f in futures]
+
+        # Merge the retained samples into the sample handler
+        self.sampleHandler.preprocess()
+        for chain in chains:
+            for params, results in zip(chain['Params'], chain['Results']):
+                self.sampleHandler.process(self.modelMgr, params, results)
+            if 'Early Stops' in chain:
+                self.modelMgr.addEarlyStopStats(chain['Early Stops'])
+        self.sampleHandler.postprocess()
+
+        self.chainStats = [chain['Stats'] for chain in chains]
+        self.diagnose(chains)
+
+    # Compute and log the convergence diagnostics. Chains that lost
+    # samples to run failures are cut to the shortest chain's length.
+    def diagnose(self, chains):
+
+        n = min([len(chain['Params']) for chain in chains])
+        logL = np.array([chain['Log Likelihoods'][:n] for chain in chains])
+        logParams = np.log(np.array([chain['Params'][:n]
+                                     for chain in chains]))
+
+        self.rHat = {
+            'Log Likelihood' : splitRHat(logL),
+            'Log Params' : splitRHat(logParams)
+            }
+
+        Logger.write('Split R-hat for log-likelihood: %g'
+                     % self.rHat['Log Likelihood'])
+        Logger.write('Max split R-hat over log-parameters: %g'
+                     % np.nanmax(self.rHat['Log Params']))
+        for k, chain in enumerate(chains):
+            stats = chain['Stats']
+            Logger.write('Chain %d: acceptance rate %g, burn-in accepted '
+                         '%d rejected %d, failures %d'
+                         % (k, chain['Acceptance Rate'], stats['Burns'],
+                            stats['Burn Rejects'],
+                            stats['Proposal Failures']
+                            + stats['Burn Failures']
+                            + stats['Run Failures']))
@@ -3,18 +3,30 @@
 import numpy as np
 from ResponseFunction import *
 from math import *
+from RandomStreams import *
 
 
 class MultiParamProposalGenerator:
-    def __init__(self, resp, delta):
+    def __init__(self, resp, delta, rng=None):
 
         params = resp.getParams();
         d = np.array(delta)
         self.sig = np.log(np.abs(1.0+d)/np.abs(1.0-d));
         self.initParams = np.array(params)
+        if rng is None:
+            rng = BufferedRNG()
+        self.rng = rng
+
+    def setRNG(self, rng):
+        self.rng = rng
 
     def proposal(self, fParams):
-        logf = np.log(fParams) + np.random.normal(0, self.sig)
+        return self.proposals(fParams, 1)[0]
+
+    # Make k proposals from fParams at once, one per row
+    def proposals(self, fParams, k):
+        z = self.rng.standard_normals(np.shape(self.sig), k)
+        logf = np.log(fParams) + self.sig*z
         return np.exp(logf)
 
     def getInit(self):
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+import numpy as np
+from scipy.special import logsumexp
+from SettingsHandler import *
+from Logger import *
+from MHSampler import *
+from AdaptiveProposalGenerator import *
+
+
+# Multiple-try Metropolis (Liu, Liang and Wong, JASA 95, 2000). Each step
+# draws 'Num Tries' proposals y_1..y_k from the current state x and picks
+# one, y, with probability proportional to its likelihood. It then draws
+# k-1 reference points from y, adds x to them as the k-th, and moves to y
+# with probability
+#     min(1, sum_i L(y_i) / sum_i L(x*_i)).
+# The proposals and reference points are each evaluated with one call to
+# the model manager's loglikelihoodBlock(). Like MHSampler's acceptance
+# test, the rule assumes the proposals are symmetric.
+#
+# With more tries each accepted step goes further, so fewer are needed
+# per retained sample; compare the effective samples per second that
+# MHSampler reports at the end of a run to choose 'Num Tries' and
+# 'Decorrelation Length'.
+#
+# If a likelihood fails, the step counts as a failure and the chain
+# stays where it is.
+#
+# An AdaptiveProposalGenerator can't be used: it learns from the states
+# it is asked to propose from and infers acceptance from them, and the
+# tries and reference points would feed it points the chain never
+# visited.
+
+class MultipleTryMHSampler(MHSampler):
+    defaultSettings = dict(MHSampler.defaultSettings)
+    defaultSettings.update({
+        'Num Tries' : 4
+        })
+
+    def __init__(self, modelMgr, proposalGenerator, sampleHandler,
+                 settings, fInit = None, rng = None):
+        if isinstance(proposalGenerator, AdaptiveProposalGenerator):
+            raise RuntimeError('MultipleTryMHSampler: adaptive proposals '
+                               'can\'t be used with more than one try')
+        MHSampler.__init__(self, modelMgr, proposalGenerator, sampleHandler,
+                           settings, fInit, rng)
+
+    def step(self):
+
+        k = self.settings['Num Tries']
+
+        try:
+            Y = self.makeProposals(self.fPrev, k)
+            logLY = np.asarray(self.modelMgr.loglikelihoodBlock(Y))
+            j = self.select(logLY)
+            X = self.makeProposals(Y[j], k-1)
+            logLX = np.append(self.modelMgr.loglikelihoodBlock(X),
+                              self.logLPrev)
+        except (RuntimeError, ArithmeticError) as e:
+            if self.settings['Abort on Proposal Failure']:
+                raise RuntimeError('MHSampler: proposal failed with error {}'.format(e))
+            if self.settings['Warning on Proposal Failure']:
+                Logger.write('MHSampler Warning: Likelihood calculation failed with error {}'.format(e))
+            return None
+
+        if self.accept(logsumexp(logLY), logsumexp(logLX)):
+            self.logLPrev = logLY[j]
+            self.fPrev = np.copy(Y[j])
+            return True
+        return False
+
+    # k proposals from f, one per row
+    def makeProposals(self, f, k):
+        if k == 0:
+            return np.empty((0, len(f)))
+        if hasattr(self.proposalGenerator, 'proposals'):
+            return self.proposalGenerator.proposals(f, k)
+        return np.array([self.proposalGenerator.proposal(f)
+                         for i in range(k)])
+
+    # Pick one of the proposals with probability proportional to its
+    # likelihood, or uniformly if none of them has a nonzero likelihood
+    def select(self, logL):
+        top = np.max(logL)
+        if top == -inf:
+            weights = np.ones(len(logL))
+        else:
+            weights = np.exp(logL - top)
+        cdf = np.cumsum(weights)
+        j = np.searchsorted(cdf, self.rng.random()*cdf[-1], side='right')
+        return min(j, len(logL) - 1)
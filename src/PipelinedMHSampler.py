@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+import os
+import numpy as np
+import multiprocessing
+import concurrent.futures
+from collections import deque
+from SettingsHandler import *
+from Logger import *
+from MHSampler import *
+
+
+# Model manager and sample handler for the worker processes, set up once
+# per worker by initPipelineWorker()
+pipelineWorker = {}
+
+def initPipelineWorker(modelMgr, sampleHandler):
+    pipelineWorker['Model Manager'] = modelMgr
+    pipelineWorker['Sample Handler'] = sampleHandler
+
+
+# Run the model for one retained sample in a worker process. Returns a
+# tuple (error, results, early stopping counts), where error is None if
+# the run succeeded, and results have been cut down by the sample
+# handler to what it needs to classify them.
+def runPipelineSample(params):
+
+    modelMgr = pipelineWorker['Model Manager']
+    sampleHandler = pipelineWorker['Sample Handler']
+
+    earlyStops = None
+    if hasattr(modelMgr, 'earlyStopStats'):
+        modelMgr.resetEarlyStopStats()
+    try:
+        results = modelMgr.run(params)
+    except (RuntimeError, ArithmeticError) as e:
+        return (e, None, earlyStops)
+    if hasattr(modelMgr, 'earlyStopStats'):
+        earlyStops = modelMgr.earlyStopStats()
+
+    return (None, sampleHandler.reduceResults(results), earlyStops)
+
+
+# MH sampler in which the chain doesn't wait for the model runs. Each
+# retained sample is submitted to a pool of 'Num Processes' worker
+# processes as soon as the chain reaches it, with up to 'Queue Length'
+# samples in flight (by default four per worker), and the chain goes on
+# to the next one. Results are handed to the sample handler in sample
+# order, so the output is the same as MHSampler's for the same chain.
+# A sample whose run fails is replaced by a new one from the chain.
+# Checkpoints hold the chain as it is when they're written, which is
+# ahead of the samples processed so far; on resuming, the samples that
+# were in flight are replaced by new ones from the chain.
+#
+# The pool uses fork so that the workers inherit the open log.
+
+class PipelinedMHSampler(MHSampler):
+    defaultSettings = dict(MHSampler.defaultSettings)
+    defaultSettings.update({
+        'Pipelined' : True,
+        'Num Processes' : None,
+        'Queue Length' : None
+        })
+
+    def run(self):
+        numSamples = self.settings['Num Samples']
+        outputInterval = self.settings['Output Interval']
+        warnOnRunFail = self.settings['Warning on Run Failure']
+        abortOnRunFail = self.settings['Abort on Run Failure']
+        verb = self.settings['Verbosity']
+
+        numProcs = self.settings['Num Processes']
+        if numProcs is None:
+            numProcs = os.cpu_count()
+        queueLength = self.settings['Queue Length']
+        if queueLength is None:
+            queueLength = 4*numProcs
+
+        samples = self.startOrResume()
+
+        # Main sampling loop:
+
+        if verb > 0:
+            Logger.write('Starting pipelined sample loop with numSamples=%d, '
+                         '%d processes, queue length %d'
+                         % (numSamples, numProcs, queueLength))
+
+        context = multiprocessing.get_context('fork')
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=numProcs, mp_context=context,
+                initializer=initPipelineWorker,
+                initargs=(self.modelMgr, self.sampleHandler)) as pool:
+
+            pending = deque()
+            while samples < numSamples:
+
+                # Keep the queue full from the chain
+                while (len(pending) < queueLength
+                       and samples + len(pending) < numSamples):
+                    fCur = self.nextRetained()
+                    pending.append((fCur, self.curRejects,
+                                    pool.submit(runPipelineSample, fCur)))
+
+                # Handle the oldest sample once its run is done
+                fCur, curRejects, future = pending.popleft()
+                error, results, earlyStops = future.result()
+
+                if earlyStops is not None:
+                    self.modelMgr.addEarlyStopStats(earlyStops)
+
+                if error is not None:
+                    if abortOnRunFail:
+                        raise error
+                    if warnOnRunFail:
+                        Logger.write('MHSampler Warning: run failed with error {}'.format(error))
+                    self.stats['Run Failures'] += 1
+                    continue
+
+                self.sampleHandler.process(self.modelMgr, fCur, results)
+
+                if (samples % outputInterval == 0):
+                    Logger.write('sample #%d, cur rejects=%d tot rejects=%d'
+                          % (samples, curRejects, self.stats['Rejects']))
+                    self.sampleHandler.report()
+
+                samples += 1
+                self.checkpoint(samples)
+
+        # Done main sampling loop
+        if (verb > 0):
+            Logger.write('Done main sampling loop')
+        self.checkpoint(samples, force=True)
+        self.reportProposals()
+        self.sampleHandler.postprocess()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+# Random number streams for sampler runs. All the randomness in a run
+# comes from one SeedSequence built from the run's 'Seed' setting. Each
+# consumer (a chain, an MPI task, a pool worker) gets its own child of
+# that sequence from spawn(), so the streams are independent and a run
+# can be reproduced from its seed.
+
+
+# Seed sequence for one piece of a run, such as the run at one D. The
+# keys are nonnegative integers that pick out the piece, so the same
+# seed gives each piece its own stream whichever process runs it.
+def seedSequenceFor(seed, *keys):
+    return np.random.SeedSequence(seed, spawn_key=tuple(keys))
+
+
+# Hashable key for the buffer of one kind of variate
+def bufferKey(kind, args):
+    return (kind,) + tuple(a.tobytes() if isinstance(a, np.ndarray) else a
+                           for a in args)
+
+
+uniformKey = ('Uniform',)
+
+
+# A numpy Generator that hands out variates from blocks drawn
+# 'blockSize' at a time, so the sampler's inner loop doesn't pay numpy's
+# per-call overhead. There is one buffer per kind of variate and set of
+# distribution parameters. The stream is fixed by the seed, but is not
+# the one an unbuffered Generator would give.
+#
+# getState() records, for each buffer, the generator state it was drawn
+# from and how far it has been used, rather than the buffer itself, so
+# checkpoints stay small; setState() redraws the buffers.
+
+class BufferedRNG:
+    def __init__(self, seed=None, blockSize=256):
+        if isinstance(seed, np.random.SeedSequence):
+            self.seedSeq = seed
+        else:
+            self.seedSeq = np.random.SeedSequence(seed)
+        self.generator = np.random.default_rng(self.seedSeq)
+        self.blockSize = blockSize
+        self.buffers = {}
+
+    # Independent child streams
+    def spawn(self, n):
+        return [BufferedRNG(s, self.blockSize) for s in self.seedSeq.spawn(n)]
+
+    # Uniform variate in [0,1). This is drawn once per MH step, so the
+    # common case is kept short.
+    def random(self):
+        buf = self.buffers.get(uniformKey)
+        if buf is not None and buf['Next'] < self.blockSize:
+            buf['Next'] += 1
+            return buf['Values'][buf['Next'] - 1]
+        return self.fromBuffer('Uniform', ())
+
+    # Beta variates, one for each element of alpha and beta
+    def beta(self, alpha, beta):
+        return self.fromBuffer('Beta', (np.asarray(alpha, dtype=float),
+                                        np.asarray(beta, dtype=float)))
+
+    # Standard normal variates, in an array of the given shape
+    def standard_normal(self, size=()):
+        return self.fromBuffer('Normal', (tuple(np.atleast_1d(size)),))
+
+    # The next k of each kind of variate, stacked along a new first axis.
+    # These come from the same buffers as the single draws, so k single
+    # draws give the same values.
+    def uniforms(self, k):
+        return self.blockFromBuffer('Uniform', (), k)
+
+    def betas(self, alpha, beta, k):
+        return self.blockFromBuffer('Beta', (np.asarray(alpha, dtype=float),
+                                             np.asarray(beta, dtype=float)), k)
+
+    def standard_normals(self, size, k):
+        return self.blockFromBuffer('Normal', (tuple(np.atleast_1d(size)),),
+                                    k)
+
+    def normal(self, loc, scale):
+        shape = np.broadcast(loc, scale).shape
+        return loc + scale*self.standard_normal(shape)
+
+    # Unbuffered, for occasional use
+    def choice(self, *args, **kwargs):
+        return self.generator.choice(*args, **kwargs)
+
+    # Next variate from the buffer for this kind and parameters, drawing
+    # a new block when it runs out
+    def fromBuffer(self, kind, args):
+
+        buf = self.currentBuffer(kind, args)
+        value = buf['Values'][buf['Next']]
+        buf['Next'] += 1
+        return value
+
+    def blockFromBuffer(self, kind, args, k):
+
+        parts = []
+        while k > 0:
+            buf = self.currentBuffer(kind, args)
+            take = min(k, self.blockSize - buf['Next'])
+            parts.append(np.asarray(buf['Values'][buf['Next']:buf['Next']+take]))
+            buf['Next'] += take
+            k -= take
+        return np.concatenate(parts)
+
+    # Buffer for this kind and parameters with at least one variate left
+    def currentBuffer(self, kind, args):
+
+        key = bufferKey(kind, args)
+        buf = self.buffers.get(key)
+        if buf is None or buf['Next'] == self.blockSize:
+            buf = self.newBuffer(kind, args)
+            self.buffers[key] = buf
+        return buf
+
+    def newBuffer(self, kind, args):
+        buf = {
+            'Kind' : kind,
+            'Args' : args,
+            'State' : self.generator.bit_generator.state,
+            'Next' : 0
+            }
+        buf['Values'] = self.drawBlock(kind, args)
+        return buf
+
+    def drawBlock(self, kind, args):
+        n = self.blockSize
+        if kind=='Uniform':
+            return self.generator.random(n).tolist()
+        elif kind=='Beta':
+            alpha, beta = args
+            return self.generator.beta(alpha, beta,
+                                       (n,) + np.broadcast(alpha, beta).shape)
+        elif kind=='Normal':
+            return self.generator.standard_normal((n,) + args[0])
+        else:
+            raise RuntimeError('Unknown kind of variate %s' % kind)
+
+    def getState(self):
+        return {
+            'Generator' : self.generator.bit_generator.state,
+            'Buffers' : [(buf['Kind'], buf['Args'], buf['State'], buf['Next'])
+                         for buf in self.buffers.values()]
+            }
+
+    def setState(self, state):
+        self.buffers = {}
+        for kind, args, bufState, used in state['Buffers']:
+            self.generator.bit_generator.state = bufState
+            buf = self.newBuffer(kind, args)
+            buf['Next'] = used
+            self.buffers[bufferKey(kind, args)] = buf
+        self.generator.bit_generator.state = state['Generator']
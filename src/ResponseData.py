@@ -27,21 +27,99 @@ class ResponseData:
         self.rDat = csv[:,1]/rScaleDown
 
         ivlev = IvlevModel()
-        ri = np.array([ivlev.eval(x) for x in self.xDat])
+        ri = ivlev.eval(self.xDat)
         self.sigma = sigmaFactor*sqrt(np.var(ri - self.rDat))
 
-    def likelihood(self, rFunc):
+        # Cached linear operators for response functions that are linear
+        # in their parameters, keyed by rFunc.linearKey()
+        self.operators = {}
+
+    # The likelihood is a Gaussian in the misfit at the data points,
+    # times a penalty on slopes at 0.1 beyond slopeCutoff. Far from the
+    # data it underflows to zero, so samplers should use the
+    # log-likelihood.
+    def loglikelihood(self, rFunc):
+
+        if self.isLinear(rFunc):
+            return self.loglikelihoodForParams(rFunc, rFunc.getParams())
 
         f, df, df2 = rFunc.evalDerivs(0.1)
-        factor = 1.0
+        logFactor = 0.0
         slopeCutoff = 0.02
         if abs(df)>slopeCutoff:
-            factor = exp(-2*(df-slopeCutoff)/slopeCutoff)
-        rVals = np.array([rFunc.eval(x) for x in self.xDat])
+            logFactor = -2*(df-slopeCutoff)/slopeCutoff
+        rVals = rFunc.eval(self.xDat)
         dr = (rVals - self.rDat)/self.sigma/sqrt(2)
-        return factor*exp(-np.sum(np.multiply(dr, dr)))
+        return logFactor - np.sum(np.multiply(dr, dr))
+
+    def likelihood(self, rFunc):
+        return exp(self.loglikelihood(rFunc))
+
+    def isLinear(self, rFunc):
+        return hasattr(rFunc, 'linearOperator')
+
+    # Return the matrix taking rFunc's parameters to its values at the
+    # data points, and the row taking them to its slope at 0.1. These
+    # are built once per grid and cached.
+    def linearOperator(self, rFunc):
+        key = rFunc.linearKey()
+        if key not in self.operators:
+            A = rFunc.linearOperator(self.xDat)[0]
+            slopeRow = rFunc.linearOperator([0.1], 1)[1][0]
+            self.operators[key] = (A, slopeRow)
+        return self.operators[key]
+
+    # Log-likelihood of a linear response function with the given
+    # parameters, without setting them. params can be a single parameter
+    # vector, or a block with one parameter vector per row, in which case
+    # an array of log-likelihoods is returned.
+    def loglikelihoodForParams(self, rFunc, params):
+
+        A, slopeRow = self.linearOperator(rFunc)
+        params = np.asarray(params, dtype=float)
+        rVals = params @ A.T
+        df = params @ slopeRow
+
+        slopeCutoff = 0.02
+        logFactor = np.where(np.abs(df)>slopeCutoff,
+                             -2*(df-slopeCutoff)/slopeCutoff, 0.0)
+        dr = (rVals - self.rDat)/self.sigma/sqrt(2)
+        logL = logFactor - np.sum(np.multiply(dr, dr), axis=-1)
+
+        if params.ndim == 1:
+            return float(logL)
+        return logL
+
+    # Log-likelihood of a linear response function with the given
+    # parameters, and its gradient with respect to them. As for
+    # loglikelihoodForParams(), params can be one parameter vector or a
+    # block of them, one per row; the gradient has the shape of params.
+    def loglikelihoodGradientForParams(self, rFunc, params):
+
+        A, slopeRow = self.linearOperator(rFunc)
+        params = np.asarray(params, dtype=float)
+        rVals = params @ A.T
+        df = params @ slopeRow
+
+        slopeCutoff = 0.02
+        steep = np.abs(df)>slopeCutoff
+        logFactor = np.where(steep, -2*(df-slopeCutoff)/slopeCutoff, 0.0)
+        dr = (rVals - self.rDat)/self.sigma/sqrt(2)
+        logL = logFactor - np.sum(np.multiply(dr, dr), axis=-1)
+
+        grad = (-sqrt(2)/self.sigma*(dr @ A)
+                - np.multiply.outer(np.where(steep, 2/slopeCutoff, 0.0),
+                                    slopeRow))
 
+        if params.ndim == 1:
+            return float(logL), grad
+        return logL, grad
 
+    def likelihoodForParams(self, rFunc, params):
+        logL = self.loglikelihoodForParams(rFunc, params)
+        if np.ndim(logL) == 0:
+            return exp(logL)
+        return np.exp(logL)
 
 
 
@@ -6,6 +6,19 @@ import matplotlib.pyplot as plt
 import matplotlib as mpl
 
 
+# The models' eval() and evalDerivs() accept either a scalar or a NumPy
+# array of prey densities. The math module's functions are much faster
+# than NumPy's on scalars, so NumPy's are only used for arrays.
+def expOf(y):
+    return np.exp(y) if isinstance(y, np.ndarray) else exp(y)
+
+def tanhOf(y):
+    return np.tanh(y) if isinstance(y, np.ndarray) else tanh(y)
+
+def coshOf(y):
+    return np.cosh(y) if isinstance(y, np.ndarray) else cosh(y)
+
+
 class MultiParamResponseFunction:
 
     def __init__(self, params):
@@ -49,14 +62,14 @@ class IvlevModel(MultiParamResponseFunction):
     def eval(self, y):
         a = self.params[0]
         b = self.params[1]
-        return a/b * (1.0 - exp(-b*y))
+        return a/b * (1.0 - expOf(-b*y))
 
 
     def evalDerivs(self, y):
         a = self.params[0]
         b = self.params[1]
 
-        ex = exp(-b*y)
+        ex = expOf(-b*y)
         return (a/b*(1-ex), a*ex, -a*b*ex)
 
 
@@ -72,14 +85,14 @@ class TanhModel(MultiParamResponseFunction):
     def eval(self, y):
         a = self.params[0]
         b = self.params[1]
-        return a/b * tanh(b*y)
+        return a/b * tanhOf(b*y)
 
     def evalDerivs(self, y):
         a = self.params[0]
         b = self.params[1]
 
-        t = tanh(b*y)
-        s = 1.0/cosh(b*y)
+        t = tanhOf(b*y)
+        s = 1.0/coshOf(b*y)
         return (a/b*t, a*s*s, -2*a*b*t*s*s)
 
     def name(self):
@@ -97,6 +110,12 @@ class CombinationModel(MultiParamResponseFunction):
                       + self.ivlev.eval(y)
                       + self.tanh.eval(y))
 
+    def evalDerivs(self, y):
+        h = self.holling.evalDerivs(y)
+        i = self.ivlev.evalDerivs(y)
+        t = self.tanh.evalDerivs(y)
+        return tuple(1/3.0*(h[j] + i[j] + t[j]) for j in range(3))
+
     def setParams(self, params):
         self.params = np.array(params)
         self.holling.setParams([params[0], params[1]])
@@ -118,10 +137,10 @@ def showModels():
     mt = TanhModel()
     mc = CombinationModel()
     f = 1.225
-    rh = f*np.array([mh.eval(xi) for xi in x])
-    ri = f*np.array([mi.eval(xi) for xi in x])
-    rt = f*np.array([mt.eval(xi) for xi in x])
-    rc = f*np.array([mc.eval(xi) for xi in x])
+    rh = f*mh.eval(x)
+    ri = f*mi.eval(x)
+    rt = f*mt.eval(x)
+    rc = f*mc.eval(x)
 
     csv = np.genfromtxt('../ExperimentalData/FloraEtAl2011.csv', delimiter=",")
     xDat = csv[:,0]
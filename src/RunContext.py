@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+import hashlib
+import json
+
+# Objects that a worker builds for a run and can reuse for the next one:
+# response functions with their spline solvers, the response data with
+# its cached linear operators, model managers with their drivers, and
+# stored samples. A worker keeps one RunContext for its lifetime and
+# calls useSettings() at the start of each task; the cache is emptied
+# whenever the settings differ from the ones it was built for, so
+# nothing built for one set of settings is used with another.
+#
+# Cached objects are shared between tasks, so a task that changes one
+# (the model manager's D, a response function's parameters) must set
+# it up for itself rather than rely on its state from the last task.
+
+
+# Hash of a settings dict, the same for equal settings whatever order
+# their keys are in
+def settingsHash(settings):
+    text = json.dumps(settings, sort_keys=True, default=repr)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class RunContext:
+
+    def __init__(self):
+        self.settingsKey = None
+        self.items = {}
+        self.numBuilt = 0
+        self.numReused = 0
+
+    # Start a task with these settings, emptying the cache if they have
+    # changed
+    def useSettings(self, settings):
+        key = settingsHash(settings)
+        if key != self.settingsKey:
+            self.items = {}
+            self.settingsKey = key
+
+    # Cached object for key, made by calling build() the first time
+    def get(self, key, build):
+        if key in self.items:
+            self.numReused += 1
+        else:
+            self.items[key] = build()
+            self.numBuilt += 1
+        return self.items[key]
@@ -76,7 +76,7 @@ def showResponseCurves(figNum, modelMgr, limPtParams, limCycleParams, imgName):
         x = np.linspace(0,90,200)
         respFunc.setParams(p)
         f  =1.225
-        r = f*np.array([respFunc.eval(xi) for xi in x])
+        r = f*respFunc.eval(x)
         plt.plot(x/360, r, 'r-')
 
 
@@ -84,7 +84,7 @@ def showResponseCurves(figNum, modelMgr, limPtParams, limCycleParams, imgName):
         x = np.linspace(0,90,200)
         respFunc.setParams(p)
         f  =1.225
-        r = f*np.array([respFunc.eval(xi) for xi in x])
+        r = f*respFunc.eval(x)
         plt.plot(x/360, r, 'b-')
 
     csv = np.genfromtxt('../ExperimentalData/FloraEtAl2011.csv', delimiter=",")
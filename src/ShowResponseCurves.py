@@ -12,7 +12,8 @@ from ChemostatModelMgr import *
 
 def showResponseCurves(name, imgName, modelMgr, limPtParams, limCycleParams,
                        numToShow=100,
-                       axis = [0.0, 0.25, 0.0, 0.25]):
+                       axis = [0.0, 0.25, 0.0, 0.25],
+                       rng = None):
     #fig = plt.figure()
 
     nlp = len(limPtParams)
@@ -20,26 +21,28 @@ def showResponseCurves(name, imgName, modelMgr, limPtParams, limCycleParams,
     nTot = nlp + nlc
     nlpToShow = int(ceil(numToShow*float(nlp)/nTot))
     nlcToShow = int(ceil(numToShow*float(nlc)/nTot))
+    if rng is None:
+        rng = np.random.default_rng()
 
     if nlpToShow>0:
-        samp = np.random.choice(nlp, min(nlpToShow, nlp), False)
+        samp = rng.choice(nlp, min(nlpToShow, nlp), False)
         for i in samp:
             p = limPtParams[i]
             x = np.linspace(0,90,200)
             modelMgr.responseFunc.setParams(p)
             f  =1.225
-            r = f*np.array([modelMgr.responseFunc.eval(xi) for xi in x])
+            r = f*modelMgr.responseFunc.eval(x)
             plt.plot(x/360, r, 'r-', linewidth=1.0)
 
 
     if nlcToShow>0:
-        samp = np.random.choice(nlc, min(nlcToShow, nlc), False)
+        samp = rng.choice(nlc, min(nlcToShow, nlc), False)
         for i in samp:
             p = limCycleParams[i]
             x = np.linspace(0,90,200)
             modelMgr.responseFunc.setParams(p)
             f  =1.225
-            r = f*np.array([modelMgr.responseFunc.eval(xi) for xi in x])
+            r = f*modelMgr.responseFunc.eval(x)
             plt.plot(x/360, r, 'b-', linewidth=1.0)
 
 
@@ -75,7 +78,7 @@ def showSampledResponseCurves(title, imgName, responseFunc,
         x = np.linspace(0,90,200)
         responseFunc.setParams(params)
         f  =1.225
-        r = f*np.array([responseFunc.eval(xi) for xi in x])
+        r = f*responseFunc.eval(x)
 
         plt.plot(x/360, r, lineSpec, linewidth=0.5)
 
@@ -113,8 +116,9 @@ def showSampledResponseDerivs(title, imgName, responseFunc,
         x = np.linspace(0,90,600)
         responseFunc.setParams(params)
         f  =1.225
-        r1 = f*np.array([responseFunc.evalDerivs(xi)[1] for xi in x])
-        r2 = f*np.array([responseFunc.evalDerivs(xi)[2] for xi in x])
+        r0, r1, r2 = responseFunc.evalDerivs(x)
+        r1 = f*r1
+        r2 = f*r2
         plt.plot(x/360, r2, lineSpec, linewidth=0.5)
         #plt.plot(x/360, r2, lineSpec, linewidth=0.5)
 
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+import numpy as np
+from math import ceil
+from SettingsHandler import *
+from Logger import *
+from MHSampler import *
+
+
+# MH sampler that evaluates likelihoods speculatively. From the current
+# state it makes a batch of proposals, as if each of them will be
+# rejected, and evaluates all their log-likelihoods with one call to the
+# model manager's loglikelihoodBlock(). The accept/reject decisions are
+# then made one at a time, in order. When a proposal is accepted, the
+# rest of the batch is thrown away, since it was drawn from the old
+# state, and the next step starts a new batch.
+#
+# Each proposal used is drawn from the chain's current state and tested
+# exactly as in MHSampler, and the thrown-away proposals are independent
+# of the decisions made, so the chain has the same distribution as the
+# serial one. The random stream is used in a different order, so the
+# samples themselves differ.
+#
+# The batch size is 'Speculation Depth' if given; otherwise it's the
+# expected number of proposals to the next acceptance, from the
+# acceptance rate so far, capped at 'Max Speculation Depth'. The
+# proposal generator needs a proposals() method; without one, each step
+# makes a single proposal as in MHSampler.
+
+class SpeculativeMHSampler(MHSampler):
+    defaultSettings = dict(MHSampler.defaultSettings)
+    defaultSettings.update({
+        'Speculative' : True,
+        'Speculation Depth' : None,
+        'Max Speculation Depth' : 32
+        })
+
+    # Proposals made from the current state and not used yet, as a list
+    # of (params, log-likelihood) pairs with the next one last
+    def startChain(self):
+        MHSampler.startChain(self)
+        self.pending = []
+        self.stats['Discarded'] = 0
+        self.stats['Batches'] = 0
+
+    def step(self):
+
+        if len(self.pending) == 0:
+            self.speculate()
+        fCur, logLCur = self.pending.pop()
+
+        if logLCur is None:
+            # The batch failed, so try this one on its own. If it fails
+            # too, it's handled as in MHSampler, which moves the chain to
+            # the failed proposal.
+            try:
+                logLCur = self.modelMgr.loglikelihood(fCur)
+            except (RuntimeError, ArithmeticError) as e:
+                if self.settings['Abort on Proposal Failure']:
+                    raise RuntimeError('MHSampler: proposal failed with error {}'.format(e))
+                if self.settings['Warning on Proposal Failure']:
+                    Logger.write('MHSampler Warning: Likelihood calculation failed with error {}'.format(e))
+                self.fPrev = np.copy(fCur)
+                self.discardPending()
+                return None
+
+        if self.accept(logLCur, self.logLPrev):
+            self.logLPrev = logLCur
+            self.fPrev = np.copy(fCur)
+            self.discardPending()
+            return True
+        return False
+
+    # Make and evaluate a batch of proposals from the current state. If
+    # the batched likelihood fails, the proposals are evaluated one at a
+    # time as they come up.
+    def speculate(self):
+
+        depth = self.speculationDepth()
+        if depth > 1 and hasattr(self.proposalGenerator, 'proposals'):
+            block = self.proposalGenerator.proposals(self.fPrev, depth)
+        else:
+            block = [self.proposalGenerator.proposal(self.fPrev)]
+
+        try:
+            logL = self.modelMgr.loglikelihoodBlock(block)
+        except (RuntimeError, ArithmeticError):
+            logL = [None]*len(block)
+
+        self.pending = list(zip(block, logL))[::-1]
+        self.stats['Batches'] += 1
+
+    def speculationDepth(self):
+
+        depth = self.settings['Speculation Depth']
+        if depth is not None:
+            return depth
+
+        stats = self.stats
+        accepts = stats['Burns'] + stats['Accepts']
+        tries = accepts + stats['Burn Rejects'] + stats['Rejects']
+        rate = (accepts + 1.0)/(tries + 1.0)
+        return max(1, min(self.settings['Max Speculation Depth'],
+                          int(ceil(1.0/rate))))
+
+    def discardPending(self):
+        self.stats['Discarded'] += len(self.pending)
+        self.pending = []
+
+    # Fraction of the evaluated likelihoods that were used
+    def speculationEfficiency(self):
+        used = (self.stats['Burns'] + self.stats['Burn Rejects']
+                + self.stats['Accepts'] + self.stats['Rejects'])
+        return used/max(used + self.stats['Discarded'], 1)
+
+    def reportProposals(self):
+        MHSampler.reportProposals(self)
+        if self.settings['Verbosity'] > 0:
+            Logger.write('Speculative MH: %d batches, %d proposals discarded, '
+                         'efficiency %g'
+                         % (self.stats['Batches'], self.stats['Discarded'],
+                            self.speculationEfficiency()))
+
+    # The unused proposals are part of the chain's state, so that a
+    # resumed chain carries on exactly
+    def chainState(self):
+        state = MHSampler.chainState(self)
+        state['Pending'] = list(self.pending)
+        return state
+
+    def restoreChain(self, state, restoreRNG=True):
+        MHSampler.restoreChain(self, state, restoreRNG)
+        self.pending = list(state.get('Pending', []))
+        self.stats.setdefault('Discarded', 0)
+        self.stats.setdefault('Batches', 0)
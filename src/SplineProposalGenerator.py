@@ -9,11 +9,12 @@ from ResponseData import *
 from scipy.interpolate import interp1d
 import numpy.random
 import scipy.ndimage
+from RandomStreams import *
 
 
 
 class SplineProposalGenerator:
-    def __init__(self, splineResp, settings):
+    def __init__(self, splineResp, settings, rng=None):
         self.nx = splineResp.nx
         self.xMax = splineResp.xMax
         self.X = splineResp.X
@@ -31,19 +32,49 @@ class SplineProposalGenerator:
         self.alpha = ((self.h/self.sigVals)**2 - 4)/8
         self.beta = ((self.h/self.sigVals)**2 - 4)/8
 
+        # The smoothing filter is linear, so apply it as a matrix: row i
+        # of logf @ smoother is gaussian_filter1d of row i
+        self.smoother = scipy.ndimage.gaussian_filter1d(
+            np.eye(self.nx), self.filterWidth, axis=0).T
+
+        if rng is None:
+            rng = BufferedRNG()
+        self.rng = rng
+
         #print('alpha={}\nbeta={}\n'.format(self.alpha,self.beta))
 
+    def setRNG(self, rng):
+        self.rng = rng
+
     def proposal(self, fParams):
+        return self.proposals(fParams, 1)[0]
+
+    # Make k proposals from fParams at once, returned as the rows of a
+    # (k, nx) array. These are the proposals that k calls to proposal()
+    # would have made from fParams, up to rounding in the matrix product.
+    def proposals(self, fParams, k):
         a = self.a
         b = self.b
         wOld = self.wOld
 
-        xi = np.random.default_rng().beta(self.alpha, self.beta)
+        xi = self.rng.betas(self.alpha, self.beta, k)
         logf = (wOld*np.log(fParams) + (1-wOld)*(a + (b-a)*xi))
-        logf = scipy.ndimage.gaussian_filter1d(logf, self.filterWidth)
+        logf = logf @ self.smoother
 
         return np.exp(logf)
 
+    # Box in log-parameter space that the proposals are drawn from
+    def logBounds(self):
+        return (self.a, self.b)
+
+    # Log-density, up to a constant, and its gradient of a Gaussian in
+    # log-parameter space with the centre and spread of the beta draws
+    # (whose variance is sigVals**2), for samplers that need a prior.
+    # For a block of logf, one per row, there is one value per row.
+    def logPrior(self, logf):
+        z = (logf - np.log(self.fInit))/self.sigVals
+        return -0.5*np.sum(z*z, axis=-1), -z/self.sigVals
+
     def getInit(self):
         logf = np.array([self.logInitFitFunc(x) for x in self.X])
         return np.exp(logf)
@@ -99,7 +130,7 @@ if __name__=='__main__':
     f = gen.getInit()
     for i in range(30):
         resp.setParams(f)
-        r = np.array([resp.eval(x) for x in X])
+        r = resp.eval(X)
         plt.plot(X/360, r)
         for skip in range(100):
             f = gen.proposal(f)
@@ -25,17 +25,39 @@ class SplineResponseFunction:
         self.fParams = params
         self.solver.solve(self.fParams)
 
-        self.responseData = np.array([self.eval(x) for x in self.X])
+        self.responseData = self.eval(self.X)
 
     def getParams(self):
         return self.fParams
 
+    # Response functions with the same key share linear operators
+    def linearKey(self):
+        return (self.name(), self.xMax, self.nx)
+
+    # y can be a scalar or a NumPy array
     def eval(self, y):
         return self.solver.interpolate(y)
 
     def evalDerivs(self, y):
         return self.solver.interpolateDerivs(y)
 
+    # The spline is linear in its parameters, so its values and first
+    # nDerivs derivatives at fixed points xVals are matrices times the
+    # parameter vector. Return those matrices, each len(xVals) x nx.
+    def linearOperator(self, xVals, nDerivs=0):
+        xVals = np.asarray(xVals, dtype=float)
+        solver = SplineSolver(self.xMax, self.nx)
+        ops = [np.zeros((len(xVals), self.nx)) for k in range(nDerivs+1)]
+        unit = np.zeros(self.nx)
+        for j in range(self.nx):
+            unit[j] = 1.0
+            solver.solve(unit)
+            unit[j] = 0.0
+            vals = solver.interpolateArray(xVals, nDerivs)
+            for k in range(nDerivs+1):
+                ops[k][:,j] = vals[k]
+        return tuple(ops)
+
     def isInInterval(self, a, b, x):
         if x>=a and x<=b:
             return True
@@ -43,11 +65,7 @@ class SplineResponseFunction:
 
 
     def tabulateVals(self, xVals):
-        y = np.zeros(len(xVals))
-
-        for i in range(0,len(xVals)):
-            y[i]=self.interpolate(xVals[i])
-        return y
+        return self.eval(np.asarray(xVals, dtype=float))
 
     def setParamsFromResponse(self, rFunc):
         nx = self.nx
@@ -25,36 +25,27 @@ class SplineSolver:
 
         N = self.N
         h = self.h
-        c = self.c
 
         # There are N nodes, numbered 0 to N-1.
         # There are N-1 intervals, numbered 0 to N-2.
+        # View c as an (N-1) x 4 array, one row of coefficients per interval
+        C = np.reshape(self.c, (N-1, 4))
+        w = np.asarray(wDat, dtype=float)
 
-        # Use BC at 0 to set c_0 in first interval
-        c[0] = 0
+        # c_2 and c_3 come straight from the data on each interval
+        C[:,2] = -(h*h/2.0)*w[:N-1]
+        C[:,3] = -(h*h/6.0)*(w[1:N] - w[:N-1])
 
+        # The BC at N*h sets c_1 on the last interval, and then
+        # c_1[i] = c_1[i+1] - 2 c_2[i] - 3 c_3[i], so c_1 is a cumulative
+        # sum taken from the right
+        s = 2.0*C[:,2] + 3.0*C[:,3]
+        C[:,1] = -np.cumsum(s[::-1])[::-1]
 
-        # First pass to compute c_2 and c_3
-        for i in range(0,N-1):
-            a0 = wDat[i]
-            a1 = wDat[i+1]-wDat[i]
-            c[4*i+2] = -(h*h/2.0)*a0
-            c[4*i+3] = -(h*h/6.0)*a1
-
-
-        # Use BC at N*h to compute c_1 at interval N-2
-        c[4*(N-2)+1] = -2.0*c[4*(N-2)+2] - 3.0*c[4*(N-2)+3]
-
-        # Second pass to compute c_1 at intervals (N-2) to 0
-        for i in range(N-3,-1,-1):
-            c[4*i+1] = c[4*(i+1)+1] - 2*c[4*i+2] - 3*c[4*i+3]
-
-
-        # Final pass to compute c_0 at intervals 1 to N-2
-        for i in range(0,N-2):
-            c[4*(i+1)] = c[4*i] + c[4*i+1] + c[4*i+2] + c[4*i+3]
-
-#        print c
+        # The BC at 0 sets c_0 = 0 on the first interval, and continuity
+        # gives c_0[i+1] = c_0[i] + c_1[i] + c_2[i] + c_3[i]
+        C[0,0] = 0.0
+        C[1:,0] = np.cumsum(C[:-1,1] + C[:-1,2] + C[:-1,3])
 
 
 
@@ -63,62 +54,60 @@ class SplineSolver:
             return True
         return False
 
+    # Index of the interval containing x: -1 to the left of the grid,
+    # N-1 or more to the right of it. The grid is uniform, so this is
+    # just floor(x/h).
     def locatePoint(self, x):
 
-        h = self.h
-        n = self.N
-
         if x < 0:
             return -1
-        if x > n*h:
-            return self.N
-
-        low = 0
-        high = self.N
-        while high-low > 1:
-            mid = (high+low)/2
-            if x >= mid*h:
-                low=mid
-            else:
-                high=mid
-        return low
+        return min(int(x/self.h), self.N)
+
+    # Array version of locatePoint, clipped to [-1, N-1]
+    def locatePoints(self, x):
+        return np.clip(np.floor(x/self.h).astype(int), -1, self.N-1)
+
+    # The interpolation and derivative functions below accept either a
+    # scalar x or a NumPy array of x values, returning results of the same
+    # shape. Beyond the last node the spline is continued as a constant,
+    # and to the left of 0 it is zero.
 
     def interpolate(self, x):
 
-        i = int(self.locatePoint(x))
-        #print (x,i)
+        if isinstance(x, np.ndarray):
+            return self.interpolateArray(x)[0]
+
+        i = self.locatePoint(x)
         if i<0:
             return 0
 
 
         if i>=(self.N-1):
             C = self.c[4*(self.N-2):4*(self.N-2)+4]
-#            print C
             return C[0] + C[1] + C[2] + C[3]
 
         t = (x-i*self.h)/self.h
 
         C = self.c[4*i:4*i+4]
-#        print C
         return C[0] + t*(C[1] + t*(C[2] + t*C[3]))
 
     def interpolateDerivs(self, x):
 
-        i = int(self.locatePoint(x))
-        #print (x,i)
+        if isinstance(x, np.ndarray):
+            return self.interpolateArray(x, 2)
+
+        i = self.locatePoint(x)
         if i<0:
             return (0,0,0)
 
 
         if i>=(self.N-1):
             C = self.c[4*(self.N-2):4*(self.N-2)+4]
-#            print C
             return (C[0] + C[1] + C[2] + C[3], 0, 0)
 
         t = (x-i*self.h)/self.h
 
         C = self.c[4*i:4*i+4]
-#        print C
         return (C[0] + t*(C[1] + t*(C[2] + t*C[3])),
                 (C[1] + t*(2*C[2] + t*3*C[3]))/self.h,
                 (2*C[2] + t*6*C[3])/self.h/self.h
@@ -126,6 +115,9 @@ class SplineSolver:
 
     def deriv2(self, x):
 
+        if isinstance(x, np.ndarray):
+            return self.interpolateArray(x, 2)[2]
+
         i = self.locatePoint(x)
         if i<0:
             return 0
@@ -140,6 +132,9 @@ class SplineSolver:
 
     def deriv1(self, x):
 
+        if isinstance(x, np.ndarray):
+            return self.interpolateArray(x, 1)[1]
+
         i = self.locatePoint(x)
         if i<0:
             return 0
@@ -150,9 +145,43 @@ class SplineSolver:
         t = (x-i*self.h)/self.h
 
         C = self.c[4*i:4*i+4]
-#        print (t, C, C[1], 3.0*t*t*C[3], C[1]+3.0*t*t*C[3])
         return (C[1] + t*(2.0*C[2] + t*3.0*C[3])) /self.h
 
+    # Evaluate the spline and its first nDerivs derivatives at an array
+    # of points. Returns a tuple of arrays shaped like x.
+    def interpolateArray(self, x, nDerivs=0):
+
+        N = self.N
+        h = self.h
+        x = np.asarray(x, dtype=float)
+
+        i = self.locatePoints(x)
+        left = i < 0
+        right = i >= N-1
+        i = np.clip(i, 0, N-2)
+        t = (x - i*h)/h
+
+        C = np.reshape(self.c, (N-1, 4))[i]
+        c0 = C[...,0]
+        c1 = C[...,1]
+        c2 = C[...,2]
+        c3 = C[...,3]
+
+        rightVal = np.sum(self.c[4*(N-2):4*(N-2)+4])
+        f = c0 + t*(c1 + t*(c2 + t*c3))
+        f = np.where(left, 0.0, np.where(right, rightVal, f))
+        rtn = [f]
+
+        outside = left | right
+        if nDerivs >= 1:
+            df = (c1 + t*(2.0*c2 + t*3.0*c3))/h
+            rtn.append(np.where(outside, 0.0, df))
+        if nDerivs >= 2:
+            d2f = (2.0*c2 + t*6.0*c3)/h/h
+            rtn.append(np.where(outside, 0.0, d2f))
+
+        return tuple(rtn)
+
 
 
     def linInterp(self, wDat, x):
@@ -171,11 +200,7 @@ class SplineSolver:
 
 
     def tabulateVals(self, xVals):
-        y = np.zeros(len(xVals))
-
-        for i in range(0,len(xVals)):
-            y[i]=self.interpolate(xVals[i])
-        return y
+        return self.interpolate(np.asarray(xVals, dtype=float))
 
 
 if __name__=='__main__':
@@ -202,10 +227,7 @@ if __name__=='__main__':
         zEx = [-sin(t) for t in x]
         f2 = [r.linInterp(w, t)+0.01 for t in x]
 
-        for i in range(len(x)):
-            z[i] = r.interpolate(x[i])
-            z2[i] = r.deriv2(x[i])
-            z1[i] = r.deriv1(x[i])
+        z, z1, z2 = r.interpolateDerivs(x)
 
 
         print('{%d, %20.15f}' % (nx, np.linalg.norm(z-zEx,np.inf)), end=' ')
@@ -1,10 +1,10 @@
 #import matplotlib
 #matplotlib.use('Agg')
 
-from mpi4py import MPI
-from Boss import *
-from Worker import *
 from Task import *
+import Task
+from LocalBoss import *
+from RunContext import *
 import logging
 from SplineResponseFunction import *
 from ChemostatModelMgr import *
@@ -12,7 +12,15 @@ from LimitPointSampleHandler import *
 from ResponseData import *
 from SplineProposalGenerator import *
 from MultiParamProposalGenerator import *
+from AdaptiveProposalGenerator import *
+from RandomStreams import *
 from MHSampler import *
+from MultiChainMHSampler import *
+from PipelinedMHSampler import *
+from SpeculativeMHSampler import *
+from MultipleTryMHSampler import *
+from GradientMHSampler import *
+from EnsembleSampler import *
 from StoredParamSampler import *
 from ShowResponseCurves import *
 from ShowContours import *
@@ -30,7 +38,78 @@ import os
 
 
 
-def runSampler(settings, D, Nx=32):
+def makeResponseFunction(rfSettings, Nx):
+    if rfSettings['Type']=='Spline':
+        return SplineResponseFunction(
+            rfSettings['Settings']['X Max'],
+            Nx)
+            #rfSettings['Settings']['NX Grid'])
+    elif rfSettings['Type'] == 'Tanh':
+        return TanhModel()
+    elif rfSettings['Type'] == 'Ivlev':
+        return IvlevModel()
+    elif rfSettings['Type'] == 'Holling':
+        return HollingModel()
+    else:
+        raise RuntimeError('Unimplemented Response function %s' % rfSettings['Type'])
+
+
+
+# Response function, response data and model manager for a run at D,
+# taken from the worker's context where they've been built before. Only
+# spline response functions are kept, since the parametric ones are
+# cheap to make and their parameters are where MH chains start from.
+def makeRunObjects(settings, D, Nx, context):
+
+    rfSettings = settings['Response Function']
+    if rfSettings['Type']=='Spline':
+        rFunc = context.get(('Response Function', Nx),
+                            lambda: makeResponseFunction(rfSettings, Nx))
+    else:
+        rFunc = makeResponseFunction(rfSettings, Nx)
+
+    rData = context.get(('Response Data',),
+                        lambda: ResponseData(settings['Response Data']))
+
+    if rfSettings['Type']!='Spline':
+        return rFunc, rData, ChemostatModelMgr(rFunc, rData,
+                                               settings['Model Manager'], D)
+    modelMgr = context.get(('Model Manager', Nx),
+                           lambda: ChemostatModelMgr(rFunc, rData,
+                                                     settings['Model Manager'],
+                                                     D))
+    modelMgr.setD(D)
+    return rFunc, rData, modelMgr
+
+
+# Stored samples from each of a list of files, read once per context
+def readStoredParamsForFiles(filenames, context):
+    return [context.get(('Stored Params', f),
+                        lambda f=f: readStoredParamFile(f))
+            for f in filenames]
+
+
+# Set up the proposal generator described by pgSettings
+def makeProposalGenerator(pgSettings, rFunc, rng):
+    print(('found propgen type=%s' % pgSettings['Type']))
+    if pgSettings['Type']=='Spline':
+        return SplineProposalGenerator(rFunc, pgSettings['Settings'], rng)
+    elif pgSettings['Type']=='MultiParam':
+        return MultiParamProposalGenerator(rFunc, pgSettings['Sigma'], rng)
+    else:
+        raise RuntimeError('Unimplemented proposal generator %s' % pgSettings['Type'])
+
+
+# Run the sampler for one D. If resumeFrom names a checkpoint, the chain
+# starts from it instead of burning in: resumeMode 'Full' carries on with
+# that run, and 'Chain' starts new samples from its burned-in chain.
+# Workers pass their RunContext, to reuse what earlier runs set up.
+def runSampler(settings, D, Nx=32, resumeFrom=None, resumeMode='Full',
+               context=None):
+
+    if context is None:
+        context = RunContext()
+    context.useSettings(settings)
 
     name = settings['Run Name']
     dirname = settings['Output Directory']
@@ -44,53 +123,79 @@ def runSampler(settings, D, Nx=32):
 
     logName = '%s/%s-n-%d-D-%f.log' % (dirname, name, Nx, D)
 
-    Logger.openLog(logName, settings)
+    Logger.openLog(logName, settings,
+                   mode=('a' if resumeFrom is not None else 'w'))
 
-    # Set up response function
+    # Set up response function, response function experimental data set
+    # and chemostat model manager
     rfSettings = settings['Response Function']
-    if rfSettings['Type']=='Spline':
-        rFunc = SplineResponseFunction(
-            rfSettings['Settings']['X Max'],
-            Nx)
-            #rfSettings['Settings']['NX Grid'])
-    elif rfSettings['Type'] == 'Tanh':
-        rFunc = TanhModel()
-    elif rfSettings['Type'] == 'Ivlev':
-        rFunc = IvlevModel()
-    elif rfSettings['Type'] == 'Holling':
-        rFunc = HollingModel()
-    else:
-        raise RuntimeError('Unimplemented Response function %s' % rfSettings['Type'])
-
-    # Set up response function experimental data set
-    rData = ResponseData(settings['Response Data'])
-
-    # Set up chemostat model manager
-    modelMgr = ChemostatModelMgr(rFunc, rData,
-                                 settings['Model Manager'], D)
+    rFunc, rData, modelMgr = makeRunObjects(settings, D, Nx, context)
 
     # Set up sample handler
     sampleHandler = LimitPointSampleHandler(settings['Sample Handler'])
 
+    # Random stream for this run, determined by the run's seed and D
+    rng = BufferedRNG(seedSequenceFor(settings.get('Seed'),
+                                      int(round(1.0e6*D)), Nx))
+
     # Set up sampler
     samplerSpec = settings['Sampler']
     if samplerSpec['Type']=='MH': # Metropolis-Hastings sampler
         # Set up proposal generator
         pgSettings = samplerSpec['Proposal Generator']
-        print(('found propgen type=%s' % pgSettings['Type']))
-        if pgSettings['Type']=='Spline':
-            propGen = SplineProposalGenerator(rFunc, pgSettings['Settings'])
-        elif pgSettings['Type']=='MultiParam':
-            propGen = MultiParamProposalGenerator(rFunc, pgSettings['Sigma'])
-        else:
-            raise RuntimeError('Unimplemented proposal generator %s' % pgSettings['Type'])
+        propGen = makeProposalGenerator(pgSettings, rFunc, rng)
+        # Optionally adapt the proposals to the chain during burn-in
+        if pgSettings.get('Adaptive') is not None:
+            propGen = AdaptiveProposalGenerator(propGen,
+                                                pgSettings['Adaptive'])
+
+        # Single chains are checkpointed next to the log, if asked for
+        mhControl = dict(samplerSpec['MH Control'])
+        if mhControl.get('Num Chains', 1) == 1:
+            if mhControl.get('Checkpoint Interval') is not None:
+                mhControl.setdefault('Checkpoint File',
+                    '%s/%s-n-%d-D-%f.ckpt' % (dirname, name, Nx, D))
+            mhControl['Resume From'] = resumeFrom
+            mhControl['Resume Mode'] = resumeMode
 
         # Set up sampler
-        sampler = MHSampler(modelMgr, propGen, sampleHandler,
-                            samplerSpec['MH Control'])
+        checkSamplerChoice(mhControl)
+        if mhControl.get('Num Chains', 1) > 1:
+            sampler = MultiChainMHSampler(modelMgr, propGen, sampleHandler,
+                                          mhControl, rng)
+        elif mhControl.get('Gradient Method') == 'MALA':
+            sampler = MALASampler(modelMgr, propGen, sampleHandler,
+                                  mhControl, rng=rng)
+        elif mhControl.get('Gradient Method') == 'HMC':
+            sampler = HMCSampler(modelMgr, propGen, sampleHandler,
+                                 mhControl, rng=rng)
+        elif mhControl.get('Num Tries', 1) > 1:
+            sampler = MultipleTryMHSampler(modelMgr, propGen, sampleHandler,
+                                           mhControl, rng=rng)
+        elif mhControl.get('Speculative', False):
+            sampler = SpeculativeMHSampler(modelMgr, propGen, sampleHandler,
+                                           mhControl, rng=rng)
+        elif mhControl.get('Pipelined', False):
+            sampler = PipelinedMHSampler(modelMgr, propGen, sampleHandler,
+                                         mhControl, rng=rng)
+        else:
+            sampler = MHSampler(modelMgr, propGen, sampleHandler,
+                                mhControl, rng=rng)
+    elif samplerSpec['Type']=='Ensemble': # Stretch-move ensemble sampler
+        if resumeFrom is not None:
+            raise RuntimeError('The ensemble sampler cannot resume from a '
+                               'checkpoint')
+        # The proposal generator gives the starting walkers and the prior
+        propGen = makeProposalGenerator(samplerSpec['Proposal Generator'],
+                                        rFunc, rng)
+        sampler = EnsembleSampler(modelMgr, propGen, sampleHandler,
+                                  samplerSpec['Ensemble Control'], rng)
     elif samplerSpec['Type']=='Stored':
         filenames = samplerSpec['Filenames']
-        sampler = StoredParamSampler(modelMgr, filenames, sampleHandler)
+        sampler = StoredParamSampler(modelMgr, filenames, sampleHandler,
+                                     blockSize=samplerSpec.get('Block Size', 1),
+                                     storedParams=readStoredParamsForFiles(
+                                         filenames, context))
     else:
         pass
 
@@ -107,6 +212,7 @@ def runSampler(settings, D, Nx=32):
     Logger.write('\tname=%s D=%f' % (name, D))
     Logger.write('\t\tNumber of limit points: %d' % nlp)
     Logger.write('\t\tNumber of limit cycles: %d' % nlc)
+    modelMgr.reportEarlyStops()
     Logger.write('\n\n')
 
     lpp = sampleHandler.limitPointParams
@@ -121,7 +227,8 @@ def runSampler(settings, D, Nx=32):
     showCurves = False
     if showCurves==True:
         imgName = '%s/response-%s.%s' % (dirname, name, imgFormat)
-        showResponseCurves(name, imgName, modelMgr, lpp, lcp, numToShow)
+        showResponseCurves(name, imgName, modelMgr, lpp, lcp, numToShow,
+                           rng=rng)
     if doContours==True:
         imgName = '%s/contour-%s.%s' % (dirname, name, imgFormat)
         showContours(imgName, modelMgr, lpp, lcp)
@@ -144,41 +251,150 @@ def runSampler(settings, D, Nx=32):
 
 
 
+# Classify stored samples at every D in DVals in a single pass over the
+# samples, writing the per-D parameter files that runSampler() would have
+# written, plus a (samples x D) matrix of limit point labels.
+def runStoredSamplerForAllD(settings, DVals, Nx=32):
+
+    name = settings['Run Name']
+    dirname = settings['Output Directory']
+    os.makedirs(dirname, exist_ok=True)
+
+    logName = '%s/%s-n-%d-all-D.log' % (dirname, name, Nx)
+    Logger.openLog(logName, settings)
+
+    rFunc = makeResponseFunction(settings['Response Function'], Nx)
+    rData = ResponseData(settings['Response Data'])
+    modelMgr = ChemostatModelMgr(rFunc, rData,
+                                 settings['Model Manager'], DVals[0])
+
+    handlers = [LimitPointSampleHandler(settings['Sample Handler'])
+                for D in DVals]
+
+    samplerSpec = settings['Sampler']
+    sampler = MultiDStoredSampler(modelMgr, samplerSpec['Filenames'],
+                                  handlers, DVals,
+                                  blockSize=samplerSpec.get('Block Size', 500))
+    labels = sampler.run()
+
+    Logger.write('-- Results ---------------------------------------------\n')
+    modelMgr.reportEarlyStops()
+    for D, handler in zip(DVals, handlers):
+        writeStoredResultsForD(settings, D, Nx, handler.limitPointParams,
+                               handler.limitCycleParams, logName)
+    writeLimitPointLabels(settings, DVals, Nx, labels)
+
+    Logger.closeLog()
+
+    return labels
+
+
+# Log the counts for one D of a stored-sample sweep and write its limit
+# point and limit cycle parameter files
+def writeStoredResultsForD(settings, D, Nx, lpp, lcp, logName):
+
+    name = settings['Run Name']
+    dirname = settings['Output Directory']
+    Logger.write('\tname=%s D=%f LP=%d LC=%d' % (name, D, len(lpp), len(lcp)))
+
+    np.savetxt('%s/limitPointParams-%s-nx-%d-D-%f.csv' % (dirname, name, Nx, D),
+               np.array(lpp),
+               header=' Limit Point Parameters from run logged in %s'
+               % logName)
+    np.savetxt('%s/limitCycleParams-%s-nx-%d-D-%f.csv' % (dirname, name, Nx, D),
+               np.array(lcp),
+               header=' Limit Cycle Parameters from run logged in %s'
+               % logName)
+
+
+# Write the (samples x D) matrix of limit point labels
+def writeLimitPointLabels(settings, DVals, Nx, labels):
+
+    name = settings['Run Name']
+    dirname = settings['Output Directory']
+    np.savetxt('%s/limitPointLabels-%s-nx-%d.csv' % (dirname, name, Nx),
+               labels.astype(int), fmt='%d',
+               header=' 1 if sample (row) goes to a limit point at D (column)'
+               '\n D = %s' % ' '.join(['%f' % D for D in DVals]))
+
+
+# Split a sweep over stored samples into tasks (D, start, stop), each
+# classifying samples start to stop-1 at one D. The chunks of one D are
+# spread through the list, so the slow D values aren't all left to the
+# end.
+def makeSweepTasks(DVals, numSamples, chunkSize):
+    return [(D, start, min(start + chunkSize, numSamples))
+            for start in range(0, numSamples, chunkSize)
+            for D in DVals]
+
+
+# Classify a block of stored samples at dilution rate D. Returns a
+# boolean array that is True where a sample goes to a limit point.
+def classifyStoredChunk(settings, block, D, Nx, context=None):
+
+    if context is None:
+        context = RunContext()
+    context.useSettings(settings)
+    rFunc, rData, modelMgr = makeRunObjects(settings, D, Nx, context)
+    handler = LimitPointSampleHandler(settings['Sample Handler'])
+
+    results = modelMgr.runBlock(block)
+    return np.array([handler.process(modelMgr, params, res)
+                     for params, res in zip(block, results)], dtype=bool)
+
+
+
+# Settings for classifying the stored D=0.05 spline samples
+def makeStoredSweepSettings(dirName):
+
+    storedSampleDir = '../Results/Spline-Runs/Spline-N-64/'
+    storedSampleTag = 'Spline-nx-64-D-0.050000'
+    storedSampleFiles = (
+        storedSampleDir+'limitCycleParams-%s.csv' % storedSampleTag,
+        storedSampleDir+'limitPointParams-%s.csv' % storedSampleTag
+        )
+
+    # Integrate the stored samples in blocks with the ensemble
+    # driver; this needs one of the embedded stepper methods.
+    samplerSettings = {
+        'Type' : 'Stored',
+        'Filenames' : storedSampleFiles,
+        'Block Size' : 500
+        }
+
+
+    responseFunc = splineResp
+    propGen = splinePropGen
+    numSamples = 10000
+
+    name = 'Spline'
+    settings = makeRunSettings(name, dirName, responseFunc,
+        propGen, numSamples, samplerSettings)
+    settings['Model Manager']['Stepper Control']['Method'] = 'DP54'
+
+    return settings
+
+
+
 class RunnerFunction(Task.Function):
 
     def __init__(self, rank, dirName, dryRun=False):
         self.rank = rank
         self.dirName = dirName
         self.dryRun = dryRun
+        # Kept for the life of the worker
+        self.context = RunContext()
 
     def run(self, arg):
 
-        storedSampleDir = '../Results/Spline-Runs/Spline-N-64/'
-        storedSampleTag = 'Spline-nx-64-D-0.050000'
-        storedSampleFiles = (
-            storedSampleDir+'limitCycleParams-%s.csv' % storedSampleTag,
-            storedSampleDir+'limitPointParams-%s.csv' % storedSampleTag
-            )
-
-        samplerSettings = {
-            'Type' : 'Stored',
-            'Filenames' : storedSampleFiles
-            }
-
-
-        responseFunc = splineResp
-        propGen = splinePropGen
+        settings = makeStoredSweepSettings(self.dirName)
+        name = settings['Run Name']
         Nx = 64
-        numSamples = 10000
-
-        name = 'Spline'
-        settings = makeRunSettings(name, self.dirName, responseFunc,
-            propGen, numSamples, samplerSettings)
 
         D = arg
 
         if not self.dryRun:
-            nlp, nlc = runSampler(settings, D, Nx)
+            nlp, nlc = runSampler(settings, D, Nx, context=self.context)
             return True
         else:
             logName = '%s/%s-n-%d-D-%f.log' % (self.dirName, name, Nx, D)
@@ -199,12 +415,129 @@ class EmptyAnalyzer(Task.ResultAnalyzer):
         pass
 
 
+# Worker function for the sweep chosen on the command line
+def makeRunnerFunction(cmdArgs, rank, dirName):
+    if cmdArgs.per_d:
+        return RunnerFunction(rank, dirName, dryRun=False)
+    return ChunkRunnerFunction(rank, dirName, 64)
 
-if __name__ == '__main__':
+
+# Worker function for the tasks from makeSweepTasks(). The stored samples,
+# and everything else set up for a task, are kept in the worker's context
+# for the tasks after it.
+class ChunkRunnerFunction(Task.Function):
+
+    def __init__(self, rank, dirName, Nx=64):
+        self.rank = rank
+        self.dirName = dirName
+        self.Nx = Nx
+        self.context = RunContext()
+
+    def run(self, arg):
+
+        D, start, stop = arg
+        settings = makeStoredSweepSettings(self.dirName)
+        self.context.useSettings(settings)
+        filenames = settings['Sampler']['Filenames']
+        params = self.context.get(('Stored Params',),
+                                  lambda: readStoredParams(filenames))
+
+        labels = classifyStoredChunk(settings, params[start:stop], D,
+                                     self.Nx, self.context)
+        return {'D' : D, 'Start' : start, 'Stop' : stop, 'Labels' : labels}
 
 
-    comm = MPI.COMM_WORLD
-    rank = comm.Get_rank()
+# Reduces the results of the chunked tasks for each D into limit point
+# and limit cycle counts and parameter files. Each D's files are written
+# as soon as all its chunks are in; postprocess() writes the matrix of
+# labels for all D.
+class StoredSweepAnalyzer(Task.ResultAnalyzer):
+    def __init__(self, settings, DVals, params, Nx=64):
+        super().__init__()
+        self.settings = settings
+        self.DVals = list(DVals)
+        self.params = params
+        self.Nx = Nx
+        self.column = {D : j for j, D in enumerate(self.DVals)}
+        self.labels = np.zeros((len(params), len(self.DVals)), dtype=bool)
+        self.remaining = [len(params)]*len(self.DVals)
+
+        # Appended to, so that a resumed sweep keeps its earlier log
+        self.logName = '%s/%s-n-%d-sweep.log' % (settings['Output Directory'],
+                                                 settings['Run Name'], Nx)
+        Logger.openLog(self.logName, settings, mode='a')
+        Logger.write('Classifying %d stored samples at %d values of D'
+                     % (len(params), len(self.DVals)))
+
+    def acceptResult(self, result):
+
+        j = self.column[result['D']]
+        start, stop = result['Start'], result['Stop']
+        self.labels[start:stop, j] = result['Labels']
+        self.remaining[j] -= stop - start
+        if self.remaining[j] == 0:
+            self.finishD(j)
+
+    def finishD(self, j):
+        isLP = self.labels[:,j]
+        writeStoredResultsForD(self.settings, self.DVals[j], self.Nx,
+                               self.params[isLP], self.params[~isLP],
+                               self.logName)
+
+    def postprocess(self):
+        unfinished = [D for D, r in zip(self.DVals, self.remaining) if r > 0]
+        if len(unfinished) > 0:
+            Logger.write('Incomplete results for D = %s'
+                         % ' '.join(['%f' % D for D in unfinished]))
+        writeLimitPointLabels(self.settings, self.DVals, self.Nx, self.labels)
+        Logger.closeLog()
+
+
+
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='D sweep over stored samples')
+    parser.add_argument('--single-pass', action='store_true', default=False,
+                        help='classify every D in one pass on rank 0')
+    parser.add_argument('--tasks-per-worker', action='store', type=int,
+                        default=2,
+                        help='tasks to keep queued on each worker')
+    parser.add_argument('--chunk-size', action='store', type=int,
+                        default=250,
+                        help='stored samples per task')
+    parser.add_argument('--per-d', action='store_true', default=False,
+                        help='one task per D, running every stored sample')
+    parser.add_argument('--timeout', action='store', type=float,
+                        default=None,
+                        help='seconds before a worker is taken to be lost')
+    parser.add_argument('--max-retries', action='store', type=int,
+                        default=2,
+                        help='times to retry a task that fails')
+    parser.add_argument('--resume', action='store', default=None,
+                        help='carry on with the sweep in this directory, '
+                        'skipping the tasks it finished')
+    parser.add_argument('--backend', action='store', default='mpi',
+                        choices=('mpi', 'local'),
+                        help='run the tasks on MPI ranks, or on a pool of '
+                        'processes on this machine')
+    parser.add_argument('--num-workers', action='store', type=int,
+                        default=None,
+                        help='processes for the local backend; all the '
+                        'cores if not given')
+    cmdArgs = parser.parse_args()
+
+    # mpi4py is only needed for the MPI backend
+    if cmdArgs.backend=='mpi':
+        from mpi4py import MPI
+        from Boss import *
+        from Worker import *
+        comm = MPI.COMM_WORLD
+        rank = comm.Get_rank()
+    else:
+        comm = None
+        rank = 0
     logLevel = logging.INFO
 
     # Generate a date-based label for the output directory. Since this
@@ -217,18 +550,52 @@ if __name__ == '__main__':
         dateStr = now.strftime('%Y-%d-%b-%f')
         labelStr = 'Sample-%s-%s-%s' % (getuser(), gethostname(), dateStr)
 
-    labelStr = comm.bcast(labelStr, root=0)
+    if comm is not None:
+        labelStr = comm.bcast(labelStr, root=0)
 
     dirName = '../Results/Spline-Runs/D-Sweep/Spline-' + labelStr
+    if cmdArgs.resume is not None:
+        dirName = cmdArgs.resume
     os.makedirs(dirName, exist_ok = True)
 
-    if rank==0:
-        args = [D for D in np.arange(0.03, 0.1001, 0.0025)]
-        analyzer = EmptyAnalyzer()
-        boss = Boss(args, analyzer, comm=comm, logLevel=logLevel)
+    if cmdArgs.single_pass:
+        if rank==0:
+            DVals = np.arange(0.03, 0.1001, 0.0025)
+            settings = makeStoredSweepSettings(dirName)
+            runStoredSamplerForAllD(settings, DVals, 64)
+    elif rank==0:
+        DVals = [D for D in np.arange(0.03, 0.1001, 0.0025)]
+        if cmdArgs.per_d:
+            args = DVals
+            analyzer = EmptyAnalyzer()
+        else:
+            settings = makeStoredSweepSettings(dirName)
+            params = readStoredParams(settings['Sampler']['Filenames'])
+            args = makeSweepTasks(DVals, len(params), cmdArgs.chunk_size)
+            analyzer = StoredSweepAnalyzer(settings, DVals, params, 64)
+        # Finished tasks are recorded in the output directory, so that
+        # --resume can skip them
+        manifest = '%s/%s-tasks.manifest' % (dirName,
+            'per-D' if cmdArgs.per_d else 'chunk-%d' % cmdArgs.chunk_size)
+        if comm is not None:
+            boss = Boss(args, analyzer, comm=comm, logLevel=logLevel,
+                        tasksPerWorker=cmdArgs.tasks_per_worker,
+                        timeout=cmdArgs.timeout,
+                        maxRetries=cmdArgs.max_retries,
+                        manifest=manifest)
+        else:
+            boss = LocalBoss(args, analyzer,
+                             makeRunnerFunction(cmdArgs, 0, dirName),
+                             numWorkers=cmdArgs.num_workers,
+                             logLevel=logLevel,
+                             tasksPerWorker=cmdArgs.tasks_per_worker,
+                             maxRetries=cmdArgs.max_retries,
+                             manifest=manifest)
         boss.loop()
+        for arg, err in boss.failedTasks:
+            logging.error('task {} failed:\n{}'.format(arg, err))
         analyzer.postprocess()
     else:
-        f = RunnerFunction(rank, dirName, dryRun=False)
+        f = makeRunnerFunction(cmdArgs, rank, dirName)
         worker = Worker(f, comm=comm, logLevel=logLevel)
         worker.loop()
@@ -62,7 +62,7 @@ class StepDoublingDriver:
 
 
         # Main loop
-        while (t < tStop and step < maxSteps):
+        while (t < tStop and step < maxSteps and not outMgr.isDone()):
             if verb>=3:
                 print('Step %d from t=%g to %g with h=%g', (step, t, t+dt, dt))
             if (t + dt > tStop):
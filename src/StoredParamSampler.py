@@ -1,25 +1,74 @@
 #!/usr/bin/env python
 
 import numpy as np
+import warnings
 from SettingsHandler import *
 from Logger import *
 from string import *
 
 
 
+# The stored samples in one file, one per row. A file with no samples,
+# such as the header-only one runSampler() writes when no sample ended up
+# in its class, gives an array with no rows.
+def readStoredParamFile(filename):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', UserWarning)
+        params = np.loadtxt(filename, ndmin=2)
+    if params.size == 0:
+        return np.empty((0, 0))
+    return params
+
+
+# All the stored samples in a list of files, one per row, in file order.
+# The row numbers serve as sample indices when the samples are split into
+# chunks. Files with no samples are skipped.
+def readStoredParams(filenames):
+    arrays = [readStoredParamFile(f) for f in filenames]
+    arrays = [a for a in arrays if len(a) > 0]
+    if len(arrays) == 0:
+        return np.empty((0, 0))
+    return np.vstack(arrays)
+
+
+
 class StoredParamSampler:
 
 
 
+    # If blockSize > 1, the stored samples are read in chunks of that
+    # size and each chunk is integrated together through the model
+    # manager's runBlock() method. If storedParams is given, it holds the
+    # samples already read from each file, one array per file, and the
+    # files aren't read again.
     def __init__(self,
                  modelMgr,
                  filenames,
                  sampleHandler,
-                 verb = 1):
+                 verb = 1,
+                 blockSize = 1,
+                 storedParams = None):
         self.modelMgr = modelMgr
         self.filenames = filenames
         self.sampleHandler = sampleHandler
         self.verb = verb
+        self.blockSize = blockSize
+        self.storedParams = storedParams
+
+    # Parameters from the i-th file, one row at a time
+    def readRows(self, i, filename):
+
+        if self.storedParams is not None:
+            yield from self.storedParams[i]
+            return
+
+        with open(filename) as file:
+            for line in file:
+                # skip comments in the file
+                if line[0]=='#': continue
+
+                # get the parameters as strings
+                yield list(map(np.double, line.split()))
 
     def run(self):
 
@@ -27,46 +76,153 @@ class StoredParamSampler:
         samples = 0
         runFailures = 0
         outputInterval = 10;
+        warnOnRunFail = True
+        abortOnRunFail = False
         verb = self.verb
         if verb > 0:
             Logger.write('Starting main sample loop')
 
+        for i, filename in enumerate(self.filenames):
+
+            if verb > 0:
+                Logger.write('Reading parameters from file %s' % filename)
+
+            block = []
+
+            for params in self.readRows(i, filename):
+
+                if self.blockSize > 1:
+                    block.append(params)
+                    if len(block) == self.blockSize:
+                        samples += self.runBlock(block, samples)
+                        block = []
+                    continue
+
+                L = self.modelMgr.likelihood(params)
+
+                # Run the model
+                try:
+                    results = self.modelMgr.run(params)
+                except (RuntimeError, ArithmeticError) as e:
+                    if abortOnRunFail:
+                        raise e
+                    if warnOnRunFail:
+                        Logger.write('StoredParamSampler Warning: run failed with error {}'.format(e))
+                    runFailures += 1
+                    continue
+
+                self.sampleHandler.process(self.modelMgr, params, results)
+
+                if (samples % outputInterval == 0):
+                    Logger.write('sample #%d' % samples)
+                    self.sampleHandler.report()
+
+                samples += 1
+
+            # Run any partial block left at the end of the file
+            if len(block) > 0:
+                samples += self.runBlock(block, samples)
+
+
+            # Done main sampling loop
+            if (verb > 0):
+                Logger.write('Done main sampling loop')
+            self.sampleHandler.postprocess()
+
+    # Integrate a block of stored samples together and hand the results
+    # to the sample handler in file order. Returns the number of samples
+    # processed.
+    def runBlock(self, block, samples):
+
+        results = self.modelMgr.runBlock(np.array(block))
+
+        for params, res in zip(block, results):
+            self.sampleHandler.process(self.modelMgr, params, res)
+
+        Logger.write('samples #%d to #%d' % (samples, samples+len(block)-1))
+        self.sampleHandler.report()
+
+        return len(block)
+
+
+
+# Sampler that reads each stored sample once and classifies it at every
+# dilution rate in DVals. There is one sample handler per D. The samples
+# are processed in blocks through the model manager's runBlockForD(), so
+# the spline solve for each sample is shared across D, and no likelihood
+# is computed. After run(), labels is a (numSamples x numD) boolean
+# matrix that is True where a sample went to a limit point.
+class MultiDStoredSampler:
+
+    def __init__(self,
+                 modelMgr,
+                 filenames,
+                 sampleHandlers,
+                 DVals,
+                 verb = 1,
+                 blockSize = 500):
+        self.modelMgr = modelMgr
+        self.filenames = filenames
+        self.sampleHandlers = sampleHandlers
+        self.DVals = DVals
+        self.verb = verb
+        self.blockSize = blockSize
+        self.labels = np.zeros((0, len(DVals)), dtype=bool)
+
+    def run(self):
+
+        verb = self.verb
+        if verb > 0:
+            Logger.write('Starting main sample loop for %d values of D'
+                         % len(self.DVals))
+
+        labels = []
+        samples = 0
         for filename in self.filenames:
 
             if verb > 0:
                 Logger.write('Reading parameters from file %s' % filename)
 
+            block = []
             with open(filename) as file:
-
                 for line in file:
                     # skip comments in the file
                     if line[0]=='#': continue
 
-                    # get the parameters as strings
-                    params = list(map(np.double, line.split()))
-                    L = self.modelMgr.likelihood(params)
+                    block.append(list(map(np.double, line.split())))
+                    if len(block) == self.blockSize:
+                        labels.append(self.runBlock(block, samples))
+                        samples += len(block)
+                        block = []
+
+            if len(block) > 0:
+                labels.append(self.runBlock(block, samples))
+                samples += len(block)
+
+        if len(labels) > 0:
+            self.labels = np.vstack(labels)
+
+        if (verb > 0):
+            Logger.write('Done main sampling loop')
+        for handler in self.sampleHandlers:
+            handler.postprocess()
 
-                    # Run the model
-                    try:
-                        results = self.modelMgr.run(params)
-                    except (RuntimeError, ArithmeticError) as e:
-                        if abortOnRunFail:
-                            raise e
-                        if warnOnRunFail:
-                            Logger.write('StoredParamSampler Warning: run failed with error {}'.format(e))
-                        runFailures += 1
-                        continue
+        return self.labels
 
-                    self.sampleHandler.process(self.modelMgr, params, results)
+    def runBlock(self, block, samples):
 
-                    if (samples % outputInterval == 0):
-                        Logger.write('sample #%d' % samples)
-                        self.sampleHandler.report()
+        results = self.modelMgr.runBlockForD(np.array(block), self.DVals)
 
-                    samples += 1
+        labels = np.zeros((len(block), len(self.DVals)), dtype=bool)
+        for j, (handler, resultsForD) in enumerate(zip(self.sampleHandlers,
+                                                       results)):
+            for i, (params, res) in enumerate(zip(block, resultsForD)):
+                labels[i,j] = handler.process(self.modelMgr, params, res)
 
+        if self.verb > 0:
+            Logger.write('samples #%d to #%d' % (samples, samples+len(block)-1))
+            for D, handler in zip(self.DVals, self.sampleHandlers):
+                Logger.write('D=%f' % D)
+                handler.report()
 
-                # Done main sampling loop
-                if (verb > 0):
-                    Logger.write('Done main sampling loop')
-                self.sampleHandler.postprocess()
+        return labels
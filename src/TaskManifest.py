@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+
+import os
+import pickle
+
+# Record of the tasks a Boss has finished, so that a restarted job can
+# skip them. Each finished task is appended to the file as a pickled
+# (key, arg, result) record and flushed to disk straight away; the key is
+# repr(arg), so the args need a repr that is the same from run to run.
+# A record cut short by the job dying is cut off the file when it is
+# read, before any more are added.
+
+class TaskManifest:
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.results = {}
+        if os.path.exists(filename):
+            self.read()
+        self.file = open(filename, 'ab')
+
+    def read(self):
+        with open(self.filename, 'r+b') as f:
+            good = 0
+            while True:
+                try:
+                    key, arg, result = pickle.load(f)
+                except (EOFError, pickle.UnpicklingError):
+                    break
+                self.results[key] = result
+                good = f.tell()
+            f.truncate(good)
+
+    def isDone(self, arg):
+        return repr(arg) in self.results
+
+    # Result recorded for a finished task
+    def result(self, arg):
+        return self.results[repr(arg)]
+
+    def record(self, arg, result):
+        key = repr(arg)
+        self.results[key] = result
+        pickle.dump((key, arg, result), self.file,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
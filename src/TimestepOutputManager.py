@@ -14,6 +14,11 @@ class TimestepOutputManager(metaclass=abc.ABCMeta):
     @abc.abstractmethod
     def needToWrite(self, t, dt):
         pass
+
+    # Drivers stop early if this returns True. The default is to run to
+    # the end of the time interval.
+    def isDone(self):
+        return False
         
     
 class StdOutOutputManager(TimestepOutputManager):
@@ -53,7 +58,64 @@ class NPStorageOutputManager(TimestepOutputManager):
         self.writeIndex += 1
         self.tNextWrite += self.writeInterval
 
-     
+    def storedValues(self):
+        return self.uStore
+
+
+# Storage for only the last windowSize output points of a run, in a
+# circular buffer. Output points are on the same grid as
+# NPStorageOutputManager's, but none are asked for before tStart, so
+# the driver does no interpolation during the transient. tStart is moved
+# earlier if needed so that the window is full by the end of the run.
+tailWindowDefaults = {
+    'Window Size' : 100,
+    'Start Time' : None
+    }
+
+class RingBufferOutputManager(TimestepOutputManager):
+    def __init__(self, timeInterval, uInit, nReport, windowSize, tStart=None):
+        TimestepOutputManager.__init__(self)
+        self.nReport = nReport
+        self.tInit = timeInterval[0]
+        self.writeInterval = (timeInterval[1]-timeInterval[0])/nReport
+        self.windowSize = min(windowSize, nReport+1)
+        self.startIndex = 0
+        if tStart is not None:
+            self.startIndex = int(ceil((tStart - self.tInit)/self.writeInterval
+                                       - 1.0e-9))
+            self.startIndex = min(max(self.startIndex, 0),
+                                  nReport+1-self.windowSize)
+        self.writeIndex = 0
+        self.tNextWrite = timeInterval[0]
+        self.uStore = np.zeros((self.windowSize, len(uInit)))
+        self.tVals = np.zeros(self.windowSize)
+
+    def needToWrite(self, t, dt):
+        return self.tNextWrite >= t and self.tNextWrite <= t+dt
+
+    def write(self, t, u):
+        if self.writeIndex >= self.startIndex:
+            slot = self.writeIndex % self.windowSize
+            self.uStore[slot,:] = u
+            self.tVals[slot] = t
+        self.writeIndex += 1
+        if self.writeIndex < self.startIndex:
+            self.writeIndex = self.startIndex
+            self.tNextWrite = self.tInit + self.startIndex*self.writeInterval
+        else:
+            self.tNextWrite += self.writeInterval
+
+    def windowRows(self):
+        k = min(max(self.writeIndex - self.startIndex, 0), self.windowSize)
+        return (self.writeIndex - k + np.arange(k)) % self.windowSize
+
+    # Return the stored points in time order
+    def storedValues(self):
+        return self.uStore[self.windowRows()]
+
+    def storedTimes(self):
+        return self.tVals[self.windowRows()]
+
         
 
 
@@ -61,3 +123,94 @@ class NPStorageOutputManager(TimestepOutputManager):
 
     
     
+
+
+# Storage for an ensemble of M runs advanced together, each with its own
+# time. Members are addressed by an index array, and t, dt and u are the
+# matching arrays for those members. The stored values are in uStore,
+# with shape (M, nReport+1, n).
+class EnsembleStorageOutputManager(TimestepOutputManager):
+    def __init__(self, timeInterval, UInit, nReport):
+        TimestepOutputManager.__init__(self)
+        M, n = np.shape(UInit)
+        self.nReport = nReport
+        self.writeInterval = (timeInterval[1]-timeInterval[0])/nReport
+        self.writeIndex = np.zeros(M, dtype=int)
+        self.tNextWrite = np.full(M, float(timeInterval[0]))
+        self.uStore = np.zeros((M, nReport+1, n))
+        self.tVals = np.zeros((M, nReport+1))
+
+    # Return a boolean mask over the given members telling which have
+    # an output time in [t, t+dt]
+    def needToWrite(self, t, dt, members):
+        tNext = self.tNextWrite[members]
+        return ((tNext >= t) & (tNext <= t+dt)
+                & (self.writeIndex[members] <= self.nReport))
+
+    def write(self, members, t, u):
+        self.uStore[members, self.writeIndex[members], :] = u
+        self.tVals[members, self.writeIndex[members]] = t
+        self.writeIndex[members] += 1
+        self.tNextWrite[members] += self.writeInterval
+
+    # Return a mask telling which of the given members can stop early
+    def isDone(self, members):
+        return np.zeros(len(members), dtype=bool)
+
+    def storedValues(self):
+        return self.uStore
+
+
+
+# Ensemble version of RingBufferOutputManager, keeping the last
+# windowSize output points of each member
+class EnsembleRingBufferOutputManager(TimestepOutputManager):
+    def __init__(self, timeInterval, UInit, nReport, windowSize, tStart=None):
+        TimestepOutputManager.__init__(self)
+        M, n = np.shape(UInit)
+        self.nReport = nReport
+        self.tInit = timeInterval[0]
+        self.writeInterval = (timeInterval[1]-timeInterval[0])/nReport
+        self.windowSize = min(windowSize, nReport+1)
+        self.startIndex = 0
+        if tStart is not None:
+            self.startIndex = int(ceil((tStart - self.tInit)/self.writeInterval
+                                       - 1.0e-9))
+            self.startIndex = min(max(self.startIndex, 0),
+                                  nReport+1-self.windowSize)
+        self.writeIndex = np.zeros(M, dtype=int)
+        self.tNextWrite = np.full(M, float(timeInterval[0]))
+        self.uStore = np.zeros((M, self.windowSize, n))
+        self.tVals = np.zeros((M, self.windowSize))
+
+    def needToWrite(self, t, dt, members):
+        tNext = self.tNextWrite[members]
+        return ((tNext >= t) & (tNext <= t+dt)
+                & (self.writeIndex[members] <= self.nReport))
+
+    def write(self, members, t, u):
+        members = np.asarray(members)
+        index = self.writeIndex[members]
+        keep = index >= self.startIndex
+        slot = index[keep] % self.windowSize
+        self.uStore[members[keep], slot, :] = np.asarray(u)[keep]
+        self.tVals[members[keep], slot] = np.broadcast_to(t, keep.shape)[keep]
+
+        index += 1
+        jump = index < self.startIndex
+        self.writeIndex[members] = np.maximum(index, self.startIndex)
+        self.tNextWrite[members] = np.where(
+            jump, self.tInit + self.startIndex*self.writeInterval,
+            self.tNextWrite[members] + self.writeInterval)
+
+    def isDone(self, members):
+        return np.zeros(len(members), dtype=bool)
+
+    def windowRows(self, m):
+        k = min(max(self.writeIndex[m] - self.startIndex, 0), self.windowSize)
+        return (self.writeIndex[m] - k + np.arange(k)) % self.windowSize
+
+    # Return a list of each member's stored points in time order
+    def storedValues(self):
+        return [self.uStore[m, self.windowRows(m)]
+                for m in range(len(self.writeIndex))]
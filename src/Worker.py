@@ -1,5 +1,7 @@
 from mpi4py import MPI
+from collections import deque
 import logging
+import traceback
 
 
 class Worker:
@@ -10,27 +12,63 @@ class Worker:
         logging.basicConfig(format='[Worker rank={}] %(message)s'
             .format(self.comm.Get_rank()), level=logLevel)
 
+    # The boss may send tasks ahead of the one being worked on. Before
+    # starting each task, the worker takes every message that has arrived
+    # and queues the tasks locally, so the next one is ready as soon as
+    # the current one is done. It only blocks when it has nothing queued.
+    #
+    # Each reply is ('RESULT', taskId, result), or ('ERROR', taskId,
+    # traceback) if the function raised, so one bad task doesn't take
+    # the worker down.
     def loop(self):
 
         rank = self.comm.Get_rank()
 
-        while True:
-            # Wait for incoming message
-            logging.debug('Worker [{}] waiting'.format(rank))
-            request = self.comm.irecv(source=0, tag=1)
-            msg = request.wait()
-
-            if msg[0]=='DONE': # Shutdown notice
-                logging.debug('Worker [{}] shutting down'.format(rank))
-                break
-            elif msg[0]=='TASK': # Task request
-                # Unpack the request
-                arg = msg[1]
-                logging.debug('starting task with arg=[{}]'.format(arg))
-                # Do the work
-                result = self.func.run(arg)
+        taskQ = deque()
+        sends = []
+        done = False
+        request = self.comm.irecv(source=0, tag=1)
+
+        while not done or len(taskQ) > 0:
+
+            # Take in any messages that have arrived, waiting for one if
+            # there's nothing else to do
+            while not done:
+                if len(taskQ) == 0:
+                    logging.debug('Worker [{}] waiting'.format(rank))
+                    msg = request.wait()
+                else:
+                    (hasMsg, msg) = request.test()
+                    if not hasMsg:
+                        break
+                request = None
+
+                if msg[0]=='DONE': # Shutdown notice
+                    logging.debug('Worker [{}] shutting down'.format(rank))
+                    done = True
+                    break
+                elif msg[0]=='TASK': # Task request
+                    taskQ.append(msg[1:])
+                else:
+                    logging.error('Unknown message {}'.format(msg))
+                request = self.comm.irecv(source=0, tag=1)
+
+            if len(taskQ) == 0:
+                continue
+
+            # Unpack the request
+            taskId, arg = taskQ.popleft()
+            logging.debug('starting task with arg=[{}]'.format(arg))
+            # Do the work
+            try:
+                reply = ('RESULT', taskId, self.func.run(arg))
                 logging.debug('finished task')
-                # Send results back to the manager
-                self.comm.isend(result, dest=0, tag=2)
-            else:
-                logging.error('Unknown message {}'.format(msg))
+            except Exception:
+                logging.error('task with arg=[{}] failed'.format(arg))
+                reply = ('ERROR', taskId, traceback.format_exc())
+            # Send results back to the manager, and free the sends that
+            # have completed
+            sends.append(self.comm.isend(reply, dest=0, tag=2))
+            sends = [s for s in sends if not s.Test()]
+
+        MPI.Request.Waitall(sends)